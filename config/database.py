@@ -2,9 +2,26 @@
 # RUTA: backend/config/database.py
 # DESCRIPCIÓN: Configuración de conexión a MongoDB Atlas
 # USO: Importar en otros módulos para acceder a la BD
+#      La app conecta en su lifespan (main.py); los scripts llaman a
+#      connect_mongodb() al empezar
+# ============================================================================
+#
+# Pool de conexiones configurable por entorno (MONGO_MAX_POOL_SIZE, ...).
+# MONGO_MAX_POOL_SIZE debe cubrir DB_ASYNC_WORKERS: cada hilo del executor
+# usa a lo sumo una conexión a la vez. Si el pool se agota, las esperas de
+# checkout suben y, pasado MONGO_WAIT_QUEUE_TIMEOUT_MS, fallan: ambas cosas
+# se ven en obtener_metricas_pool() (/health).
 # ============================================================================
 
 import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pymongo import monitoring
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 import logging
@@ -12,29 +29,208 @@ import logging
 logger = logging.getLogger(__name__)
 
 MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB = os.getenv("MONGO_DB", "fresst_chatbot")
+
+# Hilos dedicados a operaciones bloqueantes (PyMongo) desde código async
+DB_ASYNC_WORKERS = int(os.getenv("DB_ASYNC_WORKERS", "32"))
+
+# Pool de conexiones del MongoClient
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", str(DB_ASYNC_WORKERS + 8)))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "4"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+MONGO_TLS_INSECURE = os.getenv("MONGO_TLS_INSECURE", "true").lower() == "true"
 
 # Variables globales para acceso desde otros módulos
 client = None
 db = None
 collections = {}
+executor = None
+
+# ============================================================================
+# CONTEO DE ROUND TRIPS POR REQUEST
+# ============================================================================
+
+# Contador mutable del request actual ({"round_trips": N}); None fuera de un request
+_conteo_actual = contextvars.ContextVar("conteo_mongo", default=None)
+
+class ContadorComandos(monitoring.CommandListener):
+    """Cuenta cada comando enviado a MongoDB dentro del request en curso"""
+    
+    def started(self, event):
+        conteo = _conteo_actual.get()
+        if conteo is not None:
+            conteo["round_trips"] += 1
+    
+    def succeeded(self, event):
+        pass
+    
+    def failed(self, event):
+        pass
+
+def iniciar_conteo_round_trips():
+    """Empieza a contar los comandos MongoDB del request actual"""
+    conteo = {"round_trips": 0}
+    _conteo_actual.set(conteo)
+    return conteo
+
+def obtener_round_trips():
+    """Comandos MongoDB emitidos desde iniciar_conteo_round_trips()"""
+    conteo = _conteo_actual.get()
+    return conteo["round_trips"] if conteo else 0
+
+# ============================================================================
+# MÉTRICAS DEL POOL DE CONEXIONES
+# ============================================================================
+
+class MetricasPool(monitoring.ConnectionPoolListener):
+    """
+    Conexiones abiertas / en uso y espera de checkout (tiempo desde que un
+    hilo pide una conexión hasta que la obtiene); las esperas recientes dan
+    p50/p95
+    """
+
+    def __init__(self, ventana=1000):
+        self._lock = threading.Lock()
+        self._hilo = threading.local()    # inicio del checkout en curso del hilo
+        self.abiertas = 0
+        self.en_uso = 0
+        self.en_uso_max = 0
+        self.checkouts = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+        self._esperas = deque(maxlen=ventana)
+        self.fallidos = Counter()         # motivo → cantidad (timeout = pool agotado)
+        self.pool_limpiado = 0
+
+    # Los eventos de checkout corren en el hilo que pide la conexión
+    def connection_check_out_started(self, event):
+        self._hilo.inicio = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        espera = time.perf_counter() - getattr(self._hilo, "inicio", time.perf_counter())
+        with self._lock:
+            self.checkouts += 1
+            self.en_uso += 1
+            self.en_uso_max = max(self.en_uso_max, self.en_uso)
+            self.espera_total += espera
+            self.espera_max = max(self.espera_max, espera)
+            self._esperas.append(espera)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.fallidos[str(event.reason)] += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.en_uso -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.abiertas += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.abiertas -= 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_limpiado += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def _percentil(self, valores, p):
+        if not valores:
+            return 0.0
+        return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+    def resumen(self):
+        with self._lock:
+            recientes = sorted(self._esperas)
+            return {
+                "max_pool": MONGO_MAX_POOL_SIZE,
+                "min_pool": MONGO_MIN_POOL_SIZE,
+                "abiertas": self.abiertas,
+                "en_uso": self.en_uso,
+                "en_uso_max": self.en_uso_max,
+                "checkouts": self.checkouts,
+                "checkouts_fallidos": dict(self.fallidos),
+                "pool_limpiado": self.pool_limpiado,
+                "espera_checkout_ms": {
+                    "media": round(1000 * self.espera_total / self.checkouts, 2) if self.checkouts else 0.0,
+                    "p50": round(1000 * self._percentil(recientes, 0.50), 2),
+                    "p95": round(1000 * self._percentil(recientes, 0.95), 2),
+                    "max": round(1000 * self.espera_max, 2)
+                }
+            }
+
+metricas_pool = MetricasPool()
+
+def obtener_metricas_pool():
+    return {
+        "conectado": client is not None,
+        "executor_hilos": DB_ASYNC_WORKERS,
+        **metricas_pool.resumen()
+    }
+
+# ============================================================================
+# CONEXIÓN
+# ============================================================================
+
+_lock_conexion = threading.Lock()
+
+def crear_cliente():
+    """MongoClient con el pool configurado por entorno (no verifica la conexión)"""
+    if not MONGO_URI:
+        raise ValueError("MONGO_URI no está configurado en .env")
+
+    # ServerApi como en el ejemplo de la plataforma
+    return MongoClient(
+        MONGO_URI,
+        server_api=ServerApi('1'),
+        tlsInsecure=MONGO_TLS_INSECURE,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        event_listeners=[ContadorComandos(), metricas_pool]
+    )
 
 def connect_mongodb():
     """Conecta a MongoDB Atlas"""
     global client, db, collections
     
+    nuevo = None
     try:
-        if not MONGO_URI:
-            raise ValueError("MONGO_URI no está configurado en .env")
-        
-        # Conectar con ServerApi como en el ejemplo de la plataforma
-        client = MongoClient(MONGO_URI, server_api=ServerApi('1'), tlsInsecure=True)
+        nuevo = crear_cliente()
         
         # Verificar conexión
-        client.admin.command('ping')
+        nuevo.admin.command('ping')
         logger.info("✅ Pinged your deployment. You successfully connected to MongoDB!")
+        logger.info(
+            "🔌 Pool MongoDB: %s-%s conexiones, espera máx. %s ms",
+            MONGO_MIN_POOL_SIZE, MONGO_MAX_POOL_SIZE, MONGO_WAIT_QUEUE_TIMEOUT_MS
+        )
         
         # Seleccionar base de datos
-        db = client["fresst_chatbot"]
+        client = nuevo
+        db = client[MONGO_DB]
         
         # Inicializar referencias a colecciones
         collections = {
@@ -45,31 +241,124 @@ def connect_mongodb():
             'conversaciones_whatsapp': db["conversaciones_whatsapp"]
         }
         
-        logger.info("✅ Conectado a base de datos: fresst_chatbot")
+        logger.info("✅ Conectado a base de datos: %s", MONGO_DB)
         return db
         
     except Exception as e:
-        logger.error(f"❌ Error conectando a MongoDB: {e}")
+        logger.error("❌ Error conectando a MongoDB: %s", e)
+        if nuevo is not None and nuevo is not client:
+            nuevo.close()
         raise
 
+def _asegurar_conexion():
+    """
+    Conecta si todavía no hay cliente (scripts, o la app arrancó sin BD).
+    Con lock: dos hilos a la vez no crean dos MongoClient.
+    """
+    if db is not None:
+        return
+    with _lock_conexion:
+        if db is None:
+            logger.warning("⚠️ MongoDB sin conectar: conectando bajo demanda")
+            connect_mongodb()
+
+def get_client():
+    """Obtiene el MongoClient (sesiones y transacciones)"""
+    _asegurar_conexion()
+    return client
+
 def get_db():
     """Obtiene la instancia de base de datos"""
-    if db is None:
-        connect_mongodb()
+    _asegurar_conexion()
     return db
 
 def get_collection(collection_name):
     """Obtiene una colección específica"""
-    global db
-    if db is None:
-        connect_mongodb()
+    _asegurar_conexion()
     if collection_name not in collections:
         collections[collection_name] = db[collection_name]
     return collections[collection_name]
 
 def close_mongodb():
     """Cierra la conexión a MongoDB"""
-    global client
+    global client, db, collections, executor
     if client:
         client.close()
-        logger.info("✅ Conexión a MongoDB cerrada")
\ No newline at end of file
+        client, db, collections = None, None, {}
+        logger.info("✅ Conexión a MongoDB cerrada")
+    if executor:
+        executor.shutdown(wait=False)
+        executor = None
+
+# ============================================================================
+# CAPA ASYNC: POOL ACOTADO DE HILOS PARA PYMONGO
+# ============================================================================
+
+def get_executor():
+    """Obtiene el pool de hilos compartido para operaciones bloqueantes"""
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=DB_ASYNC_WORKERS,
+            thread_name_prefix="mongo"
+        )
+    return executor
+
+async def ejecutar_en_pool(func, *args, **kwargs):
+    """Ejecuta una función bloqueante en el pool sin detener el event loop"""
+    loop = asyncio.get_running_loop()
+    # Propagar el contexto (conteo de round trips, etc.) al hilo
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), partial(ctx.run, func, *args, **kwargs))
+
+class ColeccionAsync:
+    """
+    Adaptador async sobre una colección PyMongo.
+    
+    Cada operación se ejecuta en el pool acotado; los métodos que devuelven
+    cursores (find, aggregate) se materializan a lista dentro del hilo.
+    """
+    
+    def __init__(self, coleccion):
+        self.coleccion = coleccion
+    
+    async def find(self, *args, limite=None, **kwargs):
+        def _consultar():
+            cursor = self.coleccion.find(*args, **kwargs)
+            if limite:
+                cursor = cursor.limit(limite)
+            return list(cursor)
+        return await ejecutar_en_pool(_consultar)
+    
+    async def aggregate(self, pipeline, **kwargs):
+        return await ejecutar_en_pool(lambda: list(self.coleccion.aggregate(pipeline, **kwargs)))
+    
+    def __getattr__(self, nombre):
+        metodo = getattr(self.coleccion, nombre)
+        if not callable(metodo):
+            return metodo
+        
+        async def _metodo_async(*args, **kwargs):
+            return await ejecutar_en_pool(metodo, *args, **kwargs)
+        
+        return _metodo_async
+
+async def calentar_pool(conexiones=None):
+    """
+    Abre `conexiones` conexiones (por defecto MONGO_MIN_POOL_SIZE) y los
+    hilos del executor con pings concurrentes: los primeros requests no
+    pagan el handshake TLS
+    """
+    conexiones = conexiones or MONGO_MIN_POOL_SIZE
+    inicio = time.perf_counter()
+    await asyncio.gather(*(
+        ejecutar_en_pool(get_client().admin.command, "ping") for _ in range(conexiones)
+    ))
+    logger.info(
+        "🔥 Pool MongoDB caliente: %s conexiones en %.0f ms",
+        metricas_pool.abiertas, 1000 * (time.perf_counter() - inicio)
+    )
+
+def get_async_collection(collection_name):
+    """Obtiene una colección con interfaz async (find_one, update_one, ...)"""
+    return ColeccionAsync(get_collection(collection_name))
\ No newline at end of file
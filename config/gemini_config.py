@@ -1,17 +1,64 @@
 # ============================================================================
 # RUTA: backend/config/gemini_config.py
-# DESCRIPCIÓN: Configuración de Google Gemini API
+# DESCRIPCIÓN: Configuración y cliente de Google Gemini API
 # USO: Para generar respuestas inteligentes del bot
 # ============================================================================
+#
+# - Modelo y GenerationConfig se construyen UNA vez por configuración
+#   (GEMINI_MODELO, GEMINI_TEMPERATURA, GEMINI_MAX_TOKENS) y se reutilizan.
+# - Los modelos comparten el cliente por defecto de la librería: un solo
+#   canal gRPC (HTTP/2) que queda abierto entre llamadas (keep-alive), sin
+#   handshake TLS por mensaje.
+# - GEMINI_CONCURRENCIA limita las llamadas en vuelo (semáforo); el resto
+#   espera su turno en lugar de disparar 429 de cuota.
+# - Métricas por llamada: latencia, tokens y errores por clase
+#   (obtener_metricas_gemini()).
+# - GEMINI_STREAMING: stream_gemini_response_async() entrega el texto por
+#   fragmentos a medida que Gemini lo genera (stream=True).
+# - Resiliencia: plazo por llamada (GEMINI_TIMEOUT_SEGUNDOS), reintentos
+#   solo para errores transitorios (timeout, 5xx, cuota) con backoff
+#   exponencial + jitter, circuit breaker por modelo y modelo de respaldo
+#   opcional (GEMINI_MODELO_RESPALDO). Todo el plan de intentos (esperas
+#   incluidas) cabe en GEMINI_PLAZO_TOTAL_SEGUNDOS, por debajo de los 15s
+#   que Twilio espera al webhook. Con el circuito abierto se responde
+#   al instante con el mensaje de respaldo en vez de colgar el webhook.
+# ============================================================================
 
 import os
-import google.generativeai as genai
+import time
+import math
+import random
+import asyncio
+import hashlib
+import inspect
 import logging
+import threading
+from collections import Counter, deque
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 
 logger = logging.getLogger(__name__)
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+GEMINI_MODELO = os.getenv("GEMINI_MODELO", "gemini-2.5-flash")
+GEMINI_TEMPERATURA = float(os.getenv("GEMINI_TEMPERATURA", "0.7"))
+GEMINI_MAX_TOKENS = int(os.getenv("GEMINI_MAX_TOKENS", "1024"))
+GEMINI_CONCURRENCIA = int(os.getenv("GEMINI_CONCURRENCIA", "8"))
+# Hilos del plazo síncrono: en vuelo + llamadas colgadas que siguen ocupando hilo
+GEMINI_HILOS_SYNC = int(os.getenv("GEMINI_HILOS_SYNC", str(GEMINI_CONCURRENCIA * 4)))
+GEMINI_STREAMING = os.getenv("GEMINI_STREAMING", "false").lower() == "true"
+GEMINI_MODELO_RESPALDO = os.getenv("GEMINI_MODELO_RESPALDO", "")  # p. ej. gemini-2.0-flash-lite
+GEMINI_TIMEOUT_SEGUNDOS = float(os.getenv("GEMINI_TIMEOUT_SEGUNDOS", "10"))
+GEMINI_PLAZO_TOTAL_SEGUNDOS = float(os.getenv("GEMINI_PLAZO_TOTAL_SEGUNDOS", "12"))
+GEMINI_REINTENTOS = int(os.getenv("GEMINI_REINTENTOS", "2"))
+GEMINI_BACKOFF_SEGUNDOS = float(os.getenv("GEMINI_BACKOFF_SEGUNDOS", "0.5"))
+GEMINI_CIRCUITO_FALLOS = int(os.getenv("GEMINI_CIRCUITO_FALLOS", "5"))
+GEMINI_CIRCUITO_ENFRIAMIENTO_SEGUNDOS = float(os.getenv("GEMINI_CIRCUITO_ENFRIAMIENTO_SEGUNDOS", "30"))
+PROMPT_CARACTERES_POR_TOKEN = float(os.getenv("PROMPT_CARACTERES_POR_TOKEN", "3.5"))
+
 # Configurar Gemini
 if GOOGLE_API_KEY:
     genai.configure(api_key=GOOGLE_API_KEY)
@@ -19,31 +66,646 @@ if GOOGLE_API_KEY:
 else:
     logger.warning("⚠️ GOOGLE_API_KEY no está configurado")
 
-def get_gemini_response(prompt: str) -> str:
+def estimar_tokens(texto):
+    """Estimación local de tokens (sin llamar a la API)"""
+    if not texto:
+        return 0
+    return math.ceil(len(texto) / PROMPT_CARACTERES_POR_TOKEN)
+
+# ============================================================================
+# MÉTRICAS
+# ============================================================================
+
+class MetricasGemini:
+    """Contadores del proceso; las latencias recientes dan p50/p95"""
+
+    def __init__(self, ventana=500):
+        self._lock = threading.Lock()
+        self.llamadas = 0
+        self.errores = Counter()          # clase de error → cantidad
+        self.tokens = Counter()           # prompt / respuesta
+        self.tokens_estimados = True      # 0.3.0 no devuelve usage_metadata
+        self.latencia_total = 0.0
+        self.latencia_max = 0.0
+        self._latencias = deque(maxlen=ventana)
+        self.en_vuelo = 0
+        self.eventos = Counter()          # reintentos, respaldo, cortocircuitos
+
+    def entrar(self):
+        with self._lock:
+            self.en_vuelo += 1
+
+    def salir(self):
+        with self._lock:
+            self.en_vuelo -= 1
+
+    def contar(self, evento):
+        with self._lock:
+            self.eventos[evento] += 1
+
+    def registrar(self, segundos, tokens_prompt, tokens_respuesta, error=None, estimados=True):
+        with self._lock:
+            self.llamadas += 1
+            self.latencia_total += segundos
+            self.latencia_max = max(self.latencia_max, segundos)
+            self._latencias.append(segundos)
+            self.tokens["prompt"] += tokens_prompt
+            self.tokens["respuesta"] += tokens_respuesta
+            self.tokens_estimados = estimados
+            if error:
+                self.errores[error] += 1
+
+    def _percentil(self, valores, p):
+        if not valores:
+            return 0.0
+        return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+    def resumen(self):
+        with self._lock:
+            recientes = sorted(self._latencias)
+            return {
+                "modelo": GEMINI_MODELO,
+                "llamadas": self.llamadas,
+                "en_vuelo": self.en_vuelo,
+                "concurrencia_max": GEMINI_CONCURRENCIA,
+                "hilos_sync_ocupados": _hilos_ocupados,
+                "errores": dict(self.errores),
+                "eventos": dict(self.eventos),
+                "tokens": dict(self.tokens),
+                "tokens_estimados": self.tokens_estimados,
+                "latencia_ms": {
+                    "media": round(1000 * self.latencia_total / self.llamadas, 1) if self.llamadas else 0.0,
+                    "p50": round(1000 * self._percentil(recientes, 0.50), 1),
+                    "p95": round(1000 * self._percentil(recientes, 0.95), 1),
+                    "max": round(1000 * self.latencia_max, 1)
+                }
+            }
+
+metricas = MetricasGemini()
+
+def obtener_metricas_gemini():
+    return {
+        **metricas.resumen(),
+        "circuitos": {nombre: circuito.estado_actual() for nombre, circuito in _circuitos.items()}
+    }
+
+class PlazoAgotado(TimeoutError):
+    """Se acabó GEMINI_PLAZO_TOTAL_SEGUNDOS: no dice nada de la salud de Gemini"""
+
+# Errores transitorios: vale la pena reintentar y cuentan para el circuito
+ERRORES_TRANSITORIOS = {"cuota", "timeout", "servidor"}
+
+def clasificar_error(e: Exception) -> str:
+    """Clase de error para reintentos, circuito, métricas y mensajes de respaldo"""
+    if isinstance(e, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+        return "cuota"
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError, FuturoTimeout,
+                      google_exceptions.DeadlineExceeded, google_exceptions.GatewayTimeout)):
+        return "timeout"
+    if isinstance(e, (google_exceptions.ServiceUnavailable, google_exceptions.InternalServerError,
+                      google_exceptions.BadGateway)):
+        return "servidor"
+    if isinstance(e, (genai.types.BlockedPromptException, genai.types.StopCandidateException)):
+        return "bloqueado"
+
+    # Errores que llegan sin tipo (p. ej. envueltos por la librería)
+    mensaje = str(e).lower()
+    if "resource exhausted" in mensaje or "quota" in mensaje or "429" in mensaje:
+        return "cuota"
+    if "deadline" in mensaje or "timeout" in mensaje:
+        return "timeout"
+    if "503" in mensaje or "unavailable" in mensaje or "500" in mensaje:
+        return "servidor"
+    if "block" in mensaje or "safety" in mensaje or "finish_reason" in mensaje:
+        return "bloqueado"
+    return "otro"
+
+# ============================================================================
+# CIRCUIT BREAKER
+# ============================================================================
+
+class CircuitoGemini:
+    """
+    cerrado → (GEMINI_CIRCUITO_FALLOS fallos transitorios seguidos) → abierto
+    abierto → (pasa el enfriamiento) → semiabierto: deja pasar UNA llamada
+    semiabierto → éxito: cerrado | fallo: abierto otra vez
+
+    Quien recibe la llamada de prueba la libera siempre (cancelar_prueba en
+    un finally): una prueba cancelada (CancelledError, GeneratorExit) no
+    llega a exito()/fallo(). Además, una prueba que lleva más del
+    enfriamiento sin resolverse se da por perdida.
+    """
+
+    def __init__(self, nombre, fallos_max=GEMINI_CIRCUITO_FALLOS, enfriamiento=GEMINI_CIRCUITO_ENFRIAMIENTO_SEGUNDOS):
+        self.nombre = nombre
+        self.fallos_max = fallos_max
+        self.enfriamiento = enfriamiento
+        self.estado = "cerrado"
+        self.fallos_seguidos = 0
+        self.aperturas = 0
+        self.abierto_desde = None
+        self._prueba_en_curso = False
+        self._prueba_desde = None
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        with self._lock:
+            if self.estado == "cerrado":
+                return True
+            if self.estado == "abierto" and time.monotonic() - self.abierto_desde >= self.enfriamiento:
+                self.estado = "semiabierto"
+                self._prueba_en_curso = False
+            if (self.estado == "semiabierto" and self._prueba_en_curso
+                    and time.monotonic() - self._prueba_desde >= self.enfriamiento):
+                logger.warning("[GEMINI] ⚠️  Circuito %s: prueba sin resolver, se descarta", self.nombre)
+                self._prueba_en_curso = False
+            if self.estado == "semiabierto" and not self._prueba_en_curso:
+                self._prueba_en_curso = True
+                self._prueba_desde = time.monotonic()
+                logger.info("[GEMINI] 🔌 Circuito %s semiabierto: llamada de prueba", self.nombre)
+                return True
+            return False
+
+    def cancelar_prueba(self):
+        """Libera la llamada de prueba si terminó sin exito()/fallo() (no-op si no)"""
+        with self._lock:
+            if self.estado == "semiabierto" and self._prueba_en_curso:
+                self._prueba_en_curso = False
+
+    def exito(self):
+        with self._lock:
+            if self.estado != "cerrado":
+                logger.info("[GEMINI] ✅ Circuito %s cerrado", self.nombre)
+            self.estado = "cerrado"
+            self.fallos_seguidos = 0
+            self._prueba_en_curso = False
+
+    def fallo(self, clase):
+        with self._lock:
+            if clase not in ERRORES_TRANSITORIOS:
+                # Un prompt bloqueado no dice nada de la salud de la API
+                self._prueba_en_curso = False
+                return
+            self.fallos_seguidos += 1
+            if self.estado == "semiabierto" or self.fallos_seguidos >= self.fallos_max:
+                if self.estado != "abierto":
+                    self.aperturas += 1
+                    logger.warning(
+                        "[GEMINI] ⛔ Circuito %s abierto (%s fallos, último: %s); reintento en %.0fs",
+                        self.nombre, self.fallos_seguidos, clase, self.enfriamiento
+                    )
+                self.estado = "abierto"
+                self.abierto_desde = time.monotonic()
+                self._prueba_en_curso = False
+
+    def estado_actual(self):
+        with self._lock:
+            estado = {
+                "estado": self.estado,
+                "fallos_seguidos": self.fallos_seguidos,
+                "aperturas": self.aperturas
+            }
+            if self.estado == "abierto":
+                restante = self.enfriamiento - (time.monotonic() - self.abierto_desde)
+                estado["reintento_en_segundos"] = round(max(0.0, restante), 1)
+            return estado
+
+_circuitos = {}
+
+def _circuito(nombre):
+    circuito = _circuitos.get(nombre)
+    if circuito is None:
+        circuito = _circuitos.setdefault(nombre, CircuitoGemini(nombre))
+    return circuito
+
+# ============================================================================
+# MODELOS (uno por configuración)
+# ============================================================================
+# google-generativeai 0.3.0 no tiene system_instruction ni genai.caching: en
+# ese caso el prefijo se antepone al turno (mismo texto que antes). Con una
+# versión que los soporte, el modelo se construye una vez por prefijo.
+
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "true").lower() == "true"
+GEMINI_CONTEXT_CACHE_TTL_MIN = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_MIN", "60"))
+
+SOPORTA_SYSTEM_INSTRUCTION = "system_instruction" in inspect.signature(genai.GenerativeModel.__init__).parameters
+SOPORTA_CONTEXT_CACHE = hasattr(genai, "caching") and hasattr(genai.GenerativeModel, "from_cached_content")
+
+_GENERATION_CONFIG = genai.types.GenerationConfig(
+    temperature=GEMINI_TEMPERATURA,
+    max_output_tokens=GEMINI_MAX_TOKENS,
+)
+
+_modelos = {}  # (modelo, hash del prefijo o None) → GenerativeModel
+_lock_modelos = threading.Lock()
+
+def _construir_modelo(nombre, sistema):
+    if sistema is None:
+        return genai.GenerativeModel(nombre, generation_config=_GENERATION_CONFIG)
+
+    if SOPORTA_CONTEXT_CACHE and GEMINI_CONTEXT_CACHE:
+        try:
+            cache = genai.caching.CachedContent.create(
+                model=f"models/{nombre}",
+                system_instruction=sistema,
+                ttl=timedelta(minutes=GEMINI_CONTEXT_CACHE_TTL_MIN)
+            )
+            modelo = genai.GenerativeModel.from_cached_content(
+                cached_content=cache, generation_config=_GENERATION_CONFIG
+            )
+            logger.info("✅ Prefijo del prompt en contexto cacheado de Gemini")
+            return modelo
+        except Exception as e:
+            # p. ej. prefijo por debajo del mínimo de tokens cacheables
+            logger.warning("⚠️ Context caching no disponible: %s", e)
+
+    return genai.GenerativeModel(nombre, system_instruction=sistema, generation_config=_GENERATION_CONFIG)
+
+def obtener_modelo(sistema=None, nombre=None):
+    """Modelo reutilizable para (nombre, prefijo)"""
+    nombre = nombre or GEMINI_MODELO
+    clave = (nombre, hashlib.sha1(sistema.encode("utf-8")).hexdigest() if sistema else None)
+    modelo = _modelos.get(clave)
+    if modelo is None:
+        with _lock_modelos:
+            modelo = _modelos.get(clave)
+            if modelo is None:
+                if clave[1] is not None:
+                    # Un prefijo por versión del catálogo: descartar los viejos
+                    for vieja in [c for c in _modelos if c[0] == nombre and c[1] is not None]:
+                        del _modelos[vieja]
+                modelo = _construir_modelo(nombre, sistema)
+                _modelos[clave] = modelo
+    return modelo
+
+def _preparar(prompt, sistema, nombre=None):
+    """(modelo, contenido) según lo que soporte la librería instalada"""
+    if sistema and SOPORTA_SYSTEM_INSTRUCTION:
+        return obtener_modelo(sistema, nombre), prompt
+    if sistema:
+        prompt = f"{sistema}\n{prompt}"
+    return obtener_modelo(None, nombre), prompt
+
+def _tokens_respuesta(response, contenido, texto=None):
+    """(prompt, respuesta, estimados) desde usage_metadata si la librería lo trae"""
+    uso = getattr(response, "usage_metadata", None)
+    if uso is not None:
+        return uso.prompt_token_count, uso.candidates_token_count, False
+    return estimar_tokens(contenido), estimar_tokens(response.text if texto is None else texto), True
+
+# ============================================================================
+# LLAMADAS
+# ============================================================================
+
+SOPORTA_REQUEST_OPTIONS = "request_options" in inspect.signature(genai.GenerativeModel.generate_content).parameters
+
+_semaforo_sync = threading.BoundedSemaphore(GEMINI_CONCURRENCIA)
+_semaforo_async = None
+# Sin request_options (0.3.0) el plazo del camino síncrono se aplica
+# esperando en un hilo aparte; el hilo termina solo cuando gRPC responde.
+# Una llamada abandonada por timeout libera el semáforo pero conserva su
+# hilo: el pool tiene margen (GEMINI_HILOS_SYNC) por encima de la
+# concurrencia, y sin hilos libres se falla al instante en vez de encolar
+# la llamada detrás de las colgadas
+_executor_timeout = ThreadPoolExecutor(max_workers=GEMINI_HILOS_SYNC, thread_name_prefix="gemini")
+_hilos_ocupados = 0
+_lock_hilos = threading.Lock()
+
+def _semaforo():
+    # Se crea dentro del event loop que lo usa
+    global _semaforo_async
+    if _semaforo_async is None:
+        _semaforo_async = asyncio.Semaphore(GEMINI_CONCURRENCIA)
+    return _semaforo_async
+
+RESPUESTA_NO_DISPONIBLE = "Lo siento, el servicio no está disponible en este momento. Intenta más tarde."
+RESPUESTA_ERROR = "Lo siento, hubo un error procesando tu pregunta. Intenta de nuevo."
+
+def es_respuesta_de_respaldo(texto: str) -> bool:
+    """True si el texto es un mensaje de error, no una respuesta de Gemini"""
+    return texto in (RESPUESTA_NO_DISPONIBLE, RESPUESTA_ERROR)
+
+def _respuesta_error(e: Exception) -> str:
+    """Registra el error de Gemini y devuelve el mensaje de respaldo"""
+    if e is None:
+        # Circuito abierto: no se llegó a llamar
+        return RESPUESTA_NO_DISPONIBLE
+
+    # Caída, saturación o falta de crédito: "no disponible"
+    clase = clasificar_error(e)
+    logger.error("[GEMINI] ❌ Error en Gemini API (%s): %s", clase, e, extra={"clase_error": clase})
+    if clase in ERRORES_TRANSITORIOS:
+        if clase == "cuota":
+            logger.warning("[GEMINI] ⚠️  Posible falta de crédito o cuota excedida")
+        return RESPUESTA_NO_DISPONIBLE
+
+    return RESPUESTA_ERROR
+
+def calcular_espera(intento):
+    """Backoff exponencial con jitter completo: [0, base * 2^intento]"""
+    return random.uniform(0, GEMINI_BACKOFF_SEGUNDOS * (2 ** intento))
+
+def _modelos_a_intentar():
+    if GEMINI_MODELO_RESPALDO and GEMINI_MODELO_RESPALDO != GEMINI_MODELO:
+        return (GEMINI_MODELO, GEMINI_MODELO_RESPALDO)
+    return (GEMINI_MODELO,)
+
+def _plan_de_intentos():
+    """(modelo, intento) en orden: reintentos del principal, luego el respaldo"""
+    for nombre in _modelos_a_intentar():
+        reintentos = GEMINI_REINTENTOS if nombre == GEMINI_MODELO else 0
+        for intento in range(reintentos + 1):
+            yield nombre, intento
+
+def _liberar_hilo(_futuro):
+    global _hilos_ocupados
+    with _lock_hilos:
+        _hilos_ocupados -= 1
+
+def _plazo_llamada(limite):
+    """Timeout de un intento: GEMINI_TIMEOUT_SEGUNDOS recortado a lo que queda del plazo total"""
+    restante = limite - time.monotonic()
+    if restante <= 0:
+        raise PlazoAgotado("Plazo total de Gemini agotado")
+    return min(GEMINI_TIMEOUT_SEGUNDOS, restante)
+
+def _generar_sync(model, contenido, plazo):
+    global _hilos_ocupados
+    if SOPORTA_REQUEST_OPTIONS:
+        return model.generate_content(contenido, request_options={"timeout": plazo})
+
+    with _lock_hilos:
+        if _hilos_ocupados >= GEMINI_HILOS_SYNC:
+            # Todos los hilos esperan a Gemini (llamadas colgadas): timeout inmediato
+            raise FuturoTimeout(f"Sin hilos libres para Gemini ({_hilos_ocupados} ocupados)")
+        _hilos_ocupados += 1
+    futuro = _executor_timeout.submit(model.generate_content, contenido)
+    futuro.add_done_callback(_liberar_hilo)
+    return futuro.result(timeout=plazo)
+
+def _llamar_sync(nombre, prompt, sistema, limite):
+    model, contenido = _preparar(prompt, sistema, nombre)
+    if not _semaforo_sync.acquire(timeout=max(0.0, limite - time.monotonic())):
+        raise PlazoAgotado("Plazo total agotado esperando turno para Gemini")
+    try:
+        metricas.entrar()
+        inicio = time.perf_counter()
+        plazo = _plazo_llamada(limite)
+        try:
+            response = _generar_sync(model, contenido, plazo)
+            texto = response.text
+            tokens_prompt, tokens_salida, estimados = _tokens_respuesta(response, contenido)
+            metricas.registrar(time.perf_counter() - inicio, tokens_prompt, tokens_salida, estimados=estimados)
+            return texto
+        except Exception as e:
+            metricas.registrar(time.perf_counter() - inicio, estimar_tokens(contenido), 0, clasificar_error(e))
+            if plazo < GEMINI_TIMEOUT_SEGUNDOS and clasificar_error(e) == "timeout":
+                # Lo cortó el plazo total, no la API
+                raise PlazoAgotado("Plazo total de Gemini agotado") from e
+            raise
+        finally:
+            metricas.salir()
+    finally:
+        _semaforo_sync.release()
+
+async def _llamar_async(nombre, prompt, sistema, limite):
+    model, contenido = _preparar(prompt, sistema, nombre)
+
+    async def _con_turno():
+        async with _semaforo():
+            metricas.entrar()
+            inicio = time.perf_counter()
+            plazo = _plazo_llamada(limite)
+            try:
+                response = await asyncio.wait_for(model.generate_content_async(contenido), plazo)
+                texto = response.text
+                tokens_prompt, tokens_salida, estimados = _tokens_respuesta(response, contenido)
+                metricas.registrar(time.perf_counter() - inicio, tokens_prompt, tokens_salida, estimados=estimados)
+                return texto
+            except Exception as e:
+                metricas.registrar(time.perf_counter() - inicio, estimar_tokens(contenido), 0, clasificar_error(e))
+                if plazo < GEMINI_TIMEOUT_SEGUNDOS and clasificar_error(e) == "timeout":
+                    # Lo cortó el plazo total, no la API
+                    raise PlazoAgotado("Plazo total de Gemini agotado") from e
+                raise
+            finally:
+                metricas.salir()
+
+    # El plazo total cubre también la espera del semáforo
+    try:
+        return await asyncio.wait_for(_con_turno(), max(0.0, limite - time.monotonic()))
+    except asyncio.TimeoutError as e:
+        if isinstance(e, PlazoAgotado) or time.monotonic() < limite:
+            # Timeout de la propia llamada (GEMINI_TIMEOUT_SEGUNDOS)
+            raise
+        raise PlazoAgotado("Plazo total de Gemini agotado (esperando turno o respuesta)") from e
+
+class _Intentos:
+    """Estado compartido por las versiones sync y async del bucle de reintentos"""
+
+    def __init__(self, plazo=None):
+        self.ultimo_error = None
+        self._descartados = set()
+        self.limite = time.monotonic() + (GEMINI_PLAZO_TOTAL_SEGUNDOS if plazo is None else plazo)
+
+    def queda_plazo(self, espera=0.0):
+        """False (y se registra) si el plan ya no cabe en el plazo total"""
+        if time.monotonic() + espera < self.limite:
+            return True
+        self.plazo_agotado()
+        return False
+
+    def plazo_agotado(self):
+        metricas.contar("plazo_agotado")
+        logger.warning("[GEMINI] ⏱️  Plazo total de %ss agotado", GEMINI_PLAZO_TOTAL_SEGUNDOS)
+        if self.ultimo_error is None:
+            self.ultimo_error = PlazoAgotado("Plazo total de Gemini agotado")
+
+    def puede_llamar(self, nombre, intento):
+        if nombre in self._descartados:
+            return False
+        if not _circuito(nombre).permitir():
+            # Circuito abierto: ni este intento ni los siguientes de este modelo
+            self._descartados.add(nombre)
+            metricas.contar("cortocircuitos")
+            return False
+        if nombre != GEMINI_MODELO:
+            metricas.contar("modelo_respaldo")
+            logger.warning("[GEMINI] 🔁 Usando modelo de respaldo %s", nombre)
+        elif intento:
+            metricas.contar("reintentos")
+        return True
+
+    def exito(self, nombre):
+        _circuito(nombre).exito()
+
+    def liberar(self, nombre):
+        _circuito(nombre).cancelar_prueba()
+
+    def fallo(self, nombre, intento, e):
+        """Espera antes del siguiente intento, o None si no hay que reintentar"""
+        self.ultimo_error = e
+        if isinstance(e, PlazoAgotado):
+            # Corte nuestro: no cuenta para el circuito
+            self.plazo_agotado()
+            return None
+        clase = clasificar_error(e)
+        _circuito(nombre).fallo(clase)
+        logger.warning("[GEMINI] ⚠️  %s intento %s falló (%s): %s", nombre, intento + 1, clase, e)
+        if clase not in ERRORES_TRANSITORIOS:
+            return None
+        return calcular_espera(intento)
+
+def get_gemini_response(prompt: str, sistema: str = None) -> str:
     """
     Obtiene respuesta de Gemini API
+
+    Args:
+        prompt: contenido del turno
+        sistema: prefijo estable (instrucciones, catálogo), opcional
+    """
+    intentos = _Intentos()
+    for nombre, intento in _plan_de_intentos():
+        if not intentos.queda_plazo():
+            break
+        if not intentos.puede_llamar(nombre, intento):
+            continue
+        try:
+            texto = _llamar_sync(nombre, prompt, sistema, intentos.limite)
+            intentos.exito(nombre)
+            return texto
+        except Exception as e:
+            espera = intentos.fallo(nombre, intento, e)
+        finally:
+            intentos.liberar(nombre)
+        if espera is None or not intentos.queda_plazo(espera):
+            break
+        time.sleep(espera)
+    return _respuesta_error(intentos.ultimo_error)
+
+async def get_gemini_response_async(prompt: str, sistema: str = None, plazo: float = None) -> str:
     """
+    Obtiene respuesta de Gemini API sin bloquear el event loop
+
+    Args:
+        plazo: segundos para todo el plan de intentos (por defecto
+               GEMINI_PLAZO_TOTAL_SEGUNDOS)
+    """
+    intentos = _Intentos(plazo)
+    for nombre, intento in _plan_de_intentos():
+        if not intentos.queda_plazo():
+            break
+        if not intentos.puede_llamar(nombre, intento):
+            continue
+        try:
+            texto = await _llamar_async(nombre, prompt, sistema, intentos.limite)
+            intentos.exito(nombre)
+            return texto
+        except Exception as e:
+            espera = intentos.fallo(nombre, intento, e)
+        finally:
+            # Cancelación incluida: no dejar el circuito con la prueba tomada
+            intentos.liberar(nombre)
+        if espera is None or not intentos.queda_plazo(espera):
+            break
+        await asyncio.sleep(espera)
+    return _respuesta_error(intentos.ultimo_error)
+
+async def _producir_stream(model, contenido, limite, circuito, cola):
+    """
+    Lee el stream de Gemini dentro del semáforo y deja cada fragmento en
+    `cola`; al final, (None, error). El turno se libera cuando Gemini
+    termina, no cuando el consumidor termina de enviar los fragmentos
+    """
+    partes = []
+    error = None
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.7,
-                max_output_tokens=1024,
-            )
-        )
-        return response.text
-    except Exception as e:
-        error_msg = str(e)
-        logger.error(f"❌ Error en Gemini API: {error_msg}")
-        
-        # ← IMPRIME AQUÍ
-        print(f"\n🔴 ERROR GEMINI: {error_msg}\n")
-        
-        # Verificar si es error de crédito
-        if "resource exhausted" in error_msg.lower() or "quota" in error_msg.lower() or "429" in error_msg:
-            print("⚠️  POSIBLE FALTA DE CRÉDITO O QUOTA EXCEDIDA")
-            return "Lo siento, el servicio no está disponible en este momento. Intenta más tarde."
-        
-        return "Lo siento, hubo un error procesando tu pregunta. Intenta de nuevo."
+        async with _semaforo():
+            metricas.entrar()
+            inicio = time.perf_counter()
+            plazo = GEMINI_TIMEOUT_SEGUNDOS
+            try:
+                plazo = _plazo_llamada(limite)
+                response = await asyncio.wait_for(model.generate_content_async(contenido, stream=True), plazo)
+                fragmentos = response.__aiter__()
+                while True:
+                    plazo = _plazo_llamada(limite)
+                    try:
+                        fragmento = await asyncio.wait_for(fragmentos.__anext__(), plazo)
+                    except StopAsyncIteration:
+                        break
+                    texto = fragmento.text
+                    if texto:
+                        partes.append(texto)
+                        cola.put_nowait((texto, None))
+                tokens_prompt, tokens_salida, estimados = _tokens_respuesta(response, contenido, "".join(partes))
+                metricas.registrar(time.perf_counter() - inicio, tokens_prompt, tokens_salida, estimados=estimados)
+                circuito.exito()
+            except Exception as e:
+                error = e
+                metricas.registrar(
+                    time.perf_counter() - inicio,
+                    estimar_tokens(contenido),
+                    estimar_tokens("".join(partes)),
+                    clasificar_error(e)
+                )
+                if isinstance(e, PlazoAgotado) or (plazo < GEMINI_TIMEOUT_SEGUNDOS and clasificar_error(e) == "timeout"):
+                    # Lo cortó el plazo total, no la API: no cuenta para el circuito
+                    error = PlazoAgotado("Plazo total de Gemini agotado")
+                else:
+                    circuito.fallo(clasificar_error(e))
+            finally:
+                metricas.salir()
+    finally:
+        cola.put_nowait((None, error))
+
+async def stream_gemini_response_async(prompt: str, sistema: str = None):
+    """
+    Respuesta de Gemini en fragmentos (async generator), a medida que se genera
+
+    Como get_gemini_response_async, nunca lanza. Si el stream falla antes del
+    primer fragmento, la respuesta sale de get_gemini_response_async (con sus
+    reintentos y modelo de respaldo); si falla a mitad, termina con lo ya
+    generado. Cada fragmento tiene GEMINI_TIMEOUT_SEGUNDOS para llegar, y
+    todo (respaldo incluido) GEMINI_PLAZO_TOTAL_SEGUNDOS. Mientras el
+    consumidor procesa un fragmento no se ocupa un turno de GEMINI_CONCURRENCIA.
+    """
+    limite = time.monotonic() + GEMINI_PLAZO_TOTAL_SEGUNDOS
+    circuito = _circuito(GEMINI_MODELO)
+    if not circuito.permitir():
+        metricas.contar("cortocircuitos")
+        yield await get_gemini_response_async(prompt, sistema)
+        return
+
+    productor = None
+    try:
+        model, contenido = _preparar(prompt, sistema)
+        cola = asyncio.Queue()
+        productor = asyncio.create_task(_producir_stream(model, contenido, limite, circuito, cola))
+        enviados = False
+        while True:
+            texto, error = await cola.get()
+            if texto is None:
+                break
+            enviados = True
+            yield texto
 
+        if error is None:
+            return
+        if enviados:
+            logger.error("❌ Stream de Gemini interrumpido: %s", error)
+        elif clasificar_error(error) in ERRORES_TRANSITORIOS:
+            # Nada enviado aún: reintentar sin streaming (el turno ya se liberó)
+            logger.warning("[GEMINI] ⚠️  Stream falló antes de empezar (%s); sin streaming", error)
+            yield await get_gemini_response_async(prompt, sistema, plazo=limite - time.monotonic())
+        else:
+            yield _respuesta_error(error)
+    finally:
+        # También si el consumidor deja de iterar (GeneratorExit) o se cancela
+        if productor is not None and not productor.done():
+            productor.cancel()
+            try:
+                await productor
+            except asyncio.CancelledError:
+                pass
+        circuito.cancelar_prueba()
@@ -0,0 +1,179 @@
+# ============================================================================
+# RUTA: backend/config/indices.py
+# DESCRIPCIÓN: Registro declarativo de índices y consultas de cada servicio
+# USO: En el servicio que hace las consultas:
+#        INDICES = registrar_indices("ordenes", Indice("codigo_entrega", unique=True, sparse=True))
+#        registrar_consultas("ordenes", ConsultaIndexada("último código", {"codigo_entrega": ...}))
+#      Arranque (main.py): aplicar_indices()
+#      Verificación: python scripts/verificar_indices.py
+# ============================================================================
+#
+# Cada servicio declara, junto a sus consultas, los índices que necesitan y
+# una muestra de cada consulta (filtro / orden con valores de ejemplo).
+#
+# aplicar_indices() crea todos los índices registrados. create_index es
+# idempotente: si el índice ya existe con la misma definición no hace nada.
+# Un índice que falla (duplicados, opciones distintas) se reporta y no
+# impide crear los demás.
+#
+# verificar_consultas() corre explain() sobre cada consulta registrada y
+# devuelve las que hacen COLLSCAN (recorrido completo de la colección).
+# Las consultas que leen toda la colección a propósito se marcan con
+# recorrido_completo=True.
+#
+# Las búsquedas por _id no se registran: usan siempre el índice _id.
+# ============================================================================
+
+import os
+import logging
+import importlib
+from typing import NamedTuple
+from config.database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Correr la verificación también al arrancar (solo reporta en el log)
+INDICES_VERIFICAR = os.getenv("INDICES_VERIFICAR", "false").lower() == "true"
+
+# Módulos que declaran índices/consultas (se importan antes de aplicar o
+# verificar, así los scripts no dependen de main.py)
+MODULOS_CON_INDICES = (
+    "services.lead_service",
+    "services.historial_service",
+    "services.resumen_service",
+    "services.secuencia_service",
+    "services.orden_service_v3",
+    "services.catalogo_cache",
+    "services.producto_service",
+    "services.idempotencia_service",
+    "services.cola_respuestas",
+    "services.cache_respuestas",
+)
+
+class Indice:
+    """Índice de una colección: claves ("campo" o [("campo", 1), ...]) + opciones de create_index"""
+
+    def __init__(self, claves, **opciones):
+        self.coleccion = None
+        self.claves = [(claves, 1)] if isinstance(claves, str) else list(claves)
+        self.opciones = opciones
+
+    @property
+    def nombre(self):
+        return self.opciones.get("name") or "_".join(f"{campo}_{orden}" for campo, orden in self.claves)
+
+    def __repr__(self):
+        return f"{self.coleccion}.{self.nombre}"
+
+class ConsultaIndexada(NamedTuple):
+    descripcion: str
+    filtro: dict
+    orden: list = None              # [("campo", 1 | -1), ...]
+    distinct: str = None            # campo, si es un distinct
+    recorrido_completo: bool = False
+    coleccion: str = None
+
+_indices = []
+_consultas = []
+
+def registrar_indices(coleccion, *indices):
+    """Registra índices de `coleccion`; devuelve la lista (para aplicarlos aparte)"""
+    for indice in indices:
+        indice.coleccion = coleccion
+        _indices.append(indice)
+    return list(indices)
+
+def registrar_consultas(coleccion, *consultas):
+    registradas = [consulta._replace(coleccion=coleccion) for consulta in consultas]
+    _consultas.extend(registradas)
+    return registradas
+
+def cargar_registro():
+    for modulo in MODULOS_CON_INDICES:
+        importlib.import_module(modulo)
+
+def indices_registrados():
+    cargar_registro()
+    return list(_indices)
+
+def consultas_registradas():
+    cargar_registro()
+    return list(_consultas)
+
+# ============================================================================
+# APLICAR
+# ============================================================================
+
+def aplicar_indices(indices=None, estricto=False):
+    """
+    Crea los índices (por defecto todos los registrados)
+
+    Args:
+        estricto: True → el primer error se propaga (scripts de migración)
+
+    Returns:
+        {"success", "indices": N, "errores": {indice: error}}
+    """
+    indices = indices_registrados() if indices is None else indices
+    db = get_db()
+    errores = {}
+    for indice in indices:
+        try:
+            db[indice.coleccion].create_index(indice.claves, **indice.opciones)
+        except Exception as e:
+            if estricto:
+                raise
+            errores[repr(indice)] = str(e)
+            logger.error("[INDICES] ❌ %r: %s", indice, e)
+
+    logger.info("[INDICES] ✅ %s/%s índices asegurados", len(indices) - len(errores), len(indices))
+    return {"success": not errores, "indices": len(indices), "errores": errores}
+
+# ============================================================================
+# VERIFICAR (explain)
+# ============================================================================
+
+def _comando_explain(consulta):
+    if consulta.distinct:
+        return {"distinct": consulta.coleccion, "key": consulta.distinct, "query": consulta.filtro}
+    comando = {"find": consulta.coleccion, "filter": consulta.filtro, "limit": 1}
+    if consulta.orden:
+        comando["sort"] = dict(consulta.orden)
+    return comando
+
+def _etapas(plan):
+    """Todas las etapas ("stage") de un plan, en cualquier nivel"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for valor in plan.values():
+            yield from _etapas(valor)
+    elif isinstance(plan, list):
+        for valor in plan:
+            yield from _etapas(valor)
+
+def explicar(consulta):
+    """Etapas del plan ganador de la consulta"""
+    explain = get_db().command({"explain": _comando_explain(consulta), "verbosity": "queryPlanner"})
+    return list(_etapas(explain["queryPlanner"]["winningPlan"]))
+
+def verificar_consultas(consultas=None):
+    """
+    Returns:
+        {"success", "consultas": N, "collscan": [{coleccion, descripcion, etapas}]}
+    """
+    consultas = consultas_registradas() if consultas is None else consultas
+    collscan = []
+    for consulta in consultas:
+        etapas = explicar(consulta)
+        if "COLLSCAN" in etapas and not consulta.recorrido_completo:
+            collscan.append({
+                "coleccion": consulta.coleccion,
+                "descripcion": consulta.descripcion,
+                "etapas": etapas
+            })
+            logger.error("[INDICES] ❌ COLLSCAN en %s: %s (%s)", consulta.coleccion, consulta.descripcion, " → ".join(etapas))
+        else:
+            logger.info("[INDICES] ✅ %s: %s (%s)", consulta.coleccion, consulta.descripcion, " → ".join(etapas))
+
+    return {"success": not collscan, "consultas": len(consultas), "collscan": collscan}
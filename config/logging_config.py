@@ -0,0 +1,268 @@
+# ============================================================================
+# RUTA: backend/config/logging_config.py
+# DESCRIPCIÓN: Logging estructurado (JSON), con ID de solicitud, muestreo del
+#              nivel DEBUG en el camino caliente y escritura en segundo plano
+# USO: configurar_logging()   # una vez, al inicio de main.py
+#      app.add_middleware(MiddlewareIdSolicitud)
+#      with contexto_solicitud(id_trabajo): ...   # workers fuera de un request
+# ============================================================================
+#
+# Cada mensaje de WhatsApp generaba decenas de líneas INFO armadas con
+# f-strings (aunque el nivel estuviera apagado) y escritas a stdout desde el
+# event loop. Ahora:
+#
+#   - Los módulos llaman logger.x("... %s", valor): el texto solo se arma
+#     si el registro pasa el nivel. El detalle paso a paso del camino
+#     caliente va en DEBUG.
+#   - Un QueueHandler pone el registro en una cola acotada y un hilo
+#     (QueueListener) formatea y escribe. Si la cola se llena el registro
+#     se descarta (se cuenta): el request nunca espera por el log.
+#   - Cada registro lleva id_solicitud: el X-Request-ID del request (o uno
+#     nuevo), propagado por contextvars también a los hilos de
+#     ejecutar_en_pool y, a través del trabajo, a los workers de la cola.
+#   - DEBUG de los módulos del camino caliente se muestrea por solicitud
+#     (LOG_MUESTREO_DEBUG): una solicitud muestreada conserva todo su
+#     detalle, las demás ninguno.
+#
+# Variables de entorno:
+#   LOG_NIVEL=INFO                      nivel general
+#   LOG_NIVELES=services.chat_service_v3=DEBUG,pymongo=WARNING
+#   LOG_FORMATO=json | texto            texto = formato anterior (desarrollo)
+#   LOG_MUESTREO_DEBUG=0.1              fracción de solicitudes con DEBUG
+#   LOG_COLA_MAXIMA=10000               registros en espera antes de descartar
+#
+# Campos extra: logger.info("...", extra={"id_lead": id_lead}) los agrega
+# al JSON.
+# ============================================================================
+
+import os
+import sys
+import uuid
+import zlib
+import queue
+import atexit
+import random
+import logging
+import contextvars
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from config.serializacion import a_json
+
+LOG_NIVEL = os.getenv("LOG_NIVEL", "INFO").upper()
+LOG_NIVELES = os.getenv("LOG_NIVELES", "")
+LOG_FORMATO = os.getenv("LOG_FORMATO", "json").lower()
+LOG_MUESTREO_DEBUG = float(os.getenv("LOG_MUESTREO_DEBUG", "0.1"))
+LOG_COLA_MAXIMA = int(os.getenv("LOG_COLA_MAXIMA", "10000"))
+
+FORMATO_TEXTO = "%(asctime)s - %(name)s - %(levelname)s - [%(id_solicitud)s] %(message)s"
+
+# Módulos que corren en cada mensaje de WhatsApp: su DEBUG se muestrea
+MODULOS_CAMINO_CALIENTE = (
+    "routes.whatsapp_routes_v4",
+    "services.atencion_service",
+    "services.chat_service_v3",
+    "services.sales_flow_v3",
+    "services.orden_service_v3",
+    "services.cola_respuestas",
+)
+
+# Loggers de uvicorn: pasan por el mismo handler (JSON + cola)
+LOGGERS_UVICORN = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+# ============================================================================
+# ID DE SOLICITUD
+# ============================================================================
+
+_id_solicitud = contextvars.ContextVar("id_solicitud", default=None)
+
+def obtener_id_solicitud():
+    return _id_solicitud.get()
+
+@contextmanager
+def contexto_solicitud(id_solicitud=None):
+    """Asigna el ID de solicitud de los registros dentro del bloque (uno nuevo si no se da)"""
+    id_solicitud = id_solicitud or uuid.uuid4().hex[:16]
+    token = _id_solicitud.set(id_solicitud)
+    try:
+        yield id_solicitud
+    finally:
+        _id_solicitud.reset(token)
+
+class MiddlewareIdSolicitud:
+    """Middleware ASGI: ID por request (X-Request-ID entrante o nuevo), devuelto en la respuesta"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        entrante = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64]
+        with contexto_solicitud(entrante or None) as id_solicitud:
+            cabecera = (b"x-request-id", id_solicitud.encode("latin-1"))
+
+            async def enviar(mensaje):
+                if mensaje["type"] == "http.response.start":
+                    mensaje = {**mensaje, "headers": [*mensaje.get("headers", []), cabecera]}
+                await send(mensaje)
+
+            await self.app(scope, receive, enviar)
+
+# ============================================================================
+# MUESTREO Y COLA
+# ============================================================================
+
+class FiltroMuestreo(logging.Filter):
+    """DEBUG del camino caliente: se conserva en LOG_MUESTREO_DEBUG de las solicitudes"""
+
+    def __init__(self, tasa=LOG_MUESTREO_DEBUG, modulos=MODULOS_CAMINO_CALIENTE):
+        super().__init__()
+        self.umbral = int(tasa * 10000)
+        self.modulos = modulos
+        self.omitidos = 0
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or not record.name.startswith(self.modulos):
+            return True
+        id_solicitud = _id_solicitud.get()
+        if id_solicitud is None:
+            valor = random.randrange(10000)
+        else:
+            # Misma decisión para todos los registros de la solicitud
+            valor = zlib.crc32(id_solicitud.encode("utf-8")) % 10000
+        if valor < self.umbral:
+            return True
+        self.omitidos += 1
+        return False
+
+class ManejadorCola(QueueHandler):
+    """QueueHandler que nunca bloquea: con la cola llena descarta el registro"""
+
+    def __init__(self, cola):
+        super().__init__(cola)
+        self.descartados = 0
+
+    def prepare(self, record):
+        # En el hilo que loguea: contexto y mensaje (los argumentos pueden
+        # cambiar después); el formateo y la escritura quedan para el listener
+        record.id_solicitud = _id_solicitud.get()
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+# ============================================================================
+# FORMATO
+# ============================================================================
+
+_CAMPOS_REGISTRO = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "id_solicitud", "taskName"}
+
+class FormateadorJSON(logging.Formatter):
+    """Una línea JSON por registro: ts, nivel, logger, mensaje, id_solicitud + extras"""
+
+    def format(self, record):
+        datos = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+            "id_solicitud": getattr(record, "id_solicitud", None),
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _CAMPOS_REGISTRO:
+                datos[clave] = valor
+        if record.exc_info:
+            datos["excepcion"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            datos["stack"] = self.formatStack(record.stack_info)
+
+        try:
+            return a_json(datos).decode("utf-8")
+        except TypeError:
+            # Extra de un tipo desconocido: como texto
+            return a_json({clave: valor if isinstance(valor, (str, int, float, bool, type(None))) else str(valor)
+                           for clave, valor in datos.items()}).decode("utf-8")
+
+class FormateadorTexto(logging.Formatter):
+
+    def format(self, record):
+        if not hasattr(record, "id_solicitud"):
+            record.id_solicitud = None
+        return super().format(record)
+
+# ============================================================================
+# CONFIGURACIÓN
+# ============================================================================
+
+_listener = None
+_manejador = None
+_muestreo = None
+_lock_configuracion = threading.Lock()
+
+def _niveles_por_modulo(texto):
+    """LOG_NIVELES → {módulo: nivel}"""
+    niveles = {}
+    for parte in texto.split(","):
+        modulo, _, nivel = parte.partition("=")
+        if modulo.strip() and nivel.strip():
+            niveles[modulo.strip()] = nivel.strip().upper()
+    return niveles
+
+def configurar_logging(nivel=LOG_NIVEL, niveles=LOG_NIVELES, formato=LOG_FORMATO):
+    """Reemplaza los handlers del logger raíz por la cola + listener (idempotente)"""
+    global _listener, _manejador, _muestreo
+    with _lock_configuracion:
+        if _listener is not None:
+            return
+
+        salida = logging.StreamHandler(sys.stdout)
+        salida.setFormatter(FormateadorJSON() if formato == "json" else FormateadorTexto(FORMATO_TEXTO))
+
+        _muestreo = FiltroMuestreo()
+        _manejador = ManejadorCola(queue.Queue(maxsize=LOG_COLA_MAXIMA))
+        _manejador.addFilter(_muestreo)
+
+        raiz = logging.getLogger()
+        for handler in list(raiz.handlers):
+            raiz.removeHandler(handler)
+        raiz.addHandler(_manejador)
+        raiz.setLevel(nivel)
+
+        for nombre in LOGGERS_UVICORN:
+            logger_uvicorn = logging.getLogger(nombre)
+            logger_uvicorn.handlers.clear()
+            logger_uvicorn.propagate = True
+
+        for modulo, nivel_modulo in _niveles_por_modulo(niveles).items():
+            logging.getLogger(modulo).setLevel(nivel_modulo)
+
+        _listener = QueueListener(_manejador.queue, salida, respect_handler_level=True)
+        _listener.start()
+        atexit.register(detener_logging)
+
+def detener_logging():
+    """Escribe lo que quede en la cola y detiene el listener"""
+    global _listener
+    with _lock_configuracion:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+
+def obtener_metricas_logging():
+    return {
+        "formato": LOG_FORMATO,
+        "en_cola": _manejador.queue.qsize() if _manejador else 0,
+        "descartados": _manejador.descartados if _manejador else 0,
+        "muestreo_debug": LOG_MUESTREO_DEBUG,
+        "debug_omitidos": _muestreo.omitidos if _muestreo else 0,
+    }
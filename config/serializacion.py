@@ -0,0 +1,49 @@
+# ============================================================================
+# RUTA: backend/config/serializacion.py
+# DESCRIPCIÓN: Serialización JSON rápida (orjson) con soporte de tipos BSON
+# USO: router = APIRouter(..., default_response_class=RespuestaJSON)
+#      return RespuestaJSON(obtener_lead_por_telefono(telefono))
+#      cuerpo = a_json(datos)   # bytes
+# ============================================================================
+#
+# Los endpoints devolvían dicts con documentos de MongoDB y FastAPI los
+# pasaba por jsonable_encoder (recorre todo el documento en Python) antes de
+# json.dumps. Además cada servicio convertía el _id a mano y un ObjectId
+# anidado (ordenes.id_lead, el _id que insert_one agrega al documento)
+# rompía la respuesta.
+#
+# a_json() serializa con orjson: datetime/date nativos, y ObjectId /
+# Decimal128 por el hook bson_default, en cualquier nivel del documento.
+#
+# Un endpoint que devuelve un dict sigue pasando por jsonable_encoder aunque
+# el router tenga default_response_class: para saltarlo, el endpoint devuelve
+# RespuestaJSON(...) directamente (default_response_class queda para la
+# documentación OpenAPI).
+# ============================================================================
+
+import orjson
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from fastapi.responses import JSONResponse
+
+OPCIONES_JSON = orjson.OPT_NON_STR_KEYS
+
+def bson_default(valor):
+    """Tipos que orjson no conoce: ObjectId → str, Decimal128 → float"""
+    if isinstance(valor, ObjectId):
+        return str(valor)
+    if isinstance(valor, Decimal128):
+        return float(valor.to_decimal())
+    if isinstance(valor, (set, frozenset)):
+        return list(valor)
+    raise TypeError(f"Tipo no serializable a JSON: {type(valor).__name__}")
+
+def a_json(datos):
+    """JSON (bytes UTF-8) de `datos`; documentos de MongoDB tal cual"""
+    return orjson.dumps(datos, default=bson_default, option=OPCIONES_JSON)
+
+class RespuestaJSON(JSONResponse):
+    """JSONResponse serializada con orjson + tipos BSON"""
+
+    def render(self, content) -> bytes:
+        return a_json(content)
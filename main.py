@@ -6,6 +6,7 @@
 
 import os
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
@@ -15,27 +16,81 @@ from datetime import datetime
 # Cargar variables de entorno
 load_dotenv()
 
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configurar logging (JSON, en segundo plano; ver config/logging_config.py)
+from config.logging_config import configurar_logging, MiddlewareIdSolicitud, obtener_metricas_logging
+configurar_logging()
 logger = logging.getLogger(__name__)
 
-# Conectar a MongoDB
-from config.database import connect_mongodb, close_mongodb
+from config.database import connect_mongodb, close_mongodb, calentar_pool, obtener_metricas_pool
+from services.catalogo_cache import iniciar_catalogo_cache, detener_catalogo_cache
+from config.indices import aplicar_indices, verificar_consultas, INDICES_VERIFICAR
+from services.cola_respuestas import cola_respuestas, modo_asincrono
+from services.resumen_service import resumidor
+from config.gemini_config import obtener_metricas_gemini
+from services.cache_respuestas import obtener_metricas_cache
+from services.respuesta_rapida import obtener_metricas_respuestas
+
+# ===== CICLO DE VIDA =====
+
+async def iniciar_servicios():
+    logger.info("=" * 70)
+    logger.info("✅ Aplicación iniciada")
+    logger.info("🤖 Bot: %s", os.getenv("BOT_NAME", "Kliofer"))
+    logger.info("🏢 Empresa: %s", os.getenv("COMPANY_NAME", "FRESST"))
+    logger.info("🌍 Ambiente: %s", os.getenv("ENVIRONMENT", "development"))
+    logger.info("=" * 70)
+    
+    # Conectar a MongoDB y abrir el pool antes de aceptar requests
+    try:
+        connect_mongodb()
+        await calentar_pool()
+    except Exception as e:
+        logger.error("❌ No se pudo conectar a MongoDB: %s", e)
+        logger.warning("⚠️ La aplicación iniciará pero sin base de datos")
+    
+    try:
+        iniciar_catalogo_cache()
+    except Exception as e:
+        logger.error("❌ No se pudo cargar el catálogo en caché: %s", e)
+    
+    # Índices declarados por cada servicio (config/indices.py)
+    try:
+        resultado = aplicar_indices()
+        if not resultado["success"]:
+            # Códigos duplicados previos: ejecutar scripts/migrar_codigos_entrega.py
+            logger.error("❌ No se pudieron crear algunos índices: %s", resultado["errores"])
+        if INDICES_VERIFICAR:
+            verificar_consultas()
+    except Exception as e:
+        logger.error("❌ No se pudieron crear los índices: %s", e)
+    
+    if modo_asincrono():
+        try:
+            cola_respuestas.iniciar()
+        except Exception as e:
+            logger.error("❌ No se pudieron iniciar los workers de respuesta: %s", e)
+
+async def detener_servicios():
+    logger.info("❌ Aplicación detenida")
+    await cola_respuestas.detener()
+    await resumidor.detener()
+    detener_catalogo_cache()
+    close_mongodb()
 
-try:
-    connect_mongodb()
-except Exception as e:
-    logger.error(f"❌ No se pudo conectar a MongoDB: {e}")
-    logger.warning("⚠️ La aplicación iniciará pero sin base de datos")
+@asynccontextmanager
+async def lifespan(app):
+    await iniciar_servicios()
+    try:
+        yield
+    finally:
+        await detener_servicios()
 
 # Crear app
 app = FastAPI(
     title="FRESST Chatbot API",
     description="API para chatbot WhatsApp de FRESST",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # ⭐ MIDDLEWARE CORS ADICIONAL
@@ -56,6 +111,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+# ID de solicitud en cada registro de log y en la cabecera X-Request-ID
+app.add_middleware(MiddlewareIdSolicitud)
+
 # Importar rutas
 from routes.whatsapp_routes_v4 import router as whatsapp_router
 from routes.lead_routes import router as lead_router
@@ -66,14 +125,6 @@ app.include_router(whatsapp_router)
 app.include_router(lead_router)
 app.include_router(producto_router)
 
-# ⭐ SERVIR ARCHIVOS ESTÁTICOS (HTML + imágenes)
-# ESTO VA AL FINAL
-if os.path.exists("static"):
-    logger.info("✅ Sirviendo archivos estáticos desde carpeta /static")
-    app.mount("/", StaticFiles(directory="static", html=True), name="static")
-else:
-    logger.warning("⚠️ Carpeta /static no encontrada - Las imágenes no se cargarán")
-
 # ===== RUTAS BASE =====
 
 @app.get("/health")
@@ -82,7 +133,12 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "FRESST Bot",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.now().isoformat(),
+        "mongodb": obtener_metricas_pool(),
+        "gemini": obtener_metricas_gemini(),
+        "cache_respuestas": obtener_metricas_cache(),
+        "respuestas": obtener_metricas_respuestas(),
+        "logging": obtener_metricas_logging()
     }
 
 @app.get("/api/info")
@@ -95,21 +151,13 @@ async def api_info():
         "environment": os.getenv("ENVIRONMENT", "development")
     }
 
-# ===== EVENTOS =====
-
-@app.on_event("startup")
-async def startup_event():
-    logger.info("=" * 70)
-    logger.info("✅ Aplicación iniciada")
-    logger.info(f"🤖 Bot: {os.getenv('BOT_NAME', 'Kliofer')}")
-    logger.info(f"🏢 Empresa: {os.getenv('COMPANY_NAME', 'FRESST')}")
-    logger.info(f"🌍 Ambiente: {os.getenv('ENVIRONMENT', 'development')}")
-    logger.info("=" * 70)
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    logger.info("❌ Aplicación detenida")
-    close_mongodb()
+# ⭐ SERVIR ARCHIVOS ESTÁTICOS (HTML + imágenes)
+# ESTO VA AL FINAL: el mount en "/" tapa las rutas declaradas después
+if os.path.exists("static"):
+    logger.info("✅ Sirviendo archivos estáticos desde carpeta /static")
+    app.mount("/", StaticFiles(directory="static", html=True), name="static")
+else:
+    logger.warning("⚠️ Carpeta /static no encontrada - Las imágenes no se cargarán")
 
 # ===== MAIN =====
 
@@ -119,11 +167,13 @@ if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     host = os.getenv("HOST", "0.0.0.0")
     
-    logger.info(f"🚀 Iniciando servidor en {host}:{port}")
+    logger.info("🚀 Iniciando servidor en %s:%s", host, port)
     
+    # log_config=None: uvicorn usa el logging ya configurado
     uvicorn.run(
         "main:app",
         host=host,
         port=port,
-        reload=os.getenv("ENVIRONMENT") == "development"
+        reload=os.getenv("ENVIRONMENT") == "development",
+        log_config=None
     )
\ No newline at end of file
@@ -1,8 +1,9 @@
 # ============================================================================
 # RUTA: backend/models/conversacion.py
 # DESCRIPCIÓN: Modelo Pydantic para Conversaciones WhatsApp
-# TABLA: conversaciones_whatsapp
-# DOCUMENTOS: {"id_lead": ObjectId, "mensajes": [...], ...}
+# TABLA: conversaciones_whatsapp (cabecera) + mensajes_whatsapp (buckets)
+# DOCUMENTOS: {"id_lead": str, "total_mensajes": 4, ...}
+#             {"id_lead": str, "bucket": 0, "mensajes": [...], "cantidad": 4}
 # ============================================================================
 
 from pydantic import BaseModel
@@ -22,6 +23,14 @@ class Conversacion(BaseModel):
     numero_cliente: str
     estado: str = "activa"  # activa, cerrada, etc
 
+class BucketMensajes(BaseModel):
+    """Bloque de hasta BUCKET_SIZE mensajes consecutivos de un lead"""
+    id_lead: str
+    bucket: int  # posición del mensaje // BUCKET_SIZE
+    mensajes: List[Mensaje]
+    cantidad: int
+    ultimo: Optional[datetime] = None
+
 class ConversacionResponse(BaseModel):
     """Modelo de respuesta"""
     id: str
@@ -32,12 +41,24 @@ class ConversacionResponse(BaseModel):
     fecha_inicio: datetime
     ultimo_mensaje: datetime
 
-# Ejemplo de documento en MongoDB:
+# Ejemplo de documentos en MongoDB:
 EJEMPLO = {
     "_id": "507f1f77bcf86cd799439011",
     "id_lead": "507f1f77bcf86cd799439012",
     "numero_cliente": "+593983200438",
+    "nombre_cliente": "Juan Pérez",
     "estado": "activa",
+    "total_mensajes": 4,
+    "fecha_inicio": datetime.now(),
+    "timestamp": datetime.now()
+}
+
+EJEMPLO_BUCKET = {
+    "_id": "507f1f77bcf86cd799439013",
+    "id_lead": "507f1f77bcf86cd799439012",
+    "bucket": 0,
+    "cantidad": 4,
+    "ultimo": datetime.now(),
     "mensajes": [
         {
             "emisor": "cliente",
@@ -63,7 +84,5 @@ EJEMPLO = {
             "timestamp": datetime.now(),
             "message_sid": "SM..."
         }
-    ],
-    "fecha_inicio": datetime.now(),
-    "timestamp": datetime.now()
+    ]
 }
\ No newline at end of file
@@ -33,6 +33,7 @@ EJEMPLO = {
     "_id": "507f1f77bcf86cd799439011",
     "nombre": "Juan Pérez",
     "telefono": "+593983200438",
+    "telefono_canonico": "+593983200438",  # E.164, índice único
     "email": "juan@example.com",
     "direccion_entrega": "Calle 123, Número 45",
     "estado_compra": "cliente",
@@ -6,6 +6,7 @@
 # ============================================================================
 
 from fastapi import APIRouter
+from config.serializacion import RespuestaJSON
 from services.lead_service import (
     crear_lead, 
     obtener_lead_por_telefono, 
@@ -15,22 +16,24 @@ from services.lead_service import (
 import logging
 
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/api/leads", tags=["leads"])
+router = APIRouter(prefix="/api/leads", tags=["leads"], default_response_class=RespuestaJSON)
 
 # ===== LEADS =====
+# Endpoints síncronos: FastAPI los ejecuta en su threadpool y no bloquean el event loop
+# Devuelven RespuestaJSON: el documento del lead va directo a orjson (ObjectId incluidos)
 
 @router.post("/crear")
-async def crear_nuevo_lead(nombre: str = None, telefono: str = None, email: str = None, direccion: str = None):
+def crear_nuevo_lead(nombre: str = None, telefono: str = None, email: str = None, direccion: str = None):
     """Crea un nuevo lead"""
-    return crear_lead(nombre, telefono, email, direccion)
+    return RespuestaJSON(crear_lead(nombre, telefono, email, direccion))
 
 @router.get("/{telefono}")
-async def obtener_lead(telefono: str):
+def obtener_lead(telefono: str):
     """Obtiene un lead por teléfono"""
-    return obtener_lead_por_telefono(telefono)
+    return RespuestaJSON(obtener_lead_por_telefono(telefono))
 
 @router.put("/{lead_id}")
-async def actualizar_datos_lead(lead_id: str, nombre: str = None, email: str = None, direccion: str = None):
+def actualizar_datos_lead(lead_id: str, nombre: str = None, email: str = None, direccion: str = None):
     """Actualiza datos de un lead"""
     datos = {}
     if nombre:
@@ -39,7 +42,7 @@ async def actualizar_datos_lead(lead_id: str, nombre: str = None, email: str = N
         datos["email"] = email
     if direccion:
         datos["direccion_entrega"] = direccion
-    return actualizar_lead(lead_id, datos)
+    return RespuestaJSON(actualizar_lead(lead_id, datos))
 
 # ===== ÓRDENES - COMENTADAS TEMPORALMENTE =====
 # Las órdenes se gestionan directamente desde whatsapp_routes.py
@@ -62,4 +65,4 @@ async def actualizar_datos_lead(lead_id: str, nombre: str = None, email: str = N
 @router.get("/health")
 async def health_check():
     """Health check"""
-    return {"status": "ok", "service": "leads"}
\ No newline at end of file
+    return RespuestaJSON({"status": "ok", "service": "leads"})
\ No newline at end of file
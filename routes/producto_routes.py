@@ -5,40 +5,67 @@
 # ENDPOINTS: /api/productos/*
 # ============================================================================
 
-from fastapi import APIRouter
+import os
+from fastapi import APIRouter, Request, Response
+from config.serializacion import RespuestaJSON
 from services.producto_service import (
-    obtener_todos_productos,
-    obtener_productos_por_categoria,
     obtener_producto_por_id,
     obtener_categorias,
-    obtener_producto_por_nombre
+    preparar_listado,
+    listar_productos
 )
+from services.buscador_productos import buscar_productos
 import logging
 
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/api/productos", tags=["productos"])
+router = APIRouter(prefix="/api/productos", tags=["productos"], default_response_class=RespuestaJSON)
+
+# El frontend consulta el listado seguido: lo puede reutilizar unos segundos
+# y luego revalidar con If-None-Match (304 si el catálogo no cambió)
+PRODUCTOS_CACHE_MAX_AGE = int(os.getenv("PRODUCTOS_CACHE_MAX_AGE", "30"))
+
+# Endpoints síncronos: FastAPI los ejecuta en su threadpool y no bloquean el event loop
+
+def _etag_coincide(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidatos = {e.strip().removeprefix("W/") for e in if_none_match.split(",")}
+    return "*" in candidatos or etag in candidatos
+
+def _responder_listado(request, listado):
+    """Listado con ETag / Cache-Control; 304 sin cuerpo si el cliente ya lo tiene"""
+    if _etag_coincide(request.headers.get("if-none-match"), listado.etag):
+        etag, cuerpo = listado.etag, None
+    else:
+        etag, cuerpo = listar_productos(listado)
+    
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={PRODUCTOS_CACHE_MAX_AGE}"}
+    if cuerpo is None:
+        return Response(status_code=304, headers=headers)
+    return Response(content=cuerpo, media_type="application/json", headers=headers)
 
 @router.get("/")
-async def listar_productos():
-    """Obtiene todos los productos"""
-    return obtener_todos_productos()
+def listar(request: Request, cursor: str = None, limite: int = None, campos: str = None):
+    """Productos activos; sin limite ni cursor, todos (cursor = "siguiente" de la página anterior; campos = "nombre,precio,...")"""
+    return _responder_listado(request, preparar_listado(cursor, limite, campos))
 
 @router.get("/categorias")
-async def listar_categorias():
+def listar_categorias():
     """Obtiene todas las categorías"""
-    return obtener_categorias()
+    return RespuestaJSON(obtener_categorias())
 
 @router.get("/categoria/{categoria}")
-async def productos_por_categoria(categoria: str):
-    """Obtiene productos de una categoría específica"""
-    return obtener_productos_por_categoria(categoria)
+def productos_por_categoria(request: Request, categoria: str, cursor: str = None, limite: int = None, campos: str = None):
+    """Productos activos de una categoría, paginados como el listado"""
+    return _responder_listado(request, preparar_listado(cursor, limite, campos, categoria))
 
 @router.get("/buscar")
-async def buscar_producto(nombre: str):
-    """Busca un producto por nombre"""
-    return obtener_producto_por_nombre(nombre)
+def buscar_producto(q: str = "", nombre: str = "", pagina: int = 1, por_pagina: int = 10):
+    """Busca productos por nombre, categoría, características o descripción (ranking por relevancia)"""
+    # `nombre`: parámetro anterior, se sigue aceptando
+    return RespuestaJSON(buscar_productos(q or nombre, pagina=pagina, por_pagina=por_pagina))
 
 @router.get("/{id_producto}")
-async def obtener_producto(id_producto: str):
+def obtener_producto(id_producto: str):
     """Obtiene un producto específico"""
-    return obtener_producto_por_id(id_producto)
\ No newline at end of file
+    return RespuestaJSON(obtener_producto_por_id(id_producto))
\ No newline at end of file
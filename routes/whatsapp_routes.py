@@ -35,8 +35,8 @@ async def whatsapp_webhook(request: Request):
         from_number = form_data.get("From", "").replace("whatsapp:", "")
         mensaje_usuario = form_data.get("Body", "")
         
-        logger.info(f"[WEBHOOK] 📱 Desde: {from_number}")
-        logger.info(f"[WEBHOOK] 💬 Mensaje: {mensaje_usuario}")
+        logger.info("[WEBHOOK] 📱 Desde: %s", from_number)
+        logger.info("[WEBHOOK] 💬 Mensaje: %s", mensaje_usuario)
         
         # ════════════════════════════════════════════════════════════════
         # PASO 1: BUSCAR O CREAR LEAD
@@ -48,7 +48,7 @@ async def whatsapp_webhook(request: Request):
         if lead_existente.get("success") and lead_existente.get("data"):
             id_lead = str(lead_existente["data"]["_id"])
             nombre_cliente = lead_existente["data"].get("nombre", "Cliente")
-            logger.info(f"[WEBHOOK] ✅ Lead encontrado: {nombre_cliente}")
+            logger.info("[WEBHOOK] ✅ Lead encontrado: %s", nombre_cliente)
         else:
             logger.info("[WEBHOOK] 🆕 Lead nuevo, creando...")
             resultado_crear = crear_lead(
@@ -60,7 +60,7 @@ async def whatsapp_webhook(request: Request):
             if resultado_crear.get("success"):
                 id_lead = resultado_crear["id"]
                 nombre_cliente = "Cliente"
-                logger.info(f"[WEBHOOK] ✅ Lead creado: {id_lead}")
+                logger.info("[WEBHOOK] ✅ Lead creado: %s", id_lead)
             else:
                 logger.error("[WEBHOOK] ❌ Error creando lead")
                 resp = MessagingResponse()
@@ -75,13 +75,13 @@ async def whatsapp_webhook(request: Request):
         resultado_chat = procesar_mensaje(id_lead, from_number, mensaje_usuario)
         
         if not resultado_chat.get("success"):
-            logger.error(f"[WEBHOOK] ❌ Error chat: {resultado_chat.get('error')}")
+            logger.error("[WEBHOOK] ❌ Error chat: %s", resultado_chat.get('error'))
             respuesta_kliofer = "Lo siento, hubo un error. Intenta de nuevo."
         else:
             respuesta_kliofer = resultado_chat.get("respuesta", "")
             nombre_cliente = resultado_chat.get("nombre_cliente", "Cliente")
         
-        logger.info(f"[WEBHOOK] ✅ Kliofer: {respuesta_kliofer[:80]}...")
+        logger.info("[WEBHOOK] ✅ Kliofer: %s...", respuesta_kliofer[:80])
         
         # ════════════════════════════════════════════════════════════════
         # PASO 3: GUARDAR MENSAJE EN CONVERSACIONES
@@ -127,7 +127,7 @@ async def whatsapp_webhook(request: Request):
             logger.info("[WEBHOOK] ✅ Conversación guardada")
         
         except Exception as e:
-            logger.error(f"[WEBHOOK] ❌ Error guardando: {e}")
+            logger.error("[WEBHOOK] ❌ Error guardando: %s", e)
         
         # ════════════════════════════════════════════════════════════════
         # PASO 4: DETECTAR INTENCIONES Y CREAR ÓRDENES SI APLICA
@@ -139,10 +139,10 @@ async def whatsapp_webhook(request: Request):
         metodo_pago = detectar_metodo_pago(mensaje_usuario)
         direccion = detectar_direccion(mensaje_usuario)
         
-        logger.info(f"[WEBHOOK] Intenciones:")
-        logger.info(f"  - Producto: {producto}")
-        logger.info(f"  - Método pago: {metodo_pago}")
-        logger.info(f"  - Dirección: {direccion}")
+        logger.info("[WEBHOOK] Intenciones:")
+        logger.info("  - Producto: %s", producto)
+        logger.info("  - Método pago: %s", metodo_pago)
+        logger.info("  - Dirección: %s", direccion)
         
         # Si tiene producto + método pago + dirección (contraentrega) → CREAR ORDEN
         if producto and metodo_pago == "contraentrega" and direccion:
@@ -160,10 +160,10 @@ async def whatsapp_webhook(request: Request):
                 )
                 
                 if resultado_orden.get("success"):
-                    logger.info(f"[WEBHOOK] ✅ Orden creada: {resultado_orden['codigo']}")
+                    logger.info("[WEBHOOK] ✅ Orden creada: %s", resultado_orden['codigo'])
                     guardar_metodo_pago_en_lead(id_lead, "contraentrega", precio, direccion)
                 else:
-                    logger.error(f"[WEBHOOK] ❌ Error creando orden: {resultado_orden.get('error')}")
+                    logger.error("[WEBHOOK] ❌ Error creando orden: %s", resultado_orden.get('error'))
         
         # Si tiene producto + método pago presencial → CREAR ORDEN
         elif producto and metodo_pago == "presencial":
@@ -180,10 +180,10 @@ async def whatsapp_webhook(request: Request):
                 )
                 
                 if resultado_orden.get("success"):
-                    logger.info(f"[WEBHOOK] ✅ Orden creada: {resultado_orden['codigo']}")
+                    logger.info("[WEBHOOK] ✅ Orden creada: %s", resultado_orden['codigo'])
                     guardar_metodo_pago_en_lead(id_lead, "presencial", precio)
                 else:
-                    logger.error(f"[WEBHOOK] ❌ Error creando orden: {resultado_orden.get('error')}")
+                    logger.error("[WEBHOOK] ❌ Error creando orden: %s", resultado_orden.get('error'))
         
         # ════════════════════════════════════════════════════════════════
         # PASO 5: ENVIAR RESPUESTA A WHATSAPP
@@ -200,7 +200,7 @@ async def whatsapp_webhook(request: Request):
         return Response(content=str(resp), media_type="application/xml")
     
     except Exception as e:
-        logger.error(f"[WEBHOOK] ❌ ERROR CRÍTICO: {e}", exc_info=True)
+        logger.error("[WEBHOOK] ❌ ERROR CRÍTICO: %s", e, exc_info=True)
         resp = MessagingResponse()
         resp.message("Error en el servidor")
         return Response(content=str(resp), media_type="application/xml")
@@ -226,10 +226,10 @@ async def capturar_lead(request: Request):
         email = body.get("email", "").strip()
         producto = body.get("producto", "").strip()
         
-        logger.info(f"[MODAL] 👤 Nombre: {nombre}")
-        logger.info(f"[MODAL] 📱 Teléfono: {telefono}")
-        logger.info(f"[MODAL] 📧 Email: {email}")
-        logger.info(f"[MODAL] 📦 Producto: {producto}")
+        logger.info("[MODAL] 👤 Nombre: %s", nombre)
+        logger.info("[MODAL] 📱 Teléfono: %s", telefono)
+        logger.info("[MODAL] 📧 Email: %s", email)
+        logger.info("[MODAL] 📦 Producto: %s", producto)
         
         if not nombre or not telefono:
             logger.error("[MODAL] ❌ Datos incompletos")
@@ -248,7 +248,7 @@ async def capturar_lead(request: Request):
                 datos["email"] = email
             
             actualizar_lead(id_lead, datos)
-            logger.info(f"[MODAL] ✅ Lead actualizado: {id_lead}")
+            logger.info("[MODAL] ✅ Lead actualizado: %s", id_lead)
         else:
             resultado = crear_lead(
                 nombre=nombre,
@@ -259,7 +259,7 @@ async def capturar_lead(request: Request):
             
             if resultado.get("success"):
                 id_lead = resultado["id"]
-                logger.info(f"[MODAL] ✅ Lead creado: {id_lead}")
+                logger.info("[MODAL] ✅ Lead creado: %s", id_lead)
             else:
                 logger.error("[MODAL] ❌ Error creando lead")
                 return {"success": False, "error": resultado.get("error")}
@@ -276,7 +276,7 @@ async def capturar_lead(request: Request):
         numero_limpio = numero_fresst.replace("+", "")
         link_whatsapp = f"https://wa.me/{numero_limpio}?text={mensaje_encoded}"
         
-        logger.info(f"[MODAL] ✅ Link generado: {link_whatsapp[:60]}...")
+        logger.info("[MODAL] ✅ Link generado: %s...", link_whatsapp[:60])
         logger.info("=" * 80)
         
         return {
@@ -290,7 +290,7 @@ async def capturar_lead(request: Request):
         }
     
     except Exception as e:
-        logger.error(f"[MODAL] ❌ Error: {e}", exc_info=True)
+        logger.error("[MODAL] ❌ Error: %s", e, exc_info=True)
         return {"success": False, "error": str(e)}
 
 
@@ -0,0 +1,173 @@
+# ============================================================================
+# RUTA: backend/scripts/bench_palabras_clave.py
+# DESCRIPCIÓN: Micro-benchmark de detectores (listas + `in` vs matcher compilado)
+# USO: python scripts/bench_palabras_clave.py [--mongo] [--repeticiones 2000]
+# ============================================================================
+#
+# Compara las implementaciones anteriores de detectar_producto,
+# detectar_metodo_pago, detectar_direccion y detectar_opcion_pago (copiadas
+# abajo como referencia) contra analizar_mensaje() / MATCHER_PAGO.
+# Con --mongo usa como corpus los mensajes reales de clientes guardados en
+# mensajes_whatsapp; si no, un corpus de ejemplo. Los "resultados distintos"
+# son las correcciones del matcher (límites de palabra, acentos, palabra más
+# específica); revisarlos antes de dar el cambio por bueno.
+#
+# analizar_mensaje() busca además el nombre exacto en el catálogo cuando no
+# hay palabra clave de producto; las implementaciones anteriores no lo
+# hacían y sin MongoDB intentaría conectarse en cada mensaje, así que aquí
+# esa búsqueda se reemplaza por "sin coincidencia" (se mide solo el matcher).
+# ============================================================================
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import sales_flow_v3
+from services.sales_flow_v3 import (
+    PRODUCTOS_MAP, PALABRAS_CONTRAENTREGA, PALABRAS_PRESENCIAL, PALABRAS_DIRECCION,
+    analizar_mensaje
+)
+from services.payment_service import detectar_opcion_pago
+from services import payment_service
+
+CORPUS_EJEMPLO = [
+    "Hola",
+    "Buenas tardes, ¿cuánto cuesta el horno?",
+    "Me interesa una vitrina para mantener frío los postres",
+    "Quiero un frigorífico de 800 litros",
+    "¿Tienen freidoras dobles?",
+    "Necesito 2 mesas de acero para mi cocina",
+    "¿Hacen entregas a domicilio?",
+    "Prefiero contraentrega, pago cuando llegue",
+    "Mejor voy al local el sábado y pago en efectivo",
+    "Mi dirección es Av. 6 de Diciembre y Colón, sector La Mariscal, Quito",
+    "Calle Los Pinos N45-12, barrio El Inca",
+    "¿Cuál es el horario del local?",
+    "Gracias!",
+    "Dame la balanza digital por favor",
+    "¿La garantía de los asaderos cuánto dura?",
+    "Quiero el carro de hotdog, ¿me lo entregas mañana?",
+    "ok perfecto",
+    "¿Tienen góndolas y estanterías para minimarket?",
+    "Paso por el local a ver las bomboneras",
+    "necesito una cocina industrial de 6 quemadores y una panera",
+    # Casos donde el comportamiento anterior fallaba (subcadenas / orden del dict)
+    "Quiero una vitrina para mantener frío",
+    "Vivo en la localidad de Amazonas",
+    "Estoy casado y quiero ver precios",
+    "¿Tienen Frigoríficos de 2 puertas?",
+]
+
+# ============================================================================
+# IMPLEMENTACIONES ANTERIORES (REFERENCIA)
+# ============================================================================
+
+def producto_original(mensaje):
+    mensaje_lower = mensaje.lower()
+    for palabra, producto in PRODUCTOS_MAP.items():
+        if palabra in mensaje_lower:
+            return producto
+    return None
+
+def metodo_pago_original(mensaje):
+    msg_lower = mensaje.lower()
+    if any(p in msg_lower for p in PALABRAS_CONTRAENTREGA):
+        return "contraentrega"
+    if any(p in msg_lower for p in PALABRAS_PRESENCIAL):
+        return "presencial"
+    return None
+
+def direccion_original(mensaje):
+    msg_lower = mensaje.lower()
+    if any(p in msg_lower for p in PALABRAS_DIRECCION):
+        return mensaje.strip()
+    return None
+
+def opcion_pago_original(mensaje):
+    resultado = {
+        "opcion_detectada": None,
+        "es_contraentrega": False,
+        "es_presencial": False,
+        "confianza": False
+    }
+    mensaje_lower = mensaje.lower()
+    if any(p in mensaje_lower for p in payment_service.PALABRAS_CONTRAENTREGA):
+        resultado["opcion_detectada"] = "contraentrega"
+        resultado["es_contraentrega"] = True
+        resultado["confianza"] = True
+        return resultado
+    if any(p in mensaje_lower for p in payment_service.PALABRAS_PRESENCIAL):
+        resultado["opcion_detectada"] = "presencial"
+        resultado["es_presencial"] = True
+        resultado["confianza"] = True
+        return resultado
+    return resultado
+
+def analizar_original(mensaje):
+    return {
+        "producto": producto_original(mensaje),
+        "metodo_pago": metodo_pago_original(mensaje),
+        "direccion": direccion_original(mensaje)
+    }
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+def cargar_corpus_mongo(limite=5000):
+    from dotenv import load_dotenv
+    load_dotenv()
+    from config.database import connect_mongodb, get_collection
+
+    connect_mongodb()
+    corpus = []
+    for bucket in get_collection("mensajes_whatsapp").find({}, {"mensajes": 1}):
+        corpus.extend(m.get("texto", "") for m in bucket.get("mensajes", []) if m.get("emisor") == "cliente")
+        if len(corpus) >= limite:
+            break
+    return corpus[:limite]
+
+def medir(funcion, corpus, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for mensaje in corpus:
+            funcion(mensaje)
+    total = time.perf_counter() - inicio
+    return total / (repeticiones * len(corpus)) * 1e6
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark de detectores de palabras clave")
+    parser.add_argument("--mongo", action="store_true", help="Usar mensajes reales de MongoDB")
+    parser.add_argument("--repeticiones", type=int, default=2000)
+    args = parser.parse_args()
+
+    # Los detectores loguean en INFO; no medir el logging
+    logging.disable(logging.INFO)
+    # Solo el matcher: sin búsqueda en el catálogo (ver encabezado)
+    sales_flow_v3.producto_mencionado = lambda mensaje: None
+
+    corpus = cargar_corpus_mongo() if args.mongo else CORPUS_EJEMPLO
+    repeticiones = max(1, args.repeticiones * len(CORPUS_EJEMPLO) // max(1, len(corpus)))
+    print(f"📊 Corpus: {len(corpus)} mensajes x {repeticiones} repeticiones\n")
+
+    casos = [
+        ("producto + pago + dirección", analizar_original, analizar_mensaje),
+        ("detectar_opcion_pago", opcion_pago_original, detectar_opcion_pago),
+    ]
+
+    for nombre, original, nuevo in casos:
+        t_original = medir(original, corpus, repeticiones)
+        t_nuevo = medir(nuevo, corpus, repeticiones)
+        distintos = [m for m in corpus if original(m) != nuevo(m)]
+
+        print(f"🔹 {nombre}")
+        print(f"   Anterior: {t_original:.2f} µs/mensaje")
+        print(f"   Matcher:  {t_nuevo:.2f} µs/mensaje ({t_original / t_nuevo:.1f}x)")
+        print(f"   Resultados distintos: {len(distintos)}/{len(corpus)}")
+        for m in distintos[:5]:
+            print(f"     - {m[:60]!r}: {original(m)} → {nuevo(m)}")
+        print()
@@ -0,0 +1,143 @@
+# ============================================================================
+# RUTA: backend/scripts/bench_serializacion.py
+# DESCRIPCIÓN: Micro-benchmark de serialización de respuestas
+#              (jsonable_encoder + json vs orjson con tipos BSON)
+# USO: python scripts/bench_serializacion.py [--productos 200] [--repeticiones 200]
+#      python scripts/bench_serializacion.py --mongo
+# ============================================================================
+#
+# Serializa el mismo cuerpo de respuesta (listado de productos / lead con
+# órdenes) de dos formas:
+#   anterior: jsonable_encoder + json.dumps (lo que hacía FastAPI con el
+#             dict del endpoint), sobre documentos con los _id ya
+#             convertidos a mano (la conversión no entra en la medición)
+#   orjson:   a_json() de config/serializacion.py, documentos tal cual
+# y reporta respuestas por segundo y MB/s de cada una.
+#
+# Con --mongo usa los productos reales de la colección productos; si no,
+# documentos de ejemplo con ObjectId y fechas.
+# ============================================================================
+
+import os
+import sys
+import json
+import time
+import copy
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from config.serializacion import a_json
+
+# ============================================================================
+# DATOS
+# ============================================================================
+
+def productos_de_ejemplo(n):
+    ahora = datetime.now()
+    return [
+        {
+            "_id": ObjectId(),
+            "nombre": f"Frigorífico industrial {i}",
+            "categoria": "refrigeracion",
+            "precio": 850.0 + i,
+            "caracteristicas": ["Acero inoxidable", "2 puertas", f"{400 + i} litros"],
+            "descripcion": "Ideal para restaurantes, cafeterías y minimarkets. " * 3,
+            "imagen": f"https://fresst.ec/img/{i}.jpg",
+            "activo": True,
+            "creado": ahora - timedelta(days=i)
+        }
+        for i in range(n)
+    ]
+
+def lead_con_ordenes(n):
+    id_lead = ObjectId()
+    return {
+        "_id": id_lead,
+        "nombre": "María Pérez",
+        "telefono": "+593991234567",
+        "timestamp": datetime.now(),
+        "ordenes": [
+            {"_id": ObjectId(), "id_lead": id_lead, "total": 120.5 * (i + 1), "fecha": datetime.now()}
+            for i in range(n)
+        ]
+    }
+
+def productos_mongo():
+    from config.database import connect_mongodb, close_mongodb, get_collection
+    connect_mongodb()
+    try:
+        return list(get_collection("productos").find())
+    finally:
+        close_mongodb()
+
+# ============================================================================
+# SERIALIZADORES
+# ============================================================================
+
+def _convertir_ids(documento):
+    """Conversión manual de los servicios: solo el _id de primer nivel"""
+    documento["_id"] = str(documento["_id"])
+    return documento
+
+def como_antes(cuerpo):
+    """Cuerpo como lo dejaban los servicios (se prepara fuera de la medición)"""
+    cuerpo = copy.deepcopy(cuerpo)
+    for documento in cuerpo.get("data", []):
+        _convertir_ids(documento)
+    if "ordenes" in cuerpo:
+        # ObjectId anidado (ordenes.id_lead): jsonable_encoder falla sin esto
+        _convertir_ids(cuerpo)
+        for orden in cuerpo["ordenes"]:
+            _convertir_ids(orden)
+            orden["id_lead"] = str(orden["id_lead"])
+    return cuerpo
+
+def serializar_anterior(cuerpo):
+    return json.dumps(jsonable_encoder(cuerpo), ensure_ascii=False).encode("utf-8")
+
+def serializar_orjson(cuerpo):
+    return a_json(cuerpo)
+
+# ============================================================================
+# MEDICIÓN
+# ============================================================================
+
+def medir(nombre, funcion, cuerpo, repeticiones):
+    tamano = len(funcion(cuerpo))
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion(cuerpo)
+    duracion = time.perf_counter() - inicio
+    por_segundo = repeticiones / duracion
+    print(f"   {nombre:<10} {por_segundo:>10.0f} resp/s   {tamano * por_segundo / 1e6:>8.1f} MB/s   ({tamano / 1024:.1f} KB)")
+    return por_segundo
+
+def comparar(titulo, cuerpo, repeticiones):
+    print(f"\n📦 {titulo}")
+    cuerpo_anterior = como_antes(cuerpo)
+    anterior = medir("anterior", serializar_anterior, cuerpo_anterior, repeticiones)
+    rapido = medir("orjson", serializar_orjson, cuerpo, repeticiones)
+    print(f"   ⚡ {rapido / anterior:.1f}x")
+
+    # Mismo contenido (ambos dan las fechas en ISO 8601)
+    if json.loads(serializar_anterior(cuerpo_anterior)) != json.loads(serializar_orjson(cuerpo)):
+        print("   ⚠️  Los cuerpos difieren: revisar tipos del documento")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serialización de respuestas: jsonable_encoder + json vs orjson")
+    parser.add_argument("--productos", type=int, default=200)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    parser.add_argument("--mongo", action="store_true", help="Usar los productos de MongoDB")
+    args = parser.parse_args()
+
+    productos = productos_mongo() if args.mongo else productos_de_ejemplo(args.productos)
+    comparar(
+        f"Listado de {len(productos)} productos",
+        {"success": True, "total": len(productos), "data": productos},
+        args.repeticiones
+    )
+    comparar("Lead con 20 órdenes (ObjectId anidados)", lead_con_ordenes(20), args.repeticiones * 10)
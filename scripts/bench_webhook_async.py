@@ -0,0 +1,305 @@
+# ============================================================================
+# RUTA: backend/scripts/bench_webhook_async.py
+# DESCRIPCIÓN: Benchmark de concurrencia del webhook (bloqueante vs async)
+# USO: python scripts/bench_webhook_async.py [--conversaciones 50]
+#      python scripts/bench_webhook_async.py --url http://localhost:8000
+# ============================================================================
+#
+# Modo local (por defecto): N conversaciones concurrentes por el
+# whatsapp_webhook real (idempotencia, coordinador, atender_mensaje, unidad
+# de trabajo) contra una base de datos de pruebas (MONGO_DB, por defecto
+# fresst_chatbot_pruebas) que se elimina al final. Lo externo se simula:
+#   MongoDB: cada operación espera --latencia-db ms antes de ir al servidor
+#            (RTT de Atlas)
+#   Gemini:  un modelo falso que tarda --latencia-llm ms en responder
+# y se corre dos veces:
+#   bloqueante: ejecutar_en_pool ejecuta en el mismo hilo y Gemini bloquea
+#               (como antes: PyMongo y generate_content dentro del event loop)
+#   async:      pool acotado real (ColeccionAsync / ejecutar_en_pool) y
+#               generate_content_async
+# Reporta throughput, latencia del webhook y el retraso del event loop
+# durante la carga. GEMINI_CONCURRENCIA y DB_ASYNC_WORKERS limitan el modo
+# async igual que en producción.
+#
+# Modo HTTP (--url): dispara N webhooks concurrentes contra un servidor real
+# y mide el tiempo total y la latencia de /health durante la carga.
+# ============================================================================
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+from urllib.parse import urlencode
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+# Nunca contra la base de producción; respuesta en el TwiML, sin cachés
+# que eviten la llamada a Gemini
+os.environ["MONGO_DB"] = os.getenv("MONGO_DB_PRUEBAS", "fresst_chatbot_pruebas")
+os.environ["WHATSAPP_MODO_RESPUESTA"] = "sincrono"
+os.environ["GEMINI_STREAMING"] = "false"
+os.environ["CACHE_RESPUESTAS"] = "false"
+os.environ["RESPUESTA_RAPIDA"] = "false"
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    idx = min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))
+    return valores[idx]
+
+# ============================================================================
+# MODO LOCAL: SIMULACIÓN DE MONGODB Y GEMINI
+# ============================================================================
+
+class ColeccionLenta:
+    """Colección PyMongo con --latencia-db antes de cada operación"""
+
+    def __init__(self, coleccion, latencia):
+        self.coleccion = coleccion
+        self.latencia = latencia
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self.coleccion, nombre)
+        if not callable(atributo):
+            return atributo
+
+        def con_latencia(*args, **kwargs):
+            time.sleep(self.latencia)
+            return atributo(*args, **kwargs)
+        return con_latencia
+
+class BaseLenta:
+    """Base de datos cuyas colecciones son ColeccionLenta"""
+
+    def __init__(self, db, latencia):
+        self.db = db
+        self.latencia = latencia
+
+    def __getitem__(self, nombre):
+        return ColeccionLenta(self.db[nombre], self.latencia)
+
+    def __getattr__(self, nombre):
+        return getattr(self.db, nombre)
+
+class RespuestaSimulada:
+    usage_metadata = None
+
+    def __init__(self, texto):
+        self.text = texto
+
+class ModeloSimulado:
+    """GenerativeModel falso: responde después de `latencia` segundos"""
+
+    latencia = 0.8
+    bloqueante = False
+    TEXTO = "¡Hola! Con gusto te ayudo a elegir el equipo para tu negocio. ¿Qué capacidad necesitas?"
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def generate_content(self, contenido, **kwargs):
+        time.sleep(self.latencia)
+        return RespuestaSimulada(self.TEXTO)
+
+    async def generate_content_async(self, contenido, **kwargs):
+        if self.bloqueante:
+            # Como la llamada síncrona de antes dentro del handler async
+            time.sleep(self.latencia)
+        else:
+            await asyncio.sleep(self.latencia)
+        return RespuestaSimulada(self.TEXTO)
+
+class EjecutorEnLinea(Executor):
+    """Executor que corre la función en el hilo que la envía (el event loop)"""
+
+    def submit(self, fn, *args, **kwargs):
+        futuro = Future()
+        try:
+            futuro.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            futuro.set_exception(e)
+        return futuro
+
+PRODUCTOS_EJEMPLO = [
+    {"nombre": "Hornos", "categoria": "coccion", "precio": 3500, "caracteristicas": "Industrial", "activo": True},
+    {"nombre": "Frigoríficos", "categoria": "refrigeracion", "precio": 2500, "caracteristicas": "800L", "activo": True},
+    {"nombre": "Vitrinas Horizontales", "categoria": "refrigeracion", "precio": 1800, "caracteristicas": "LED", "activo": True},
+]
+
+def preparar_base(latencia_db):
+    """Base de pruebas vacía, con índices y catálogo; colecciones con latencia"""
+    from config import database
+    from config.indices import aplicar_indices
+    from services.catalogo_cache import catalogo_cache
+
+    if isinstance(database.db, BaseLenta):
+        database.db = database.db.db
+    database.collections = {}
+
+    database.client.drop_database(database.MONGO_DB)
+    aplicar_indices()
+    database.get_collection("productos").insert_many([dict(p) for p in PRODUCTOS_EJEMPLO])
+
+    database.db = BaseLenta(database.db, latencia_db)
+    database.collections = {}
+    catalogo_cache.recargar()
+
+def _peticion_webhook(i, modo):
+    """Request de Twilio (form) para whatsapp_webhook, sin servidor HTTP"""
+    from starlette.requests import Request
+
+    cuerpo = urlencode({
+        "From": f"whatsapp:+5939{i:08d}",
+        "Body": f"Hola, estoy armando una panadería y quiero saber qué equipos me recomiendan (cliente {i})",
+        "MessageSid": f"SMBENCH{modo}{time.time_ns()}{i}"
+    }).encode("utf-8")
+
+    async def recibir():
+        return {"type": "http.request", "body": cuerpo, "more_body": False}
+
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/api/whatsapp/webhook",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/x-www-form-urlencoded")]
+    }, recibir)
+
+async def _sonda_event_loop(detener, latencias, intervalo=0.01):
+    """Retraso del loop: cuánto más de `intervalo` tarda en despertar (lo que espera /health)"""
+    while not detener.is_set():
+        inicio = time.perf_counter()
+        await asyncio.sleep(intervalo)
+        latencias.append((time.perf_counter() - inicio - intervalo) * 1000)
+
+async def _cargar(args, modo):
+    from routes.whatsapp_routes_v4 import whatsapp_webhook
+
+    async def _enviar(i):
+        inicio = time.perf_counter()
+        respuesta = await whatsapp_webhook(_peticion_webhook(i, modo))
+        return time.perf_counter() - inicio, b"Error en el servidor" in respuesta.body
+
+    detener = asyncio.Event()
+    latencias_loop = []
+    sonda = asyncio.create_task(_sonda_event_loop(detener, latencias_loop))
+
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(*[_enviar(i) for i in range(args.conversaciones)])
+    total = time.perf_counter() - inicio
+
+    detener.set()
+    await sonda
+    return total, resultados, latencias_loop
+
+def ejecutar_modo(args, modo):
+    from config import database
+    from config import gemini_config
+
+    bloqueante = modo == "bloqueante"
+    preparar_base(args.latencia_db / 1000)
+
+    if database.executor is not None:
+        database.executor.shutdown(wait=False)
+    database.executor = EjecutorEnLinea() if bloqueante else None   # None: get_executor() crea el pool
+    ModeloSimulado.bloqueante = bloqueante
+    gemini_config._semaforo_async = None   # el semáforo es del loop de cada corrida
+
+    total, resultados, latencias_loop = asyncio.run(_cargar(args, modo))
+
+    latencias = [segundos * 1000 for segundos, _ in resultados]
+    errores = sum(1 for _, error in resultados if error)
+    print(f"🔹 {modo}")
+    print(f"   Tiempo total:        {total:.2f}s")
+    print(f"   Throughput:          {args.conversaciones / total:.1f} msg/s")
+    print(f"   Webhook p50 / p99:   {statistics.median(latencias):.0f}ms / {_percentil(latencias, 99):.0f}ms")
+    print(f"   Retraso event loop:  p50 {_percentil(latencias_loop, 50):.1f}ms / máx {max(latencias_loop, default=0):.0f}ms "
+          f"({len(latencias_loop)} muestras)")
+    if errores:
+        print(f"   ❌ {errores} webhooks respondieron con error")
+    print()
+    return args.conversaciones / total
+
+def bench_local(args):
+    import google.generativeai as genai
+    from config import database
+    from config import gemini_config
+
+    logging.disable(logging.WARNING)
+
+    # Gemini simulado: ningún modelo real construido antes
+    ModeloSimulado.latencia = args.latencia_llm / 1000
+    genai.GenerativeModel = ModeloSimulado
+    gemini_config.SOPORTA_CONTEXT_CACHE = False
+    gemini_config._modelos.clear()
+
+    print(f"🧪 Base de datos de pruebas: {database.MONGO_DB}")
+    print(f"📊 {args.conversaciones} conversaciones concurrentes por whatsapp_webhook")
+    print(f"   MongoDB: +{args.latencia_db}ms por operación | Gemini: {args.latencia_llm}ms")
+    print(f"   Pool: {database.DB_ASYNC_WORKERS} hilos | GEMINI_CONCURRENCIA: {gemini_config.GEMINI_CONCURRENCIA}\n")
+
+    try:
+        database.connect_mongodb()
+        antes = ejecutar_modo(args, "bloqueante")
+        despues = ejecutar_modo(args, "async")
+        print(f"⚡ async / bloqueante: {despues / antes:.1f}x")
+    finally:
+        if database.client:
+            database.client.drop_database(database.MONGO_DB)
+        database.close_mongodb()
+
+# ============================================================================
+# MODO HTTP
+# ============================================================================
+
+def bench_http(args):
+    import requests
+
+    url_webhook = f"{args.url.rstrip('/')}/api/whatsapp/webhook"
+    url_health = f"{args.url.rstrip('/')}/health"
+
+    def _enviar(i):
+        inicio = time.perf_counter()
+        requests.post(url_webhook, data={
+            "From": f"whatsapp:+5939{i:08d}",
+            "Body": "Hola, ¿cuánto cuesta el horno?",
+            "MessageSid": f"SMBENCH{time.time_ns()}{i}"
+        }, timeout=120)
+        return time.perf_counter() - inicio
+
+    print(f"📊 {args.conversaciones} webhooks concurrentes contra {url_webhook}\n")
+
+    latencias_health = []
+    with ThreadPoolExecutor(max_workers=args.conversaciones + 1) as pool:
+        inicio = time.perf_counter()
+        futuros = [pool.submit(_enviar, i) for i in range(args.conversaciones)]
+        while not all(f.done() for f in futuros):
+            t0 = time.perf_counter()
+            requests.get(url_health, timeout=120)
+            latencias_health.append((time.perf_counter() - t0) * 1000)
+        total = time.perf_counter() - inicio
+        latencias = [f.result() * 1000 for f in futuros]
+
+    print(f"   Tiempo total:       {total:.2f}s")
+    print(f"   Webhook p50 / p99:  {statistics.median(latencias):.0f}ms / {_percentil(latencias, 99):.0f}ms")
+    print(f"   /health p50 / p99:  {_percentil(latencias_health, 50):.0f}ms / {_percentil(latencias_health, 99):.0f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de concurrencia del webhook")
+    parser.add_argument("--conversaciones", type=int, default=50)
+    parser.add_argument("--latencia-db", type=float, default=5, help="ms agregados a cada operación MongoDB")
+    parser.add_argument("--latencia-llm", type=float, default=800, help="ms por llamada a Gemini")
+    parser.add_argument("--url", help="Servidor real (modo HTTP)")
+    args = parser.parse_args()
+
+    if args.url:
+        bench_http(args)
+    else:
+        bench_local(args)
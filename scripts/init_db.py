@@ -7,14 +7,16 @@
 import os
 import sys
 from datetime import datetime
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 # Cargar variables de entorno
 load_dotenv()
 
-MONGO_URI = os.getenv("MONGO_URI")
+# Mismo cliente y pool que la app (config/database.py)
+from config.database import MONGO_URI, connect_mongodb, close_mongodb
+from config.indices import aplicar_indices, indices_registrados
 
 if not MONGO_URI:
     print("❌ Error: MONGO_URI no está configurado en .env")
@@ -23,13 +25,9 @@ if not MONGO_URI:
 print(f"📌 Conectando a MongoDB...")
 
 try:
-    # Conectar con ServerApi
-    client = MongoClient(MONGO_URI, server_api=ServerApi('1'))
-    client.admin.command('ping')
+    db = connect_mongodb()
     print("✅ Pinged your deployment. You successfully connected to MongoDB!")
     
-    db = client["fresst_chatbot"]
-    
     # ===== 1. CREAR COLECCIÓN: cuentas_bancarias =====
     print("\n📝 Creando: cuentas_bancarias")
     
@@ -198,7 +196,7 @@ try:
     # ===== 3. CREAR COLECCIONES VACÍAS =====
     print("\n📝 Creando colecciones vacías:")
     
-    for coleccion in ["leads", "ordenes", "conversaciones_whatsapp"]:
+    for coleccion in ["leads", "ordenes", "conversaciones_whatsapp", "mensajes_whatsapp"]:
         if coleccion not in db.list_collection_names():
             db.create_collection(coleccion)
             print(f"   ✅ {coleccion}")
@@ -208,15 +206,11 @@ try:
     # ===== 4. CREAR ÍNDICES =====
     print("\n📝 Creando índices:")
     
-    db["leads"].create_index("telefono")
-    print("   ✅ leads.telefono")
-    
-    db["ordenes"].create_index("id_lead")
-    db["ordenes"].create_index("estado")
-    print("   ✅ ordenes (id_lead, estado)")
-    
-    db["conversaciones_whatsapp"].create_index("id_lead")
-    print("   ✅ conversaciones_whatsapp.id_lead")
+    # Declarados junto a cada servicio (config/indices.py)
+    resultado = aplicar_indices()
+    for indice in indices_registrados():
+        estado = "❌" if repr(indice) in resultado["errores"] else "✅"
+        print(f"   {estado} {indice!r}")
     
     # ===== RESUMEN =====
     print("\n" + "="*60)
@@ -232,7 +226,7 @@ try:
     print("\n✨ MongoDB está listo para usar!")
     print("   Ejecuta: python main.py")
     
-    client.close()
+    close_mongodb()
 
 except Exception as e:
     print(f"\n❌ Error: {e}")
@@ -0,0 +1,73 @@
+# ============================================================================
+# RUTA: backend/scripts/migrar_codigos_entrega.py
+# DESCRIPCIÓN: Corrige códigos de entrega duplicados y crea el índice único
+# USO: python scripts/migrar_codigos_entrega.py [--dry-run]
+# ============================================================================
+#
+# Con count_documents() + 1 dos órdenes simultáneas podían recibir el mismo
+# FRES-YYYY-NNNNNN. Para cada código repetido se conserva la orden más
+# antigua y las demás reciben un código nuevo de la secuencia atómica
+# (también en leads.pago_info si lo tenía). Después se crea el índice único
+# ordenes.codigo_entrega.
+# ============================================================================
+
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from config.database import connect_mongodb, get_collection, close_mongodb
+from services.secuencia_service import siguiente_codigo_entrega, asegurar_indices
+
+def migrar(dry_run=False):
+    ord_col = get_collection("ordenes")
+    leads_col = get_collection("leads")
+
+    duplicados = list(ord_col.aggregate([
+        {"$match": {"codigo_entrega": {"$type": "string"}}},
+        {"$sort": {"fecha_orden": 1, "_id": 1}},
+        {"$group": {"_id": "$codigo_entrega", "ordenes": {"$push": {"_id": "$_id", "id_lead": "$id_lead"}}}},
+        {"$match": {"ordenes.1": {"$exists": True}}}
+    ]))
+
+    corregidas = 0
+    for grupo in duplicados:
+        codigo = grupo["_id"]
+        # La primera (más antigua) conserva su código
+        for orden in grupo["ordenes"][1:]:
+            nuevo = "(nuevo)" if dry_run else siguiente_codigo_entrega()
+            print(f"   🔁 {orden['_id']}: {codigo} → {nuevo}")
+
+            if not dry_run:
+                ord_col.update_one({"_id": orden["_id"]}, {"$set": {"codigo_entrega": nuevo}})
+                leads_col.update_one(
+                    {"_id": orden["id_lead"], "pago_info.codigo_entrega": codigo},
+                    {"$set": {"pago_info.codigo_entrega": nuevo}}
+                )
+            corregidas += 1
+
+    print(f"\n✅ {len(duplicados)} códigos repetidos, {corregidas} órdenes con código nuevo")
+
+    if dry_run:
+        print("⚠️  Dry run: no se modificó nada")
+        return
+
+    asegurar_indices()
+    print("✅ Índice único ordenes.codigo_entrega creado")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Corrige códigos de entrega duplicados")
+    parser.add_argument("--dry-run", action="store_true", help="Solo mostrar lo que se haría")
+    args = parser.parse_args()
+
+    try:
+        connect_mongodb()
+        migrar(dry_run=args.dry_run)
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        sys.exit(1)
+    finally:
+        close_mongodb()
@@ -0,0 +1,64 @@
+# ============================================================================
+# RUTA: backend/scripts/migrar_conversaciones.py
+# DESCRIPCIÓN: Migra conversaciones_whatsapp.mensajes (array) a buckets
+# USO: python scripts/migrar_conversaciones.py [--dry-run]
+# ============================================================================
+#
+# Para cada conversación con el array `mensajes` (formato anterior):
+#   - escribe los mensajes en mensajes_whatsapp en buckets de BUCKET_SIZE
+#   - deja en la cabecera total_mensajes y elimina el array
+# Es idempotente: las conversaciones ya migradas no tienen `mensajes`.
+# ============================================================================
+
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from config.database import connect_mongodb, get_collection, close_mongodb
+from services.historial_service import BUCKET_SIZE, reescribir_historial, obtener_todos_los_mensajes
+
+def migrar(dry_run=False):
+    conv_col = get_collection("conversaciones_whatsapp")
+    buckets_col = get_collection("mensajes_whatsapp")
+
+    buckets_col.create_index([("id_lead", 1), ("bucket", 1)], unique=True)
+
+    pendientes = [c["_id"] for c in conv_col.find({"mensajes": {"$exists": True}}, {"_id": 1})]
+    migradas = total_mensajes = 0
+
+    for id_conv in pendientes:
+        conv = conv_col.find_one({"_id": id_conv}, {"id_lead": 1, "mensajes": 1})
+        id_lead = conv["id_lead"]
+        # Mensajes ya escritos en buckets por el código nuevo antes de migrar
+        mensajes = conv.get("mensajes", []) + obtener_todos_los_mensajes(id_lead)
+        n_buckets = -(-len(mensajes) // BUCKET_SIZE)
+
+        print(f"   📦 {id_lead}: {len(mensajes)} mensajes → {n_buckets} buckets")
+
+        if not dry_run:
+            reescribir_historial(id_lead, mensajes)
+
+        migradas += 1
+        total_mensajes += len(mensajes)
+
+    print(f"\n✅ {migradas} conversaciones, {total_mensajes} mensajes (bucket de {BUCKET_SIZE})")
+    if dry_run:
+        print("⚠️  Dry run: no se modificó nada")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra el historial de WhatsApp a buckets")
+    parser.add_argument("--dry-run", action="store_true", help="Solo mostrar lo que se haría")
+    args = parser.parse_args()
+
+    try:
+        connect_mongodb()
+        migrar(dry_run=args.dry_run)
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        sys.exit(1)
+    finally:
+        close_mongodb()
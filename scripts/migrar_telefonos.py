@@ -0,0 +1,146 @@
+# ============================================================================
+# RUTA: backend/scripts/migrar_telefonos.py
+# DESCRIPCIÓN: Backfill de leads.telefono_canonico + fusión de duplicados
+# USO: python scripts/migrar_telefonos.py [--dry-run]
+#      (ejecutar UNA vez al desplegar la clave canónica de teléfono)
+# ============================================================================
+#
+# 1. Calcula la clave E.164 de cada lead (services/telefono_service).
+# 2. Agrupa los leads con la misma clave (duplicados creados por la carrera
+#    buscar-luego-insertar o por formatos distintos del mismo número).
+# 3. Conserva el lead más antiguo, le completa los campos vacíos con los de
+#    los duplicados, mueve sus órdenes y conversaciones y borra el resto.
+# 4. Crea el índice único leads.telefono_canonico.
+# ============================================================================
+
+import os
+import sys
+import argparse
+from collections import defaultdict
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from config.database import connect_mongodb, get_collection, close_mongodb
+from services.telefono_service import normalizar_telefono
+from services.historial_service import obtener_todos_los_mensajes, reescribir_historial
+
+CAMPOS_FUSIONABLES = ["nombre", "email", "direccion_entrega", "pago_info"]
+
+def _vacio(campo, valor):
+    if campo == "nombre":
+        return not valor or not str(valor).strip() or valor == "Cliente"
+    return not valor
+
+def _antiguedad(lead):
+    return lead.get("fecha_creacion") or lead["_id"].generation_time.replace(tzinfo=None)
+
+def _fusionar_campos(principal, duplicados):
+    """Campos vacíos del principal que se completan con el duplicado más reciente"""
+    cambios = {}
+    for campo in CAMPOS_FUSIONABLES:
+        if not _vacio(campo, principal.get(campo)):
+            continue
+        for dup in reversed(duplicados):
+            if not _vacio(campo, dup.get(campo)):
+                cambios[campo] = dup[campo]
+                break
+    if any(d.get("estado_compra") == "cliente" for d in duplicados):
+        cambios["estado_compra"] = "cliente"
+    return cambios
+
+def _mover_conversacion(id_origen, id_destino):
+    """Une el historial del lead duplicado en la conversación del principal"""
+    conv_col = get_collection("conversaciones_whatsapp")
+    conv_dup = conv_col.find_one({"id_lead": id_origen}) or {}
+    conv_destino = conv_col.find_one({"id_lead": id_destino}) or {}
+
+    # Incluye el formato antiguo (array `mensajes` en la cabecera) por si
+    # migrar_conversaciones.py todavía no se ejecutó
+    mensajes_dup = conv_dup.get("mensajes", []) + obtener_todos_los_mensajes(id_origen)
+    if not conv_dup and not mensajes_dup:
+        return 0
+
+    mensajes = sorted(
+        conv_destino.get("mensajes", []) + obtener_todos_los_mensajes(id_destino) + mensajes_dup,
+        key=lambda m: m.get("timestamp")
+    )
+    if conv_dup:
+        conv_col.update_one(
+            {"id_lead": id_destino},
+            {"$setOnInsert": {
+                "numero_cliente": conv_dup.get("numero_cliente"),
+                "nombre_cliente": conv_dup.get("nombre_cliente")
+            }},
+            upsert=True
+        )
+        conv_col.delete_one({"_id": conv_dup["_id"]})
+    reescribir_historial(id_destino, mensajes)
+    get_collection("mensajes_whatsapp").delete_many({"id_lead": id_origen})
+    return len(mensajes_dup)
+
+def migrar(dry_run=False):
+    leads_col = get_collection("leads")
+    ordenes_col = get_collection("ordenes")
+
+    grupos = defaultdict(list)
+    sin_telefono = 0
+    for lead in leads_col.find({}):
+        canonico = normalizar_telefono(lead.get("telefono") or "")
+        if not canonico:
+            sin_telefono += 1
+            continue
+        grupos[canonico].append(lead)
+
+    print(f"📊 {sum(len(g) for g in grupos.values())} leads, {len(grupos)} teléfonos únicos, {sin_telefono} sin teléfono")
+
+    actualizados = fusionados = 0
+    for canonico, grupo in grupos.items():
+        grupo.sort(key=_antiguedad)
+        principal, duplicados = grupo[0], grupo[1:]
+
+        cambios = {"telefono": canonico, "telefono_canonico": canonico}
+        cambios.update(_fusionar_campos(principal, duplicados))
+
+        if duplicados:
+            print(f"   🔀 {canonico}: conservar {principal['_id']}, fusionar {[str(d['_id']) for d in duplicados]}")
+
+        if dry_run:
+            continue
+
+        for dup in duplicados:
+            ordenes = ordenes_col.update_many(
+                {"id_lead": dup["_id"]},
+                {"$set": {"id_lead": principal["_id"]}}
+            ).modified_count
+            mensajes = _mover_conversacion(str(dup["_id"]), str(principal["_id"]))
+            leads_col.delete_one({"_id": dup["_id"]})
+            print(f"      ✅ {dup['_id']}: {ordenes} órdenes, {mensajes} mensajes movidos")
+            fusionados += 1
+
+        leads_col.update_one({"_id": principal["_id"]}, {"$set": cambios})
+        actualizados += 1
+
+    if dry_run:
+        print("\n⚠️  Dry run: no se modificó nada")
+        return
+
+    # sparse: los leads sin teléfono no tienen clave y no deben chocar entre sí
+    leads_col.create_index("telefono_canonico", unique=True, sparse=True)
+    print(f"\n✅ {actualizados} leads actualizados, {fusionados} duplicados fusionados")
+    print("✅ Índice único leads.telefono_canonico creado")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill de teléfonos canónicos en leads")
+    parser.add_argument("--dry-run", action="store_true", help="Solo mostrar lo que se haría")
+    args = parser.parse_args()
+
+    try:
+        connect_mongodb()
+        migrar(dry_run=args.dry_run)
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        sys.exit(1)
+    finally:
+        close_mongodb()
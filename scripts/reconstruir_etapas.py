@@ -0,0 +1,79 @@
+# ============================================================================
+# RUTA: backend/scripts/reconstruir_etapas.py
+# DESCRIPCIÓN: Replay de historiales → estado_venta (máquina de estados)
+# USO: python scripts/reconstruir_etapas.py [--verificar]
+# ============================================================================
+#
+# Para cada conversación reproduce el historial mensaje a mensaje con
+# avanzar_etapa() y compara el resultado con el detector original
+# (detectar_etapa_historial, que escanea todo el texto). Si coinciden,
+# guarda estado_venta en la cabecera. Con --verificar solo compara.
+# ============================================================================
+
+import os
+import sys
+import argparse
+from collections import Counter
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from config.database import connect_mongodb, get_collection, close_mongodb
+from services.historial_service import obtener_todos_los_mensajes
+from services.sales_flow_v3 import reconstruir_estado_venta, detectar_etapa_historial
+
+def reconstruir(verificar=False):
+    conv_col = get_collection("conversaciones_whatsapp")
+
+    etapas = Counter()
+    diferencias = 0
+    guardadas = 0
+
+    for conv in conv_col.find({}, {"id_lead": 1, "mensajes": 1}):
+        id_lead = conv["id_lead"]
+        # Formato anterior (array en la cabecera) + buckets
+        mensajes = conv.get("mensajes", []) + obtener_todos_los_mensajes(id_lead)
+
+        estado = reconstruir_estado_venta(mensajes)
+        esperado = detectar_etapa_historial(mensajes)
+        etapas[estado["etapa"]] += 1
+
+        if estado["etapa"] != esperado:
+            diferencias += 1
+            print(f"   ❌ {id_lead}: replay={estado['etapa']} detector={esperado} ({len(mensajes)} mensajes)")
+            continue
+
+        if not verificar:
+            conv_col.update_one({"_id": conv["_id"]}, {"$set": {"estado_venta": estado}})
+            guardadas += 1
+
+    print("\n📊 Etapas:")
+    for etapa, n in etapas.most_common():
+        print(f"   - {etapa}: {n}")
+
+    if diferencias:
+        print(f"\n❌ {diferencias} conversaciones no coinciden con el detector")
+    else:
+        print("\n✅ El replay coincide con el detector en todas las conversaciones")
+
+    if not verificar:
+        print(f"✅ {guardadas} estados guardados")
+
+    return diferencias
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstruye estado_venta desde el historial")
+    parser.add_argument("--verificar", action="store_true", help="Solo comparar, no guardar")
+    args = parser.parse_args()
+
+    try:
+        connect_mongodb()
+        diferencias = reconstruir(verificar=args.verificar)
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        sys.exit(1)
+    finally:
+        close_mongodb()
+
+    sys.exit(1 if diferencias else 0)
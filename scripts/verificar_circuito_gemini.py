@@ -0,0 +1,100 @@
+# ============================================================================
+# RUTA: backend/scripts/verificar_circuito_gemini.py
+# DESCRIPCIÓN: Prueba del circuit breaker de Gemini con llamadas canceladas
+# USO: python scripts/verificar_circuito_gemini.py
+# ============================================================================
+#
+# Con el circuito semiabierto, la llamada de prueba se cancela a mitad:
+#   1. get_gemini_response_async cancelada (webhook cancelado, cliente que
+#      se desconecta) → CancelledError
+#   2. stream_gemini_response_async que el consumidor deja de iterar
+#      → GeneratorExit
+# En ambos casos la siguiente llamada debe poder ser la nueva prueba (antes
+# el circuito quedaba cortocircuitado hasta reiniciar el proceso). Gemini se
+# simula: no necesita GOOGLE_API_KEY ni red.
+# ============================================================================
+
+import os
+import sys
+import asyncio
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import google.generativeai as genai
+from config import gemini_config
+from config.gemini_config import (
+    GEMINI_MODELO,
+    CircuitoGemini,
+    get_gemini_response_async,
+    stream_gemini_response_async
+)
+
+class _Fragmento:
+    text = "Hola"
+
+class _StreamLento:
+    usage_metadata = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(0.05)
+        return _Fragmento()
+
+class ModeloLento:
+    """GenerativeModel falso: no responde antes de que lo cancelen"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def generate_content_async(self, contenido, stream=False, **kwargs):
+        if stream:
+            return _StreamLento()
+        await asyncio.sleep(60)
+
+def circuito_semiabierto():
+    """Circuito del modelo principal abierto con el enfriamiento ya cumplido"""
+    circuito = CircuitoGemini(GEMINI_MODELO, enfriamiento=30)
+    for _ in range(circuito.fallos_max):
+        circuito.fallo("servidor")
+    circuito.abierto_desde -= circuito.enfriamiento
+    gemini_config._circuitos[GEMINI_MODELO] = circuito
+    return circuito
+
+async def prueba_cancelada():
+    circuito = circuito_semiabierto()
+    tarea = asyncio.create_task(get_gemini_response_async("hola"))
+    await asyncio.sleep(0.1)
+    if circuito.permitir():
+        print("❌ La prueba no quedó tomada mientras estaba en curso")
+        return False
+    tarea.cancel()
+    try:
+        await tarea
+    except asyncio.CancelledError:
+        pass
+    return circuito.permitir()
+
+async def stream_abandonado():
+    circuito = circuito_semiabierto()
+    stream = stream_gemini_response_async("hola")
+    await stream.__anext__()
+    await stream.aclose()   # el consumidor deja de iterar
+    return circuito.permitir()
+
+async def verificar():
+    genai.GenerativeModel = ModeloLento
+    gemini_config._modelos.clear()
+
+    ok = True
+    for nombre, prueba in [("llamada cancelada", prueba_cancelada), ("stream abandonado", stream_abandonado)]:
+        permitido = await prueba()
+        print(f"{'✅' if permitido else '❌'} {nombre}: la siguiente llamada {'' if permitido else 'NO '}es la nueva prueba")
+        ok = ok and permitido
+    return ok
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    sys.exit(0 if asyncio.run(verificar()) else 1)
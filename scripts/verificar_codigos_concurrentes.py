@@ -0,0 +1,97 @@
+# ============================================================================
+# RUTA: backend/scripts/verificar_codigos_concurrentes.py
+# DESCRIPCIÓN: Prueba de concurrencia de códigos de entrega (secuencia atómica)
+# USO: python scripts/verificar_codigos_concurrentes.py [--ordenes 500] [--procesos 4]
+# ============================================================================
+#
+# Crea cientos de órdenes en paralelo (varios procesos, como varios workers
+# de uvicorn, y varios hilos por proceso) y comprueba que todos los códigos
+# FRES-YYYY-NNNNNN son distintos. Trabaja sobre una base de datos de pruebas
+# (MONGO_DB, por defecto fresst_chatbot_pruebas) que se elimina al final.
+# ============================================================================
+
+import os
+import sys
+import time
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import Counter
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+# Nunca contra la base de producción
+os.environ["MONGO_DB"] = os.getenv("MONGO_DB_PRUEBAS", "fresst_chatbot_pruebas")
+
+from bson import ObjectId
+from config import database
+from config.database import connect_mongodb, get_db, close_mongodb, MONGO_DB
+from services.secuencia_service import asegurar_indices
+from services.orden_service_v3 import crear_orden_presencial
+
+def crear_ordenes(cantidad, hilos):
+    """Un proceso: `cantidad` órdenes repartidas en `hilos` hilos"""
+    logging.disable(logging.INFO)
+    connect_mongodb()
+    try:
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            resultados = list(pool.map(
+                lambda _: crear_orden_presencial(str(ObjectId()), "Hornos", 1, 3500),
+                range(cantidad)
+            ))
+        return [r.get("codigo") if r["success"] else None for r in resultados]
+    finally:
+        close_mongodb()
+
+def verificar(ordenes, procesos, hilos):
+    por_proceso = [ordenes // procesos + (1 if i < ordenes % procesos else 0) for i in range(procesos)]
+
+    inicio = time.perf_counter()
+    # spawn: cada proceso abre su propio MongoClient (no heredar el del padre)
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as pool:
+        codigos = [c for lote in pool.map(crear_ordenes, por_proceso, [hilos] * procesos) for c in lote]
+    segundos = time.perf_counter() - inicio
+
+    fallidas = codigos.count(None)
+    repetidos = {c: n for c, n in Counter(c for c in codigos if c).items() if n > 1}
+    en_bd = get_db()["ordenes"].count_documents({})
+
+    print(f"📊 {ordenes} órdenes, {procesos} procesos x {hilos} hilos en {segundos:.2f}s")
+    print(f"   Códigos: {min(c for c in codigos if c)} … {max(c for c in codigos if c)}")
+    print(f"   Órdenes en BD: {en_bd}")
+
+    ok = not fallidas and not repetidos and en_bd == ordenes
+    if fallidas:
+        print(f"❌ {fallidas} órdenes fallaron")
+    if repetidos:
+        print(f"❌ {len(repetidos)} códigos repetidos: {list(repetidos)[:5]}")
+    if ok:
+        print("✅ Todos los códigos son únicos")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de concurrencia de códigos de entrega")
+    parser.add_argument("--ordenes", type=int, default=500)
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--hilos", type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"🧪 Base de datos de pruebas: {MONGO_DB}")
+    ok = False
+    try:
+        connect_mongodb()
+        get_db().client.drop_database(MONGO_DB)
+        asegurar_indices()
+        ok = verificar(args.ordenes, args.procesos, args.hilos)
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+    finally:
+        if database.client:
+            database.client.drop_database(MONGO_DB)
+        close_mongodb()
+
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,54 @@
+# ============================================================================
+# RUTA: backend/scripts/verificar_indices.py
+# DESCRIPCIÓN: Verifica que ninguna consulta de los servicios haga COLLSCAN
+# USO: python scripts/verificar_indices.py [--aplicar]
+#      (exit 1 si alguna consulta registrada recorre la colección entera)
+# ============================================================================
+#
+# Corre explain() sobre cada consulta registrada en config/indices.py (cada
+# servicio declara las suyas junto a sus índices). Con --aplicar crea antes
+# los índices registrados, como hace la app al arrancar.
+# ============================================================================
+
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from config.database import connect_mongodb, close_mongodb
+from config.indices import aplicar_indices, verificar_consultas
+
+def verificar(aplicar=False):
+    if aplicar:
+        resultado = aplicar_indices()
+        print(f"📝 {resultado['indices'] - len(resultado['errores'])}/{resultado['indices']} índices asegurados")
+        for indice, error in resultado["errores"].items():
+            print(f"   ❌ {indice}: {error}")
+
+    resultado = verificar_consultas()
+    print(f"\n🔎 {resultado['consultas']} consultas verificadas")
+    for consulta in resultado["collscan"]:
+        print(f"   ❌ COLLSCAN {consulta['coleccion']}: {consulta['descripcion']} ({' → '.join(consulta['etapas'])})")
+
+    if resultado["success"]:
+        print("✅ Todas las consultas usan índice")
+    return resultado["success"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="explain() de las consultas registradas")
+    parser.add_argument("--aplicar", action="store_true", help="Crear antes los índices registrados")
+    args = parser.parse_args()
+
+    ok = False
+    try:
+        connect_mongodb()
+        ok = verificar(aplicar=args.aplicar)
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+    finally:
+        close_mongodb()
+
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,73 @@
+# ============================================================================
+# RUTA: backend/scripts/verificar_stream_gemini.py
+# DESCRIPCIÓN: Prueba de que el streaming no ocupa un turno de Gemini de más
+# USO: python scripts/verificar_stream_gemini.py
+# ============================================================================
+#
+# stream_gemini_response_async con un consumidor lento (como el envío REST
+# de cada parte a Twilio): una vez que Gemini terminó de generar, el turno
+# de GEMINI_CONCURRENCIA debe quedar libre aunque el consumidor no haya
+# terminado de iterar. Antes el semáforo se retenía durante cada `yield`.
+# Gemini se simula: no necesita GOOGLE_API_KEY ni red.
+# ============================================================================
+
+import os
+import sys
+import asyncio
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import google.generativeai as genai
+from config import gemini_config
+from config.gemini_config import GEMINI_CONCURRENCIA, stream_gemini_response_async
+
+class _Fragmento:
+
+    def __init__(self, texto):
+        self.text = texto
+
+class _StreamCorto:
+    usage_metadata = None
+
+    def __init__(self):
+        self.enviados = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.enviados == 3:
+            raise StopAsyncIteration
+        self.enviados += 1
+        await asyncio.sleep(0.01)
+        return _Fragmento(f"Parte {self.enviados}. ")
+
+class ModeloStream:
+    """GenerativeModel falso: tres fragmentos en ~30 ms"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def generate_content_async(self, contenido, stream=False, **kwargs):
+        return _StreamCorto()
+
+async def verificar():
+    genai.GenerativeModel = ModeloStream
+    gemini_config._modelos.clear()
+    gemini_config._semaforo_async = None
+
+    stream = stream_gemini_response_async("hola")
+    partes = [await stream.__anext__()]
+    await asyncio.sleep(0.2)   # el consumidor envía la primera parte
+    libres = gemini_config._semaforo()._value
+    partes += [parte async for parte in stream]
+
+    ok = libres == GEMINI_CONCURRENCIA and len(partes) == 3
+    print(f"{'✅' if ok else '❌'} Turnos libres con el consumidor ocupado: {libres} de {GEMINI_CONCURRENCIA} "
+          f"({len(partes)} fragmentos)")
+    return ok
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    sys.exit(0 if asyncio.run(verificar()) else 1)
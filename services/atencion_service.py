@@ -0,0 +1,245 @@
+# ============================================================================
+# RUTA: backend/services/atencion_service.py
+# DESCRIPCIÓN: Atender un mensaje entrante de WhatsApp de principio a fin
+# USO: atender_mensaje(numero, texto) → respuesta de Kliofer (ya guardada)
+# ============================================================================
+#
+# Lo usan el webhook (modo síncrono: la respuesta va en el TwiML) y los
+# workers de la cola de respuestas (modo asíncrono: se envía por REST).
+#
+# Con GEMINI_STREAMING la respuesta se envía por REST mientras se genera
+# (primera frase apenas está lista, luego el resto). "pendiente" es lo que
+# el llamador todavía debe entregar: la respuesta completa sin streaming,
+# "" si el streaming ya envió todo, o el resto si un envío REST falló.
+# Si después de enviar algo el mensaje falla (no se pudo guardar), la
+# respuesta queda registrada por MessageSid: el reintento solo guarda el
+# estado, sin volver a llamar a Gemini ni responder dos veces.
+# ============================================================================
+
+import logging
+from datetime import datetime
+from services.lead_service import crear_lead
+from services.chat_service_v3 import procesar_mensaje_async, procesar_mensaje_stream_async
+from services.whatsapp_service import send_whatsapp_message
+from config.gemini_config import GEMINI_STREAMING
+from services.sales_flow_v3 import analizar_mensaje, obtener_precio_producto, avanzar_etapa, cargar_estado_venta
+from services.orden_service_v3 import construir_orden, construir_pago_info
+from services.contexto_service import ConversationContext, cargar_contexto
+from services.unidad_trabajo import UnidadDeTrabajo
+from services.resumen_service import resumidor
+from services.idempotencia_service import guardar_respuesta_entregada, respuesta_entregada
+from config.database import ejecutar_en_pool
+
+logger = logging.getLogger(__name__)
+
+RESPUESTA_ERROR_SERVIDOR = "Error en el servidor"
+
+async def _enviar_parte(numero, texto):
+    """Envía una parte de la respuesta por REST; True si Twilio la aceptó"""
+    envio = await ejecutar_en_pool(send_whatsapp_message, numero, texto)
+    return envio.get("success", False)
+
+async def _no_guardado(message_sid, id_lead, error, respuesta, pendiente, origen):
+    """
+    Resultado de un mensaje que no se pudo guardar. Si el streaming ya
+    entregó parte de la respuesta, se recuerda para el reintento
+    """
+    if message_sid and pendiente != respuesta:
+        await guardar_respuesta_entregada(
+            message_sid, {"respuesta": respuesta, "pendiente": pendiente, "origen": origen}
+        )
+    return {"success": False, "id_lead": id_lead, "error": error}
+
+async def atender_mensaje(from_number, mensaje_usuario, mensajes_cliente=None, message_sid=None):
+    """
+    Carga el contexto, genera la respuesta, registra órdenes y guarda todo
+    
+    Args:
+        from_number: número del cliente (sin "whatsapp:")
+        mensaje_usuario: texto recibido (el que ve Gemini)
+        mensajes_cliente: mensajes a guardar en el historial si son varios
+                          agrupados en mensaje_usuario (por defecto, él mismo)
+        message_sid: MessageSid de Twilio; el reintento del mismo mensaje
+                     no duplica historial ni órdenes ya guardados
+    
+    Returns:
+        {"success", "id_lead", "respuesta", "pendiente", "origen", "orden"}
+        {"success": False, "error"} si no se pudo guardar (la respuesta no
+        se entrega: el reintento la recalcula, salvo que el streaming ya
+        hubiera enviado parte; entonces el reintento reutiliza esa)
+    """
+    # ════════════════════════════════════════════════════════════════
+    # PASO 1: CARGAR CONTEXTO (lead + historial en 1 consulta)
+    # ════════════════════════════════════════════════════════════════
+    
+    logger.debug("[ATENCION] 🔍 Cargando contexto del lead...")
+    
+    contexto = await cargar_contexto(from_number)
+    
+    if contexto is not None:
+        logger.debug("[ATENCION] ✅ Lead encontrado: %s", contexto.nombre_cliente)
+        logger.debug("[ATENCION] 📧 Email: %s", contexto.lead.get("email", ""))
+    else:
+        # LEAD NUEVO - Crear
+        logger.info("[ATENCION] 🆕 Lead nuevo, creando...")
+        resultado_crear = await ejecutar_en_pool(
+            crear_lead,
+            nombre="Cliente",
+            telefono=from_number,
+            email=None,
+            direccion=None
+        )
+    
+        if resultado_crear.get("success"):
+            contexto = ConversationContext(lead={"_id": resultado_crear["id"], **resultado_crear["data"]})
+            logger.info("[ATENCION] ✅ Lead creado: %s", contexto.id_lead)
+        else:
+            logger.error("[ATENCION] ❌ Error creando lead")
+            return {"success": False, "error": resultado_crear.get("error"), "respuesta": RESPUESTA_ERROR_SERVIDOR}
+    
+    id_lead = contexto.id_lead
+    nombre_cliente = contexto.nombre_cliente
+    
+    # ════════════════════════════════════════════════════════════════
+    # PASO 2: PROCESAR MENSAJE CON CHAT INTELIGENTE
+    # ════════════════════════════════════════════════════════════════
+    
+    logger.debug("[ATENCION] 🤖 Procesando mensaje como: %s...", nombre_cliente)
+    entregada = await respuesta_entregada(message_sid)
+    if entregada:
+        # Reintento de un mensaje ya respondido por streaming: solo guardar
+        logger.info("[ATENCION] ♻️  %s: respuesta ya entregada, solo se guarda el estado", message_sid)
+        resultado_chat = {"success": True, **entregada}
+    elif GEMINI_STREAMING:
+        resultado_chat = await procesar_mensaje_stream_async(
+            contexto,
+            mensaje_usuario,
+            lambda parte: _enviar_parte(from_number, parte)
+        )
+    else:
+        resultado_chat = await procesar_mensaje_async(contexto, mensaje_usuario)
+    
+    if not resultado_chat.get("success"):
+        logger.error("[ATENCION] ❌ Error chat: %s", resultado_chat.get("error"))
+        respuesta_kliofer = "Lo siento, hubo un error. Intenta de nuevo."
+        pendiente = respuesta_kliofer
+        origen = "error"
+    else:
+        respuesta_kliofer = resultado_chat.get("respuesta", "")
+        pendiente = resultado_chat.get("pendiente", respuesta_kliofer)
+        origen = resultado_chat.get("origen", "gemini")
+    
+    logger.debug("[ATENCION] ✅ Kliofer responde: %s...", respuesta_kliofer[:60])
+    
+    # ════════════════════════════════════════════════════════════════
+    # PASO 3: REGISTRAR CONVERSACIÓN (se escribe al final, PASO 5)
+    # ════════════════════════════════════════════════════════════════
+    
+    uow = UnidadDeTrabajo(clave=message_sid)
+    
+    mensajes_cliente = mensajes_cliente or [mensaje_usuario]
+    
+    # Avanzar la etapa de venta con los mensajes nuevos (O(1))
+    estado_venta = contexto.estado_venta
+    if estado_venta is None and contexto.mensajes:
+        estado_venta = await ejecutar_en_pool(cargar_estado_venta, id_lead)
+    for texto in (*mensajes_cliente, respuesta_kliofer):
+        estado_venta = avanzar_etapa(estado_venta, texto)
+    contexto.estado_venta = estado_venta
+    
+    # Mensajes del cliente + respuesta de Kliofer en un solo $push
+    ahora = datetime.now()
+    uow.agregar_mensajes(
+        id_lead,
+        [
+            *({"emisor": "cliente", "texto": texto, "timestamp": ahora} for texto in mensajes_cliente),
+            # origen: rapida | cache | gemini (tasa de mensajes sin LLM)
+            {"emisor": "bot", "texto": respuesta_kliofer, "timestamp": datetime.now(), "origen": origen}
+        ],
+        numero_cliente=from_number,
+        nombre_cliente=nombre_cliente,
+        estado_venta=estado_venta
+    )
+    
+    # ════════════════════════════════════════════════════════════════
+    # PASO 4: DETECTAR INTENCIONES Y REGISTRAR ÓRDENES
+    # ════════════════════════════════════════════════════════════════
+    
+    logger.debug("[ATENCION] 📊 Analizando intenciones...")
+    
+    intenciones = analizar_mensaje(mensaje_usuario)
+    producto = intenciones["producto"]
+    metodo_pago = intenciones["metodo_pago"]
+    direccion = intenciones["direccion"]
+    
+    logger.debug("[ATENCION] Intenciones:")
+    logger.debug("  - Producto: %s", producto)
+    logger.debug("  - Método pago: %s", metodo_pago)
+    logger.debug("  - Dirección: %s", direccion)
+    
+    # Contraentrega necesita dirección; presencial no
+    if producto and (metodo_pago == "presencial" or (metodo_pago == "contraentrega" and direccion)):
+        logger.debug("[ATENCION] 📦 Condiciones para %s...", metodo_pago.upper())
+    
+        precio = await ejecutar_en_pool(obtener_precio_producto, producto)
+    
+        if precio:
+            direccion_orden = direccion if metodo_pago == "contraentrega" else None
+            try:
+                orden = await ejecutar_en_pool(
+                    construir_orden,
+                    id_lead=id_lead,
+                    nombre_producto=producto,
+                    cantidad=1,
+                    precio_unitario=precio,
+                    metodo_pago=metodo_pago,
+                    direccion=direccion_orden
+                )
+            except Exception as e:
+                # Sin código de entrega no hay orden: no guardar nada y
+                # dejar que el reintento vuelva a atender el mensaje
+                logger.error("[ATENCION] ❌ Error generando la orden: %s", e)
+                return await _no_guardado(message_sid, id_lead, str(e), respuesta_kliofer, pendiente, origen)
+            uow.insertar_orden(orden)
+            uow.actualizar_lead(id_lead, {"pago_info": construir_pago_info(metodo_pago, precio, direccion_orden)})
+            logger.debug("[ATENCION] 📋 Orden preparada: %s", orden["codigo_entrega"])
+    
+    # ════════════════════════════════════════════════════════════════
+    # PASO 4.1: GUARDAR TODO (conversación + orden + pago_info)
+    # ════════════════════════════════════════════════════════════════
+    
+    logger.debug("[ATENCION] 💾 Guardando cambios del mensaje...")
+    resultado_uow = await ejecutar_en_pool(uow.confirmar)
+    
+    if not resultado_uow.get("success"):
+        # La orden (y quizás el historial) no quedó escrita: fallar, así
+        # idempotencia no guarda esta respuesta y el reintento (Twilio /
+        # cola) vuelve a atender el mensaje. Con message_sid ese reintento
+        # solo escribe lo que falta (ver unidad_trabajo)
+        logger.error("[ATENCION] ❌ Error guardando: %s", resultado_uow.get("error"))
+        return await _no_guardado(
+            message_sid, id_lead,
+            resultado_uow.get("error") or "No se pudo guardar la conversación",
+            respuesta_kliofer, pendiente, origen
+        )
+    
+    logger.info(
+        "[ATENCION] ✅ Conversación guardada (etapa: %s)", estado_venta["etapa"],
+        extra={"id_lead": id_lead, "etapa": estado_venta["etapa"]}
+    )
+    if uow.ordenes:
+        logger.info("[ATENCION] ✅ Orden creada: %s", uow.ordenes[0]["codigo_entrega"])
+    
+    # Conversación larga: compactar lo antiguo en el resumen (en segundo plano)
+    total = resultado_uow["total_mensajes"].get(id_lead)
+    if total:
+        resumidor.revisar(id_lead, total, contexto.resumen)
+    
+    return {
+        "success": True,
+        "id_lead": id_lead,
+        "respuesta": respuesta_kliofer,
+        "pendiente": pendiente,
+        "origen": origen,
+        "orden": uow.ordenes[0]["codigo_entrega"] if uow.ordenes else None
+    }
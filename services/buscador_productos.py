@@ -0,0 +1,231 @@
+# ============================================================================
+# RUTA: backend/services/buscador_productos.py
+# DESCRIPCIÓN: Búsqueda de productos en memoria (sin acentos, tolerante a
+#              errores de tipeo, ranking BM25)
+# USO: buscar_productos("frigorifico 800l", pagina=1, por_pagina=10)
+#      producto_mencionado(mensaje) → nombre del producto o None (nombre exacto)
+# ============================================================================
+#
+# Índice invertido sobre los productos activos del catálogo en caché
+# (nombre, categoría, características, descripción), uno por versión del
+# catálogo: si el catálogo cambia, el siguiente uso lo reconstruye.
+#
+# Términos: minúsculas sin acentos ("Frigoríficos" = "frigorificos"), sin
+# palabras vacías y sin plural ("hornos" → "horno").
+#
+# Cada término de la consulta se expande a términos del índice:
+#   exacto 1.0 | prefijo ("frigo" → "frigorifico") 0.9 |
+#   trigramas (similitud de Jaccard ≥ BUSQUEDA_SIMILITUD_MINIMA, "frigorifco")
+# y se puntúa con BM25 (tf ponderado por campo: el nombre pesa más).
+#
+# La detección en mensajes del chat (producto_mencionado) NO es aproximada:
+# de ella salen órdenes, así que exige el nombre completo del producto
+# (todos sus términos) y un único producto posible.
+# ============================================================================
+
+import os
+import re
+import math
+import logging
+import threading
+from collections import Counter, defaultdict
+from services.catalogo_cache import CATEGORIAS_MAP, obtener_productos_activos, obtener_version_catalogo
+from services.palabras_clave import plegar
+
+logger = logging.getLogger(__name__)
+
+BUSQUEDA_SIMILITUD_MINIMA = float(os.getenv("BUSQUEDA_SIMILITUD_MINIMA", "0.45"))
+BUSQUEDA_POR_PAGINA_MAX = 50
+
+PESOS_CAMPOS = {"nombre": 3.0, "categoria": 1.5, "caracteristicas": 1.0, "descripcion": 0.7}
+BM25_K1 = 1.2
+BM25_B = 0.75
+PESO_PREFIJO = 0.9
+PREFIJO_MINIMO = 3
+
+PALABRAS_VACIAS = frozenset("""
+    a al con de del el en la las lo los para por que un una unos unas y o
+    mi me quiero busco necesito tienen tiene hay precio
+""".split())
+
+_PATRON_PALABRA = re.compile(r"[a-z0-9]+")
+
+# ============================================================================
+# TÉRMINOS
+# ============================================================================
+
+def raiz(palabra):
+    """Singular aproximado: frigorificos → frigorifico, mesas → mesa"""
+    if len(palabra) > 4 and palabra.endswith("es") and palabra[-3] in "rlndzj":
+        return palabra[:-2]
+    if len(palabra) > 3 and palabra.endswith("s") and not palabra.endswith("ss"):
+        return palabra[:-1]
+    return palabra
+
+def tokenizar(texto):
+    return [
+        raiz(palabra) for palabra in _PATRON_PALABRA.findall(plegar(texto or ""))
+        if palabra not in PALABRAS_VACIAS
+    ]
+
+def trigramas(termino):
+    relleno = f"  {termino} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+# ============================================================================
+# ÍNDICE
+# ============================================================================
+
+class IndiceProductos:
+    """Índice invertido + trigramas del vocabulario (inmutable una vez armado)"""
+
+    def __init__(self, productos, version=None):
+        self.productos = productos
+        self.version = version
+        self.postings = defaultdict(dict)       # término → {doc: tf ponderado}
+        self.terminos_nombre = []               # doc → términos de su nombre
+        self.largos = []
+
+        for doc, producto in enumerate(productos):
+            frecuencias = Counter()
+            for campo, peso in PESOS_CAMPOS.items():
+                texto = str(producto.get(campo) or "")
+                if campo == "categoria":
+                    texto += " " + CATEGORIAS_MAP.get(texto, "")
+                for termino in tokenizar(texto):
+                    frecuencias[termino] += peso
+            self.terminos_nombre.append(frozenset(tokenizar(producto.get("nombre"))))
+            for termino, tf in frecuencias.items():
+                self.postings[termino][doc] = tf
+            self.largos.append(sum(frecuencias.values()))
+
+        self.largo_medio = (sum(self.largos) / len(self.largos)) if self.largos else 0.0
+        self.idf = {
+            termino: math.log(1 + (len(productos) - len(docs) + 0.5) / (len(docs) + 0.5))
+            for termino, docs in self.postings.items()
+        }
+        self.por_trigrama = defaultdict(set)
+        for termino in self.postings:
+            for trigrama in trigramas(termino):
+                self.por_trigrama[trigrama].add(termino)
+
+    def expandir(self, termino):
+        """Términos del índice que corresponden a `termino` → peso (0-1]"""
+        if termino in self.postings:
+            return {termino: 1.0}
+
+        expansion = {}
+        if len(termino) >= PREFIJO_MINIMO:
+            for candidato in self.postings:
+                if candidato.startswith(termino):
+                    expansion[candidato] = PESO_PREFIJO
+
+        propios = trigramas(termino)
+        compartidos = Counter()
+        for trigrama in propios:
+            for candidato in self.por_trigrama.get(trigrama, ()):
+                compartidos[candidato] += 1
+        for candidato, n in compartidos.items():
+            similitud = n / (len(propios) + len(trigramas(candidato)) - n)
+            if similitud >= BUSQUEDA_SIMILITUD_MINIMA and similitud > expansion.get(candidato, 0):
+                expansion[candidato] = similitud
+        return expansion
+
+    def puntuar(self, consulta):
+        """[(puntaje, doc)] de mayor a menor"""
+        puntajes = Counter()
+        for termino in set(tokenizar(consulta)):
+            # Un término de la consulta suma una vez por producto (su mejor expansión)
+            mejor = {}
+            for candidato, peso in self.expandir(termino).items():
+                idf = self.idf[candidato]
+                for doc, tf in self.postings[candidato].items():
+                    norma = 1 - BM25_B + BM25_B * self.largos[doc] / self.largo_medio
+                    valor = peso * idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norma)
+                    if valor > mejor.get(doc, 0):
+                        mejor[doc] = valor
+            for doc, valor in mejor.items():
+                puntajes[doc] += valor
+        return sorted(((p, doc) for doc, p in puntajes.items()), key=lambda x: (-x[0], x[1]))
+
+    def mencionado(self, mensaje):
+        """Producto cuyo nombre COMPLETO aparece en el mensaje, o None si no hay o es ambiguo"""
+        terminos = set(tokenizar(mensaje))
+        candidatos = [
+            doc for doc, nombre in enumerate(self.terminos_nombre)
+            if nombre and nombre <= terminos
+        ]
+        if not candidatos:
+            return None
+        # "vitrina horizontal" contiene a "vitrina": gana el nombre más largo
+        candidatos.sort(key=lambda doc: -len(self.terminos_nombre[doc]))
+        if len(candidatos) > 1 and len(self.terminos_nombre[candidatos[0]]) == len(self.terminos_nombre[candidatos[1]]):
+            return None
+        return self.productos[candidatos[0]].get("nombre")
+
+# ============================================================================
+# ÍNDICE ACTUAL (uno por versión del catálogo)
+# ============================================================================
+
+_indice = None
+_lock_indice = threading.Lock()
+
+def obtener_indice():
+    """Índice del catálogo actual; se rearma solo si cambió la versión"""
+    global _indice
+    version = obtener_version_catalogo()
+    indice = _indice
+    if indice is None or indice.version != version:
+        with _lock_indice:
+            indice = _indice
+            if indice is None or indice.version != version:
+                indice = IndiceProductos(obtener_productos_activos(), version)
+                _indice = indice
+                logger.info(
+                    "[BUSCADOR] ✅ Índice de %s productos, %s términos (versión %s)",
+                    len(indice.productos), len(indice.postings), version
+                )
+    return indice
+
+# ============================================================================
+# API
+# ============================================================================
+
+def buscar_productos(consulta, pagina=1, por_pagina=10):
+    """
+    Productos activos ordenados por relevancia
+
+    Returns:
+        {"success", "consulta", "total", "pagina", "por_pagina", "data": [producto + "relevancia"]}
+    """
+    try:
+        pagina = max(1, pagina)
+        por_pagina = min(max(1, por_pagina), BUSQUEDA_POR_PAGINA_MAX)
+        indice = obtener_indice()
+        resultados = indice.puntuar(consulta)
+
+        inicio = (pagina - 1) * por_pagina
+        data = [
+            {**indice.productos[doc], "relevancia": round(puntaje, 3)}
+            for puntaje, doc in resultados[inicio:inicio + por_pagina]
+        ]
+        return {
+            "success": True,
+            "consulta": consulta,
+            "total": len(resultados),
+            "pagina": pagina,
+            "por_pagina": por_pagina,
+            "data": data
+        }
+    except Exception as e:
+        logger.error("[BUSCADOR] ❌ Error buscando '%s': %s", consulta, e)
+        return {"success": False, "error": str(e)}
+
+def producto_mencionado(mensaje):
+    """Nombre del producto del catálogo mencionado por su nombre exacto (None si no hay o es ambiguo)"""
+    try:
+        return obtener_indice().mencionado(mensaje)
+    except Exception as e:
+        # Sin catálogo: sin detección
+        logger.warning("[BUSCADOR] ⚠️  Sin detección por catálogo: %s", e)
+        return None
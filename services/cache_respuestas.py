@@ -0,0 +1,310 @@
+# ============================================================================
+# RUTA: backend/services/cache_respuestas.py
+# DESCRIPCIÓN: Caché de respuestas de Kliofer para preguntas frecuentes
+# USO: consulta = cache_respuestas.preparar(mensaje, etapa, conversacion_nueva)
+#      respuesta = await cache_respuestas.buscar_async(consulta, datos)
+#      await cache_respuestas.guardar_async(consulta, datos, respuesta)
+# ============================================================================
+#
+# "¿Cuánto cuesta el horno?", horarios, ubicación, entrega... llegan todo el
+# día y cada uno era una llamada completa a Gemini.
+#
+# Clave = mensaje normalizado (sin acentos, sin signos, sin palabras vacías)
+#       + versión del catálogo + etapa de venta + conversación nueva/en curso
+# Si cambia el catálogo cambia la clave: nunca se sirve un precio viejo.
+#
+# Dos niveles:
+#   1. LRU en memoria con TTL (por proceso)
+#   2. Colección cache_respuestas, compartida entre workers (índice TTL en
+#      "expira"); un acierto aquí se copia a la memoria
+#
+# Se omite la caché (ni se busca ni se guarda) si:
+#   - el mensaje trae datos personales (email, teléfono/cédula, dirección,
+#     nombre)
+#   - el lead está en plena compra (esperando_pago / esperando_direccion) o
+#     el mensaje elige método de pago o da una dirección
+#   - la respuesta es un mensaje de error de Gemini
+# El nombre del cliente se guarda como marcador y se reemplaza al servir;
+# si la respuesta menciona su email o teléfono, no se guarda.
+# ============================================================================
+
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import NamedTuple
+from config.database import get_collection, ejecutar_en_pool
+from config.indices import Indice, registrar_indices
+from config.gemini_config import es_respuesta_de_respaldo
+from services.catalogo_cache import obtener_version_catalogo
+from services.palabras_clave import plegar
+from services.sales_flow_v3 import detectar_senales
+
+logger = logging.getLogger(__name__)
+
+CACHE_RESPUESTAS = os.getenv("CACHE_RESPUESTAS", "true").lower() == "true"
+CACHE_RESPUESTAS_TTL_SEGUNDOS = int(os.getenv("CACHE_RESPUESTAS_TTL_SEGUNDOS", "3600"))
+CACHE_RESPUESTAS_LRU = int(os.getenv("CACHE_RESPUESTAS_LRU", "1000"))
+
+ETAPAS_CHECKOUT = {"esperando_pago", "esperando_direccion"}
+SENALES_CHECKOUT = {"contraentrega", "presencial", "direccion"}
+
+PALABRAS_VACIAS = frozenset("""
+    a al ante con de del el en es esta este esto la las le les lo los me mi
+    mis o para pero por que se su sus te tu un una unos unas y ya yo
+    hola buenas buenos dia dias tarde tardes noche noches saludos
+    porfa porfavor favor gracias muchas ok oye disculpe disculpa
+""".split())
+
+_PATRON_PALABRA = re.compile(r"[a-z0-9]+")
+_PATRON_DATOS_PERSONALES = re.compile(
+    r"[\w.+-]+@[\w-]+\.[\w.]+"                     # email
+    r"|\d[\d\s-]{6,}\d"                            # teléfono / cédula
+    r"|(?<!\w)(?:me llamo|mi nombre|soy|mi numero|mi telefono|mi correo|"
+    r"mi direccion|calle|avenida|av\.|barrio|sector|cedula|ruc)(?!\w)"
+)
+
+MARCADOR_NOMBRE = "⟪nombre⟫"
+MARCADOR_NOMBRE_PILA = "⟪nombre_pila⟫"
+
+def contiene_datos_personales(texto):
+    return _PATRON_DATOS_PERSONALES.search(plegar(texto)) is not None
+
+def normalizar_mensaje(texto):
+    """Palabras significativas del mensaje, sin acentos ni signos"""
+    palabras = _PATRON_PALABRA.findall(plegar(texto))
+    return " ".join(p for p in palabras if p not in PALABRAS_VACIAS)
+
+def _patron_palabra_exacta(palabra):
+    return re.compile(rf"(?<!\w){re.escape(palabra)}(?!\w)")
+
+class Consulta(NamedTuple):
+    clave: str
+    normalizado: str
+    version: str
+    etapa: str
+
+# ============================================================================
+# CACHÉ
+# ============================================================================
+
+class CacheRespuestas:
+
+    def __init__(self, capacidad=CACHE_RESPUESTAS_LRU, ttl=CACHE_RESPUESTAS_TTL_SEGUNDOS, coleccion="cache_respuestas"):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.coleccion = coleccion
+        self._lru = OrderedDict()       # clave → (expira monotónico, plantilla)
+        self._lock = threading.Lock()   # la ruta legacy la usa desde hilos
+        self.metricas = Counter()
+
+    # ========================================================================
+    # CLAVE
+    # ========================================================================
+
+    def preparar(self, mensaje, etapa, conversacion_nueva):
+        """
+        Consulta para el mensaje, o None si la caché no aplica
+
+        Args:
+            etapa: etapa de venta actual, o función que la obtiene (solo se
+                   llama si el mensaje pasa los demás filtros); None = desconocida
+            conversacion_nueva: True si el lead no tiene historial
+        """
+        if not CACHE_RESPUESTAS:
+            return None
+
+        if contiene_datos_personales(mensaje):
+            return self._omitir("datos_personales")
+        if detectar_senales(mensaje) & SENALES_CHECKOUT:
+            return self._omitir("checkout")
+
+        normalizado = normalizar_mensaje(mensaje)
+        if not normalizado:
+            return self._omitir("vacio")
+
+        if callable(etapa):
+            etapa = etapa()
+        if etapa is None:
+            return self._omitir("etapa_desconocida")
+        if etapa in ETAPAS_CHECKOUT:
+            return self._omitir("checkout")
+
+        try:
+            version = obtener_version_catalogo()
+        except Exception:
+            return self._omitir("sin_catalogo")
+
+        tipo = "nueva" if conversacion_nueva else "en_curso"
+        clave = hashlib.sha1(f"{version}|{etapa}|{tipo}|{normalizado}".encode("utf-8")).hexdigest()
+        return Consulta(clave, normalizado, version, etapa)
+
+    def _omitir(self, motivo):
+        with self._lock:
+            self.metricas[f"omitida_{motivo}"] += 1
+        return None
+
+    # ========================================================================
+    # NOMBRE DEL CLIENTE
+    # ========================================================================
+
+    def _a_plantilla(self, respuesta, datos):
+        """Respuesta sin datos del cliente (None si no se puede generalizar)"""
+        plantilla = respuesta
+        nombre = (datos.get("nombre") or "").strip()
+        if nombre and nombre != "Cliente":
+            plantilla = _patron_palabra_exacta(nombre).sub(MARCADOR_NOMBRE, plantilla)
+            pila = nombre.split()[0]
+            if len(pila) >= 3 and pila != nombre:
+                plantilla = _patron_palabra_exacta(pila).sub(MARCADOR_NOMBRE_PILA, plantilla)
+
+        for dato in (datos.get("email"), datos.get("telefono")):
+            if dato and dato in plantilla:
+                return None
+        return plantilla
+
+    def _desde_plantilla(self, plantilla, datos):
+        nombre = (datos.get("nombre") or "Cliente").strip()
+        return (
+            plantilla
+            .replace(MARCADOR_NOMBRE, nombre)
+            .replace(MARCADOR_NOMBRE_PILA, nombre.split()[0])
+        )
+
+    # ========================================================================
+    # NIVEL 1: MEMORIA
+    # ========================================================================
+
+    def _leer_memoria(self, clave):
+        with self._lock:
+            entrada = self._lru.get(clave)
+            if entrada is None:
+                return None
+            expira, plantilla = entrada
+            if expira < time.monotonic():
+                del self._lru[clave]
+                return None
+            self._lru.move_to_end(clave)
+            return plantilla
+
+    def _escribir_memoria(self, clave, plantilla, ttl):
+        with self._lock:
+            self._lru[clave] = (time.monotonic() + ttl, plantilla)
+            self._lru.move_to_end(clave)
+            while len(self._lru) > self.capacidad:
+                self._lru.popitem(last=False)
+
+    # ========================================================================
+    # NIVEL 2: MONGODB (compartido)
+    # ========================================================================
+
+    def _leer_mongo(self, clave):
+        """(plantilla, segundos de vida restantes) o None"""
+        try:
+            doc = get_collection(self.coleccion).find_one(
+                {"_id": clave, "expira": {"$gt": datetime.now()}},
+                {"plantilla": 1, "expira": 1}
+            )
+        except Exception as e:
+            logger.warning("[CACHE_RESP] ⚠️  Error leyendo caché compartida: %s", e)
+            with self._lock:
+                self.metricas["errores_mongo"] += 1
+            return None
+        if doc is None:
+            return None
+        return doc["plantilla"], (doc["expira"] - datetime.now()).total_seconds()
+
+    def _escribir_mongo(self, consulta, plantilla):
+        ahora = datetime.now()
+        try:
+            get_collection(self.coleccion).replace_one(
+                {"_id": consulta.clave},
+                {
+                    "plantilla": plantilla,
+                    "normalizado": consulta.normalizado,
+                    "version_catalogo": consulta.version,
+                    "etapa": consulta.etapa,
+                    "creado": ahora,
+                    "expira": ahora + timedelta(seconds=self.ttl)
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning("[CACHE_RESP] ⚠️  Error guardando en caché compartida: %s", e)
+            with self._lock:
+                self.metricas["errores_mongo"] += 1
+
+    # ========================================================================
+    # API
+    # ========================================================================
+
+    def _acierto(self, consulta, plantilla, nivel, datos):
+        with self._lock:
+            self.metricas[f"hits_{nivel}"] += 1
+        logger.debug("[CACHE_RESP] ♻️  Respuesta desde caché (%s): '%s'", nivel, consulta.normalizado)
+        return self._desde_plantilla(plantilla, datos)
+
+    def _fallo(self):
+        with self._lock:
+            self.metricas["misses"] += 1
+        return None
+
+    def buscar(self, consulta, datos):
+        """Respuesta cacheada para el cliente (`datos` del prompt) o None"""
+        plantilla = self._leer_memoria(consulta.clave)
+        if plantilla is not None:
+            return self._acierto(consulta, plantilla, "memoria", datos)
+
+        encontrada = self._leer_mongo(consulta.clave)
+        if encontrada is None:
+            return self._fallo()
+        plantilla, ttl = encontrada
+        self._escribir_memoria(consulta.clave, plantilla, ttl)
+        return self._acierto(consulta, plantilla, "mongo", datos)
+
+    async def buscar_async(self, consulta, datos):
+        # Acierto en memoria sin salir del event loop
+        plantilla = self._leer_memoria(consulta.clave)
+        if plantilla is not None:
+            return self._acierto(consulta, plantilla, "memoria", datos)
+        return await ejecutar_en_pool(self.buscar, consulta, datos)
+
+    def guardar(self, consulta, datos, respuesta):
+        if not respuesta or es_respuesta_de_respaldo(respuesta):
+            return
+        plantilla = self._a_plantilla(respuesta, datos)
+        if plantilla is None:
+            self._omitir("respuesta_personal")
+            return
+        self._escribir_memoria(consulta.clave, plantilla, self.ttl)
+        self._escribir_mongo(consulta, plantilla)
+        with self._lock:
+            self.metricas["guardadas"] += 1
+
+    async def guardar_async(self, consulta, datos, respuesta):
+        await ejecutar_en_pool(self.guardar, consulta, datos, respuesta)
+
+    def resumen(self):
+        with self._lock:
+            metricas = dict(self.metricas)
+            entradas = len(self._lru)
+        hits = metricas.get("hits_memoria", 0) + metricas.get("hits_mongo", 0)
+        consultas = hits + metricas.get("misses", 0)
+        return {
+            "activa": CACHE_RESPUESTAS,
+            "entradas_memoria": entradas,
+            "tasa_aciertos": round(hits / consultas, 3) if consultas else 0.0,
+            **metricas
+        }
+
+cache_respuestas = CacheRespuestas()
+
+# Consultas solo por _id (clave); "expira" borra las vencidas
+registrar_indices("cache_respuestas", Indice("expira", expireAfterSeconds=0))
+
+def obtener_metricas_cache():
+    return cache_respuestas.resumen()
@@ -0,0 +1,198 @@
+# ============================================================================
+# RUTA: backend/services/catalogo_cache.py
+# DESCRIPCIÓN: Caché en memoria del catálogo (productos, precios, texto prompt)
+# USO: El hot path del chat lee de aquí; se refresca por change stream
+#      de MongoDB o, si no está disponible, por polling
+# ============================================================================
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from config.database import get_collection
+from config.indices import Indice, ConsultaIndexada, registrar_indices, registrar_consultas
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# ÍNDICES
+# ============================================================================
+
+registrar_indices("productos", Indice("activo"), Indice("timestamp"))
+registrar_consultas(
+    "productos",
+    ConsultaIndexada("productos activos", {"activo": True}),
+    ConsultaIndexada("último producto modificado", {"timestamp": {"$exists": True}}, orden=[("timestamp", -1)])
+)
+
+CATALOGO_POLL_SEGUNDOS = int(os.getenv("CATALOGO_POLL_SEGUNDOS", "60"))
+
+CATEGORIAS_MAP = {
+    "refrigeracion": "🧊 REFRIGERACIÓN",
+    "coccion": "🔥 COCCIÓN",
+    "mobiliario": "🪑 MOBILIARIO",
+    "especiales": "⚙️ EQUIPOS ESPECIALES"
+}
+
+# ============================================================================
+# RENDER DEL CATÁLOGO
+# ============================================================================
+
+def renderizar_catalogo(productos):
+    """Texto del catálogo para el prompt de Gemini"""
+    catalogo = {}
+    for prod in productos:
+        catalogo.setdefault(prod.get("categoria", "otros"), []).append(prod)
+
+    texto = "\n📦 CATÁLOGO COMPLETO DE PRODUCTOS:\n"
+    for cat, label in CATEGORIAS_MAP.items():
+        if cat in catalogo:
+            texto += f"\n{label}:\n"
+            for prod in catalogo[cat]:
+                texto += f"  • {prod.get('nombre')}: ${prod.get('precio')}"
+                if prod.get("caracteristicas"):
+                    texto += f" - {prod['caracteristicas']}"
+                texto += "\n"
+
+    return texto
+
+def calcular_version(productos):
+    """Hash estable del contenido: igual en todos los workers para el mismo catálogo"""
+    contenido = json.dumps(
+        sorted(productos, key=lambda p: str(p.get("_id"))),
+        default=str,
+        sort_keys=True
+    )
+    return hashlib.sha1(contenido.encode("utf-8")).hexdigest()[:12]
+
+# ============================================================================
+# CACHÉ
+# ============================================================================
+
+class CatalogoCache:
+    """
+    Snapshot inmutable del catálogo activo.
+
+    Cada recarga construye un snapshot nuevo y lo reemplaza de forma atómica,
+    así los lectores nunca ven un estado a medias y no necesitan locks.
+    """
+
+    def __init__(self):
+        self.snapshot = None
+        self.marca_polling = None
+        self.detener = threading.Event()
+        self.hilo = None
+        self.lock_carga = threading.Lock()
+
+    # ---------------------------------------------------------------- carga
+
+    def recargar(self):
+        """Lee los productos activos de MongoDB y reemplaza el snapshot"""
+        with self.lock_carga:
+            productos_col = get_collection("productos")
+            productos = list(productos_col.find({"activo": True}))
+            for p in productos:
+                p["_id"] = str(p["_id"])
+
+            self.snapshot = {
+                "productos": productos,
+                "precios": {p.get("nombre"): p.get("precio") for p in productos},
+                "texto": renderizar_catalogo(productos),
+                "version": calcular_version(productos)
+            }
+            self.marca_polling = self._marca_actual(productos_col)
+
+            logger.info("[CATALOGO] ✅ %s productos en caché (versión %s)", len(productos), self.snapshot["version"])
+            return self.snapshot
+
+    def obtener(self):
+        """Snapshot actual; carga perezosa la primera vez"""
+        snapshot = self.snapshot
+        if snapshot is None:
+            snapshot = self.recargar()
+        return snapshot
+
+    # ---------------------------------------------------------- invalidación
+
+    def iniciar(self):
+        """Arranca el hilo de invalidación (change stream o polling)"""
+        if self.hilo and self.hilo.is_alive():
+            return
+        self.detener.clear()
+        self.hilo = threading.Thread(target=self._vigilar, name="catalogo-cache", daemon=True)
+        self.hilo.start()
+
+    def parar(self):
+        self.detener.set()
+
+    def _vigilar(self):
+        try:
+            self._escuchar_change_stream()
+        except Exception as e:
+            logger.warning("[CATALOGO] ⚠️  Change stream no disponible (%s), usando polling cada %ss", e, CATALOGO_POLL_SEGUNDOS)
+            self._polling()
+
+    def _escuchar_change_stream(self):
+        productos_col = get_collection("productos")
+        with productos_col.watch(max_await_time_ms=1000) as stream:
+            logger.info("[CATALOGO] 👂 Escuchando cambios en productos (change stream)")
+            while not self.detener.is_set():
+                if stream.try_next() is not None:
+                    self.recargar()
+
+    def _polling(self):
+        while not self.detener.wait(CATALOGO_POLL_SEGUNDOS):
+            try:
+                if self._marca_actual(get_collection("productos")) != self.marca_polling:
+                    self.recargar()
+            except Exception as e:
+                logger.error("[CATALOGO] ❌ Error en polling: %s", e)
+
+    @staticmethod
+    def _marca_actual(productos_col):
+        """
+        Marca barata para detectar cambios sin leer el catálogo:
+        número de documentos + último `timestamp` modificado.
+        Las actualizaciones de productos deben refrescar `timestamp`.
+        """
+        ultimo = productos_col.find_one(
+            {"timestamp": {"$exists": True}},
+            {"timestamp": 1},
+            sort=[("timestamp", -1)]
+        )
+        return (
+            # Desde los metadatos de la colección (count_documents({}) la recorre entera)
+            productos_col.estimated_document_count(),
+            ultimo.get("timestamp") if ultimo else None
+        )
+
+catalogo_cache = CatalogoCache()
+
+# ============================================================================
+# API DEL MÓDULO
+# ============================================================================
+
+def obtener_texto_catalogo():
+    """Texto del catálogo pre-renderizado para el prompt"""
+    return catalogo_cache.obtener()["texto"]
+
+def obtener_precio(nombre_producto):
+    """Precio por nombre exacto de producto (None si no está activo)"""
+    return catalogo_cache.obtener()["precios"].get(nombre_producto)
+
+def obtener_productos_activos():
+    """Lista de productos activos (no modificar los dicts devueltos)"""
+    return catalogo_cache.obtener()["productos"]
+
+def obtener_version_catalogo():
+    """Versión (hash de contenido) del catálogo actual"""
+    return catalogo_cache.obtener()["version"]
+
+def iniciar_catalogo_cache():
+    """Carga el catálogo y arranca la invalidación en segundo plano"""
+    catalogo_cache.recargar()
+    catalogo_cache.iniciar()
+
+def detener_catalogo_cache():
+    catalogo_cache.parar()
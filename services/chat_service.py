@@ -221,7 +221,7 @@ def procesar_mensaje(
         if historial is None:
             historial = []
         
-        logger.info(f"🔄 Procesando mensaje con {len(historial)} mensajes en historial")
+        logger.info("🔄 Procesando mensaje con %s mensajes en historial", len(historial))
         
         # ================================================
         # 1️⃣ EXTRAER DATOS DEL MENSAJE
@@ -235,14 +235,14 @@ def procesar_mensaje(
         if not nombre_cliente and datos_extraidos.get("nombre"):
             nombre_cliente = datos_extraidos["nombre"]
         
-        logger.info(f"👤 Cliente: {nombre_cliente or 'Desconocido'}")
-        logger.info(f"📝 Datos extraidos: {datos_extraidos}")
+        logger.info("👤 Cliente: %s", nombre_cliente or 'Desconocido')
+        logger.info("📝 Datos extraidos: %s", datos_extraidos)
         
         # ================================================
         # 2️⃣ DETECTAR ETAPA DE VENTA
         # ================================================
         etapa = detectar_etapa_compra(historial)
-        logger.info(f"📊 Etapa detectada: {etapa}")
+        logger.info("📊 Etapa detectada: %s", etapa)
         
         # ================================================
         # 3️⃣ CONSTRUIR CONTEXTO COMPLETO
@@ -265,16 +265,16 @@ def procesar_mensaje(
 🤖 Tu respuesta como Kliofer (natural, breve, experto):
 """
         
-        logger.info(f"📤 Enviando a Gemini...")
-        logger.info(f"   Etapa: {etapa}")
-        logger.info(f"   Historial: {len(historial)} mensajes")
+        logger.info("📤 Enviando a Gemini...")
+        logger.info("   Etapa: %s", etapa)
+        logger.info("   Historial: %s mensajes", len(historial))
         
         # ================================================
         # 5️⃣ OBTENER RESPUESTA DE GEMINI
         # ================================================
         respuesta = get_gemini_response(prompt_final)
         
-        logger.info(f"✅ Respuesta generada ({len(respuesta)} caracteres)")
+        logger.info("✅ Respuesta generada (%s caracteres)", len(respuesta))
         
         return {
             "success": True,
@@ -286,7 +286,7 @@ def procesar_mensaje(
         }
     
     except Exception as e:
-        logger.error(f"❌ Error procesando mensaje: {e}", exc_info=True)
+        logger.error("❌ Error procesando mensaje: %s", e, exc_info=True)
         return {
             "success": False,
             "respuesta": "Lo siento, hubo un error procesando tu mensaje. Intenta de nuevo.",
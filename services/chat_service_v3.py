@@ -3,87 +3,39 @@
 # DESCRIPCIÓN: Chat inteligente - Lee BD, contexto completo, LOGS TODO
 # ============================================================================
 
+import os
+import re
 import logging
 from datetime import datetime
-from config.gemini_config import get_gemini_response
+from config.gemini_config import get_gemini_response, get_gemini_response_async, stream_gemini_response_async
 from config.database import get_collection
+from services.catalogo_cache import obtener_texto_catalogo
+from services.historial_service import obtener_ultimos_mensajes
+from services.prompt_service import armar_prompt, formatear_historial
+from services.cache_respuestas import cache_respuestas
+from services.respuesta_rapida import responder_rapido, registrar_origen
+from services.resumen_service import obtener_resumen
+from services.sales_flow_v3 import obtener_etapa
 from bson import ObjectId
 
 logger = logging.getLogger(__name__)
 
-# ============================================================================
-# INFORMACIÓN DE FRESST (Del sitio web)
-# ============================================================================
-
-INFO_FRESST = """
-🏢 FRESST - Líderes en Equipamiento Profesional
-
-📝 SOBRE FRESST:
-Somos Fresst, líderes en equipamiento profesional para negocios gastronómicos y comerciales.
-Con años de experiencia, nos especializamos en refrigeración, cocción, mobiliario y equipos especiales.
-
-📍 UBICACIÓN: Av. Maldonado e Islas Malvinas, junto a Ecovía Nueva Aurora, Quito
-⏰ HORARIO: Martes a Domingo, 9:00 AM - 6:00 PM
-🚚 ENTREGA: 2-3 días hábiles en toda la ciudad
-✅ GARANTÍA: 1.5-2 años en todos los productos
-
-💬 ATENCIÓN: Respuesta inmediata por WhatsApp en tiempo real
-
-🎯 ¿POR QUÉ ELEGIRNOS?
-✓ Respuesta Inmediata: Atención personalizada 24/7
-✓ Calidad Garantizada: Marcas profesionales de confianza
-✓ Entrega Rápida: Instalación incluida
-"""
+# Streaming: la primera frase sale en cuanto está completa (y tiene al menos
+# STREAMING_MIN_CARACTERES, para no mandar un "¡Hola!" suelto)
+STREAMING_MIN_CARACTERES = int(os.getenv("STREAMING_MIN_CARACTERES", "40"))
+FIN_DE_FRASE = re.compile(r"[.!?…]+[)\]\"'»]*\s+|\n\s*\n")
 
 # ============================================================================
 # FUNCIÓN 1: OBTENER CATÁLOGO DE PRODUCTOS
 # ============================================================================
 
 def obtener_catalogo_productos():
-    """Lee TODOS los productos de MongoDB"""
+    """Texto del catálogo activo (servido desde la caché en memoria)"""
     try:
-        logger.info("[CHAT_V3] 📦 Obteniendo catálogo...")
-        
-        productos_col = get_collection("productos")
-        productos = list(productos_col.find({"activo": True}))
-        
-        logger.info(f"[CHAT_V3] ✅ {len(productos)} productos en BD")
-        
-        catalogo = {}
-        for prod in productos:
-            cat = prod.get("categoria", "otros")
-            if cat not in catalogo:
-                catalogo[cat] = []
-            
-            catalogo[cat].append({
-                "nombre": prod.get("nombre"),
-                "precio": prod.get("precio"),
-                "caracteristicas": prod.get("caracteristicas", "")
-            })
-        
-        # Texto para Gemini
-        texto = "\n📦 CATÁLOGO COMPLETO DE PRODUCTOS:\n"
-        categorias_map = {
-            "refrigeracion": "🧊 REFRIGERACIÓN",
-            "coccion": "🔥 COCCIÓN",
-            "mobiliario": "🪑 MOBILIARIO",
-            "especiales": "⚙️ EQUIPOS ESPECIALES"
-        }
-        
-        for cat, label in categorias_map.items():
-            if cat in catalogo:
-                texto += f"\n{label}:\n"
-                for prod in catalogo[cat]:
-                    texto += f"  • {prod['nombre']}: ${prod['precio']}"
-                    if prod['caracteristicas']:
-                        texto += f" - {prod['caracteristicas']}"
-                    texto += "\n"
-        
-        logger.info(f"[CHAT_V3] ✅ Catálogo formateado ({len(texto)} caracteres)")
-        return texto
+        return obtener_texto_catalogo()
     
     except Exception as e:
-        logger.error(f"[CHAT_V3] ❌ Error catálogo: {e}")
+        logger.error("[CHAT_V3] ❌ Error catálogo: %s", e)
         return "\n📦 CATÁLOGO: [Error obteniendo catálogo]"
 
 # ============================================================================
@@ -93,28 +45,20 @@ def obtener_catalogo_productos():
 def obtener_historial(id_lead, limite=10):
     """Obtiene últimos N mensajes"""
     try:
-        logger.info(f"[CHAT_V3] 📜 Historial de {id_lead} (últimos {limite})...")
+        logger.debug("[CHAT_V3] 📜 Historial de %s (últimos %s)...", id_lead, limite)
         
-        conv_col = get_collection("conversaciones_whatsapp")
-        resultado = conv_col.find_one({"id_lead": id_lead})
+        mensajes = obtener_ultimos_mensajes(id_lead, limite)
         
-        if not resultado or "mensajes" not in resultado:
-            logger.info("[CHAT_V3] ℹ️  Sin historial previo")
+        if not mensajes:
+            logger.debug("[CHAT_V3] ℹ️  Sin historial previo")
             return ""
         
-        mensajes = resultado["mensajes"][-limite:]
-        logger.info(f"[CHAT_V3] ✅ {len(mensajes)} mensajes en historial")
+        logger.debug("[CHAT_V3] ✅ %s mensajes en historial", len(mensajes))
         
-        texto = "\n💬 HISTORIAL DEL CHAT:\n"
-        for msg in mensajes:
-            emisor = "👤 Cliente" if msg.get("emisor") == "cliente" else "🤖 Kliofer"
-            texto_msg = msg.get("texto", "")[:100]  # Limitar a 100 caracteres
-            texto += f"{emisor}: {texto_msg}\n"
-        
-        return texto
+        return formatear_historial(mensajes)
     
     except Exception as e:
-        logger.error(f"[CHAT_V3] ❌ Error historial: {e}")
+        logger.error("[CHAT_V3] ❌ Error historial: %s", e)
         return ""
 
 # ============================================================================
@@ -124,7 +68,7 @@ def obtener_historial(id_lead, limite=10):
 def obtener_datos_lead(id_lead):
     """Obtiene nombre, email, teléfono"""
     try:
-        logger.info(f"[CHAT_V3] 👤 Obteniendo datos del lead...")
+        logger.debug("[CHAT_V3] 👤 Obteniendo datos del lead...")
         
         leads_col = get_collection("leads")
         
@@ -136,7 +80,7 @@ def obtener_datos_lead(id_lead):
             lead = leads_col.find_one({"_id": id_lead})
         
         if not lead:
-            logger.warning(f"[CHAT_V3] ⚠️  Lead no encontrado: {id_lead}")
+            logger.warning("[CHAT_V3] ⚠️  Lead no encontrado: %s", id_lead)
             return {"nombre": "Cliente", "email": "", "telefono": ""}
         
         nombre = lead.get("nombre")
@@ -149,67 +93,41 @@ def obtener_datos_lead(id_lead):
             "telefono": lead.get("telefono", "")
         }
         
-        logger.info(f"[CHAT_V3] ✅ Datos: {datos['nombre']} ({datos['telefono']})")
+        logger.debug("[CHAT_V3] ✅ Datos: %s (%s)", datos["nombre"], datos["telefono"])
         return datos
     
     except Exception as e:
-        logger.error(f"[CHAT_V3] ❌ Error lead: {e}", exc_info=True)
+        logger.error("[CHAT_V3] ❌ Error lead: %s", e, exc_info=True)
         return {"nombre": "Cliente", "email": "", "telefono": ""}
 
 # ============================================================================
 # FUNCIÓN 4: CONSTRUIR PROMPT PARA GEMINI
 # ============================================================================
 
-def construir_prompt(id_lead, mensaje_usuario):
-    """Construye prompt COMPLETO con TODO el contexto"""
+def construir_prompt(id_lead, mensaje_usuario, contexto=None):
+    """
+    Construye prompt COMPLETO con TODO el contexto (PromptGemini: prefijo
+    estable + turno, dentro del presupuesto de tokens)
     
-    logger.info("[CHAT_V3] 🏗️  Construyendo prompt completo...")
+    Si se pasa `contexto` (ConversationContext ya cargado por el webhook),
+    no se vuelve a consultar MongoDB.
+    """
     
-    catalogo = obtener_catalogo_productos()
-    historial = obtener_historial(id_lead, limite=10)
-    datos = obtener_datos_lead(id_lead)
+    logger.debug("[CHAT_V3] 🏗️  Construyendo prompt completo...")
     
-    prompt = f"""{INFO_FRESST}
-
-{catalogo}
-{historial}
-
-👤 CONTEXTO DEL CLIENTE:
-Nombre: {datos['nombre']}
-Email: {datos['email']}
-Teléfono: {datos['telefono']}
-
-═══════════════════════════════════════════════════════════════════════════
-
-🤖 INSTRUCCIONES PARA KLIOFER:
-
-1. IDENTIDAD: Eres KLIOFER, asistente experto de FRESST
-2. TONO: Profesional, amable, directo, eficiente
-3. MÁXIMO: 3-4 líneas por respuesta
-4. CONTEXTO: Siempre recuerda qué preguntó antes
-5. PRODUCTO: Si pregunta por algo → Sugiere 2-3 opciones del catálogo
-6. CONSULTAS: Si pide precio, características → Dale datos exactos
-7. COMPRA: Si quiere comprar → Ofrece SOLO 2 métodos:
-   ✓ Contraentrega (entrega a domicilio, pagan al recibir)
-   ✓ Presencial (compran en local, pagan allá)
-8. CONTRAENTREGA: Si elige → Pide dirección de entrega
-9. PRESENCIAL: Si elige → Da dirección del local:
-   📍 Av. Maldonado e Islas Malvinas, Quito
-   ⏰ Martes-Domingo, 9AM-6PM
-10. CONFIRMACIÓN: Si da dirección → Genera código y confirma todo
-11. NOMBRE: Usa siempre el nombre del cliente
-12. NUNCA repitas saludos
-13. NUNCA olvides lo que preguntó
-
-═══════════════════════════════════════════════════════════════════════════
-
-📨 NUEVO MENSAJE:
-{datos['nombre']}: {mensaje_usuario}
-
-🤖 RESPUESTA DE KLIOFER (breve, natural, experto):
-"""
+    if contexto is not None:
+        mensajes = contexto.mensajes
+        datos = contexto.datos
+        resumen = contexto.texto_resumen
+    else:
+        mensajes = obtener_ultimos_mensajes(id_lead, 10)
+        datos = obtener_datos_lead(id_lead)
+        resumen = (obtener_resumen(id_lead) or {}).get("texto")
+    
+    # Resumen de lo anterior + historial reciente
+    prompt = armar_prompt(mensaje_usuario, mensajes, datos, resumen=resumen)
     
-    logger.info(f"[CHAT_V3] ✅ Prompt listo ({len(prompt)} chars)")
+    logger.debug("[CHAT_V3] ✅ Prompt listo (%s + %s chars)", len(prompt.sistema), len(prompt.turno))
     return prompt
 
 # ============================================================================
@@ -219,37 +137,213 @@ Teléfono: {datos['telefono']}
 def procesar_mensaje(id_lead, numero_cliente, mensaje_usuario):
     """Procesa mensaje completo con Gemini"""
     
-    logger.info("=" * 80)
-    logger.info(f"[CHAT_V3] 📨 PROCESANDO MENSAJE")
-    logger.info(f"[CHAT_V3] 📱 De: {numero_cliente}")
-    logger.info(f"[CHAT_V3] 💬 Mensaje: {mensaje_usuario[:60]}...")
-    logger.info("=" * 80)
+    logger.debug("[CHAT_V3] 📨 PROCESANDO MENSAJE")
+    logger.debug("[CHAT_V3] 📱 De: %s", numero_cliente)
+    logger.debug("[CHAT_V3] 💬 Mensaje: %s...", mensaje_usuario[:60])
     
     try:
         datos = obtener_datos_lead(id_lead)
-        logger.info(f"[CHAT_V3] 👤 Cliente: {datos['nombre']}")
+        logger.debug("[CHAT_V3] 👤 Cliente: %s", datos["nombre"])
+        
+        mensajes = obtener_ultimos_mensajes(id_lead, 10)
+        
+        # Pregunta simple: respuesta directa desde el catálogo
+        respuesta = responder_rapido(mensaje_usuario, datos, not mensajes)
+        origen = "rapida"
+        consulta = None
+        
+        if respuesta is None:
+            # Pregunta frecuente ya respondida
+            consulta = cache_respuestas.preparar(mensaje_usuario, lambda: obtener_etapa(id_lead), not mensajes)
+            respuesta = cache_respuestas.buscar(consulta, datos) if consulta else None
+            origen = "cache"
+        
+        if respuesta is None:
+            # Construir prompt (historial y datos ya leídos)
+            logger.debug("[CHAT_V3] 🏗️  Construyendo prompt completo...")
+            resumen = (obtener_resumen(id_lead) or {}).get("texto") if mensajes else None
+            prompt = armar_prompt(mensaje_usuario, mensajes, datos, resumen=resumen)
+            
+            # Llamar Gemini
+            logger.debug("[CHAT_V3] 🤖 Llamando Gemini...")
+            respuesta = get_gemini_response(prompt.turno, sistema=prompt.sistema)
+            origen = "gemini"
+            if consulta:
+                cache_respuestas.guardar(consulta, datos, respuesta)
+        
+        registrar_origen(origen)
+        logger.info("[CHAT_V3] ✅ Respuesta (%s)", origen, extra={"origen": origen})
+        logger.debug("[CHAT_V3] 💬 %s...", respuesta[:80])
+        
+        return {
+            "success": True,
+            "respuesta": respuesta,
+            "origen": origen,
+            "nombre_cliente": datos['nombre'],
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    except Exception as e:
+        logger.error("[CHAT_V3] ❌ ERROR: %s", e, exc_info=True)
+        return {
+            "success": False,
+            "respuesta": "Perdón, hubo un error. Intenta de nuevo.",
+            "error": str(e)
+        }
+
+# ============================================================================
+# FUNCIÓN 6: PROCESAR MENSAJE (ASYNC)
+# ============================================================================
+
+def _consulta_cache(contexto, mensaje_usuario):
+    """Consulta a la caché de respuestas con el contexto ya cargado"""
+    # Conversación anterior a estado_venta: etapa desconocida (sin caché)
+    etapa = contexto.etapa if contexto.estado_venta or not contexto.mensajes else None
+    return cache_respuestas.preparar(mensaje_usuario, etapa, not contexto.mensajes)
+
+async def _respuesta_sin_gemini(contexto, mensaje_usuario):
+    """
+    Respuesta directa o cacheada
+    
+    Returns:
+        (respuesta o None, origen, consulta de caché para guardar lo de Gemini)
+    """
+    respuesta = responder_rapido(mensaje_usuario, contexto.datos, not contexto.mensajes)
+    if respuesta is not None:
+        return respuesta, "rapida", None
+    
+    consulta = _consulta_cache(contexto, mensaje_usuario)
+    respuesta = await cache_respuestas.buscar_async(consulta, contexto.datos) if consulta else None
+    return respuesta, "cache", consulta
+
+async def procesar_mensaje_async(contexto, mensaje_usuario):
+    """
+    Igual que procesar_mensaje, pero sin bloquear el event loop del webhook.
+    
+    Usa el ConversationContext ya cargado: no hace consultas a MongoDB.
+    """
+    
+    logger.debug("[CHAT_V3] 📨 PROCESANDO MENSAJE (async) de %s", contexto.datos["telefono"])
+    
+    try:
+        datos = contexto.datos
         
-        # Construir prompt
-        prompt = construir_prompt(id_lead, mensaje_usuario)
+        # Pregunta simple o frecuente: sin Gemini
+        respuesta, origen, consulta = await _respuesta_sin_gemini(contexto, mensaje_usuario)
         
-        # Llamar Gemini
-        logger.info("[CHAT_V3] 🤖 Llamando Gemini...")
-        respuesta = get_gemini_response(prompt)
+        if respuesta is None:
+            prompt = construir_prompt(contexto.id_lead, mensaje_usuario, contexto=contexto)
+            
+            # Llamar Gemini (cliente async)
+            logger.debug("[CHAT_V3] 🤖 Llamando Gemini (async)...")
+            respuesta = await get_gemini_response_async(prompt.turno, sistema=prompt.sistema)
+            origen = "gemini"
+            if consulta:
+                await cache_respuestas.guardar_async(consulta, datos, respuesta)
         
-        logger.info(f"[CHAT_V3] ✅ Respuesta: {respuesta[:80]}...")
-        logger.info("=" * 80)
+        registrar_origen(origen)
+        logger.info("[CHAT_V3] ✅ Respuesta (%s)", origen, extra={"origen": origen})
+        logger.debug("[CHAT_V3] 💬 %s...", respuesta[:80])
         
         return {
             "success": True,
             "respuesta": respuesta,
+            "origen": origen,
+            "nombre_cliente": datos['nombre'],
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    except Exception as e:
+        logger.error("[CHAT_V3] ❌ ERROR: %s", e, exc_info=True)
+        return {
+            "success": False,
+            "respuesta": "Perdón, hubo un error. Intenta de nuevo.",
+            "error": str(e)
+        }
+
+# ============================================================================
+# FUNCIÓN 7: PROCESAR MENSAJE (STREAMING)
+# ============================================================================
+
+def cortar_primera_frase(texto, minimo=STREAMING_MIN_CARACTERES):
+    """Posición donde termina la primera frase/párrafo completo (o None)"""
+    for fin in FIN_DE_FRASE.finditer(texto):
+        if fin.start() >= minimo:
+            return fin.end()
+    return None
+
+async def procesar_mensaje_stream_async(contexto, mensaje_usuario, entregar):
+    """
+    Como procesar_mensaje_async, pero con la respuesta de Gemini en streaming:
+    la primera frase se entrega con `entregar` apenas está lista y el resto
+    al terminar el stream.
+    
+    Args:
+        entregar: corrutina entregar(texto) → True si se envió
+    
+    Returns:
+        El mismo dict que procesar_mensaje_async, con "respuesta" completa y
+        "pendiente": el texto que no se pudo entregar ("" si salió todo)
+    """
+    
+    logger.debug("[CHAT_V3] 📨 PROCESANDO MENSAJE (stream) de %s", contexto.datos["telefono"])
+    
+    try:
+        datos = contexto.datos
+        
+        # Pregunta simple o frecuente: se entrega entera, sin Gemini
+        respuesta, origen, consulta = await _respuesta_sin_gemini(contexto, mensaje_usuario)
+        if respuesta is not None:
+            registrar_origen(origen)
+            return {
+                "success": True,
+                "respuesta": respuesta,
+                "pendiente": "" if await entregar(respuesta) else respuesta,
+                "origen": origen,
+                "nombre_cliente": datos['nombre'],
+                "timestamp": datetime.now().isoformat()
+            }
+        
+        prompt = construir_prompt(contexto.id_lead, mensaje_usuario, contexto=contexto)
+        
+        logger.debug("[CHAT_V3] 🤖 Llamando Gemini (stream)...")
+        texto = ""
+        entregado = 0      # caracteres de `texto` ya enviados
+        primera = False    # ya se intentó la primera frase
+        async for fragmento in stream_gemini_response_async(prompt.turno, sistema=prompt.sistema):
+            texto += fragmento
+            if not primera:
+                corte = cortar_primera_frase(texto)
+                if corte:
+                    primera = True
+                    if await entregar(texto[:corte].strip()):
+                        entregado = corte
+                        logger.info("[CHAT_V3] ⚡ Primera frase entregada (%s chars)", corte)
+        
+        resto = texto[entregado:].strip()
+        if resto and await entregar(resto):
+            resto = ""
+        
+        if consulta:
+            await cache_respuestas.guardar_async(consulta, datos, texto.strip())
+        
+        registrar_origen("gemini")
+        logger.info("[CHAT_V3] ✅ Respuesta (gemini, stream)", extra={"origen": "gemini"})
+        logger.debug("[CHAT_V3] 💬 %s...", texto[:80])
+        
+        return {
+            "success": True,
+            "respuesta": texto.strip(),
+            "pendiente": resto,
+            "origen": "gemini",
             "nombre_cliente": datos['nombre'],
             "timestamp": datetime.now().isoformat()
         }
     
     except Exception as e:
-        logger.error(f"[CHAT_V3] ❌ ERROR: {e}", exc_info=True)
+        logger.error("[CHAT_V3] ❌ ERROR: %s", e, exc_info=True)
         return {
             "success": False,
             "respuesta": "Perdón, hubo un error. Intenta de nuevo.",
             "error": str(e)
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,225 @@
+# ============================================================================
+# RUTA: backend/services/cola_respuestas.py
+# DESCRIPCIÓN: Cola durable de respuestas de WhatsApp (modo asíncrono)
+# USO: El webhook encola y responde TwiML vacío al instante; los workers
+#      generan la respuesta y la envían con send_whatsapp_message (REST)
+# ============================================================================
+#
+# Colección trabajos_whatsapp:
+#   {numero, texto, estado, intentos, proximo_intento, bloqueado_hasta,
+#    respuesta, por_enviar, error, creado, actualizado, finalizado,
+#    message_sid, id_solicitud (logs del webhook que lo encoló)}
+#
+# estado: pendiente → procesando → completado | fallido
+#
+# Un worker toma un trabajo con find_one_and_update (nunca dos a la vez) y lo
+# "alquila" TRABAJO_LEASE_SEGUNDOS. Si el proceso muere a mitad, el alquiler
+# vence y otro worker lo retoma: nada se pierde al reiniciar. La respuesta
+# generada se guarda en el trabajo antes de enviarla, así un reintento por
+# fallo de Twilio solo reenvía (no vuelve a llamar a Gemini ni duplica el
+# historial).
+# ============================================================================
+
+import os
+import random
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from config.database import get_async_collection, ejecutar_en_pool
+from config.indices import Indice, ConsultaIndexada, registrar_indices, registrar_consultas
+from config.logging_config import contexto_solicitud
+from services.coordinador_leads import coordinador_leads
+from services.whatsapp_service import send_whatsapp_message
+
+logger = logging.getLogger(__name__)
+
+# "sincrono": respuesta en el TwiML del webhook | "asincrono": cola + REST
+WHATSAPP_MODO_RESPUESTA = os.getenv("WHATSAPP_MODO_RESPUESTA", "sincrono")
+RESPUESTA_WORKERS = int(os.getenv("RESPUESTA_WORKERS", "4"))
+TRABAJO_MAX_INTENTOS = int(os.getenv("TRABAJO_MAX_INTENTOS", "5"))
+TRABAJO_BACKOFF_SEGUNDOS = float(os.getenv("TRABAJO_BACKOFF_SEGUNDOS", "2"))
+TRABAJO_LEASE_SEGUNDOS = int(os.getenv("TRABAJO_LEASE_SEGUNDOS", "120"))
+TRABAJO_POLL_SEGUNDOS = float(os.getenv("TRABAJO_POLL_SEGUNDOS", "2"))
+TRABAJO_RETENCION_DIAS = int(os.getenv("TRABAJO_RETENCION_DIAS", "7"))
+
+def modo_asincrono():
+    return WHATSAPP_MODO_RESPUESTA == "asincrono"
+
+registrar_indices(
+    "trabajos_whatsapp",
+    Indice([("estado", 1), ("proximo_intento", 1)]),
+    # Los completados se borran solos; los fallidos quedan para revisión
+    Indice(
+        "finalizado",
+        expireAfterSeconds=TRABAJO_RETENCION_DIAS * 86400,
+        partialFilterExpression={"estado": "completado"}
+    )
+)
+registrar_consultas(
+    "trabajos_whatsapp",
+    ConsultaIndexada(
+        "siguiente trabajo listo",
+        {"$or": [
+            {"estado": "pendiente", "proximo_intento": {"$lte": 0}},
+            {"estado": "procesando", "bloqueado_hasta": {"$lt": 0}}
+        ]},
+        orden=[("proximo_intento", 1)]
+    )
+)
+
+def calcular_backoff(intentos):
+    """Exponencial con jitter: 2s, 4s, 8s, ... (±50%)"""
+    base = TRABAJO_BACKOFF_SEGUNDOS * (2 ** max(0, intentos - 1))
+    return base * random.uniform(0.5, 1.5)
+
+# ============================================================================
+# COLA
+# ============================================================================
+
+class ColaRespuestas:
+    """Pool acotado de workers asyncio sobre la colección trabajos_whatsapp"""
+
+    def __init__(self, workers=RESPUESTA_WORKERS):
+        self.workers = workers
+        self._tareas = []
+        self._hay_trabajo = asyncio.Event()
+
+    async def encolar(self, numero, texto, **extra):
+        """Guarda el mensaje entrante como trabajo pendiente (durable)"""
+        ahora = datetime.now()
+        trabajo = {
+            "numero": numero,
+            "texto": texto,
+            "estado": "pendiente",
+            "intentos": 0,
+            "proximo_intento": ahora,
+            "respuesta": None,
+            "creado": ahora,
+            "actualizado": ahora,
+            **extra
+        }
+        resultado = await get_async_collection("trabajos_whatsapp").insert_one(trabajo)
+        self._hay_trabajo.set()
+        logger.info("[COLA] 📥 Trabajo encolado: %s (%s)", resultado.inserted_id, numero)
+        return str(resultado.inserted_id)
+
+    async def _tomar(self):
+        """Reserva el siguiente trabajo listo (o con alquiler vencido)"""
+        ahora = datetime.now()
+        return await get_async_collection("trabajos_whatsapp").find_one_and_update(
+            {"$or": [
+                {"estado": "pendiente", "proximo_intento": {"$lte": ahora}},
+                {"estado": "procesando", "bloqueado_hasta": {"$lt": ahora}}
+            ]},
+            {
+                "$set": {
+                    "estado": "procesando",
+                    "bloqueado_hasta": ahora + timedelta(seconds=TRABAJO_LEASE_SEGUNDOS),
+                    "actualizado": ahora
+                },
+                "$inc": {"intentos": 1}
+            },
+            sort=[("proximo_intento", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _actualizar(self, id_trabajo, campos):
+        campos["actualizado"] = datetime.now()
+        await get_async_collection("trabajos_whatsapp").update_one({"_id": id_trabajo}, {"$set": campos})
+
+    async def _procesar(self, trabajo):
+        # Mismo ID de solicitud que el webhook que lo encoló
+        with contexto_solicitud(trabajo.get("id_solicitud") or str(trabajo["_id"])):
+            await self._procesar_trabajo(trabajo)
+
+    async def _procesar_trabajo(self, trabajo):
+        id_trabajo = trabajo["_id"]
+        respuesta = trabajo.get("respuesta")
+        por_enviar = trabajo.get("por_enviar", respuesta)
+
+        try:
+            if respuesta is None:
+                resultado = await coordinador_leads.atender(
+                    trabajo["numero"], trabajo["texto"], trabajo.get("message_sid")
+                )
+                if not resultado.get("success"):
+                    raise RuntimeError(resultado.get("error") or "No se pudo atender el mensaje")
+                if resultado.get("agrupado"):
+                    # Respondido junto con otro trabajo del mismo cliente
+                    await self._actualizar(id_trabajo, {"estado": "completado", "agrupado": True, "finalizado": datetime.now()})
+                    logger.info("[COLA] 🧺 Trabajo %s agrupado en otra respuesta", id_trabajo)
+                    return
+                respuesta = resultado["respuesta"]
+                # Con streaming, parte (o todo) ya salió por REST
+                por_enviar = resultado.get("pendiente", respuesta)
+                # Antes de enviar: un reintento solo reenvía
+                await self._actualizar(id_trabajo, {
+                    "respuesta": respuesta,
+                    "por_enviar": por_enviar,
+                    "id_lead": resultado["id_lead"]
+                })
+
+            sid_respuesta = None
+            if por_enviar:
+                envio = await ejecutar_en_pool(send_whatsapp_message, trabajo["numero"], por_enviar)
+                if not envio.get("success"):
+                    raise RuntimeError(envio.get("error") or "Twilio rechazó el envío")
+                sid_respuesta = envio.get("sid")
+
+            await self._actualizar(id_trabajo, {
+                "estado": "completado",
+                "sid_respuesta": sid_respuesta,
+                "finalizado": datetime.now()
+            })
+            logger.info("[COLA] ✅ Trabajo %s completado (intento %s)", id_trabajo, trabajo["intentos"])
+
+        except Exception as e:
+            if trabajo["intentos"] >= TRABAJO_MAX_INTENTOS:
+                await self._actualizar(id_trabajo, {"estado": "fallido", "error": str(e)})
+                logger.error("[COLA] ❌ Trabajo %s fallido tras %s intentos: %s", id_trabajo, trabajo["intentos"], e)
+                return
+
+            espera = calcular_backoff(trabajo["intentos"])
+            await self._actualizar(id_trabajo, {
+                "estado": "pendiente",
+                "error": str(e),
+                "proximo_intento": datetime.now() + timedelta(seconds=espera)
+            })
+            logger.warning("[COLA] ⚠️  Trabajo %s reintenta en %.1fs: %s", id_trabajo, espera, e)
+
+    async def _worker(self, numero):
+        logger.info("[COLA] 👷 Worker %s iniciado", numero)
+        while True:
+            try:
+                trabajo = await self._tomar()
+            except Exception as e:
+                logger.error("[COLA] ❌ Worker %s: error leyendo la cola: %s", numero, e)
+                trabajo = None
+
+            if trabajo is None:
+                # Despertar al encolar o, como mucho, cada TRABAJO_POLL_SEGUNDOS
+                # (reintentos programados y trabajos de otros procesos)
+                self._hay_trabajo.clear()
+                try:
+                    await asyncio.wait_for(self._hay_trabajo.wait(), TRABAJO_POLL_SEGUNDOS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._procesar(trabajo)
+
+    def iniciar(self):
+        if self._tareas:
+            return
+        self._tareas = [asyncio.create_task(self._worker(i + 1)) for i in range(self.workers)]
+        logger.info("[COLA] ✅ %s workers de respuesta activos", self.workers)
+
+    async def detener(self):
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        logger.info("[COLA] 🛑 Workers de respuesta detenidos")
+
+cola_respuestas = ColaRespuestas()
@@ -0,0 +1,127 @@
+# ============================================================================
+# RUTA: backend/services/contexto_service.py
+# DESCRIPCIÓN: Contexto de conversación (lead + últimos mensajes) en 1 consulta
+# USO: El webhook lo carga una vez por mensaje y lo pasa al resto del flujo
+# ============================================================================
+
+import logging
+from dataclasses import dataclass, field
+from config.database import get_async_collection
+from services.telefono_service import normalizar_telefono
+from services.historial_service import buckets_necesarios, unir_buckets
+
+logger = logging.getLogger(__name__)
+
+HISTORIAL_LIMITE = 10
+
+# ============================================================================
+# CONTEXTO
+# ============================================================================
+
+@dataclass
+class ConversationContext:
+    """Lead y cola de su conversación, leídos una sola vez por request"""
+    lead: dict
+    mensajes: list = field(default_factory=list)
+    estado_venta: dict = None
+    resumen: dict = None    # {texto, hasta, actualizado} de resumen_service
+
+    @property
+    def texto_resumen(self):
+        return self.resumen.get("texto") if self.resumen else None
+
+    @property
+    def id_lead(self):
+        return str(self.lead["_id"])
+
+    @property
+    def etapa(self):
+        return self.estado_venta["etapa"] if self.estado_venta else "consulta"
+
+    @property
+    def nombre_cliente(self):
+        """Nombre tal como se guarda en conversaciones ("Cliente" si está vacío)"""
+        nombre = self.lead.get("nombre")
+        if not nombre or not nombre.strip():
+            return "Cliente"
+        return nombre
+
+    @property
+    def datos(self):
+        """Nombre, email y teléfono para el prompt (igual que obtener_datos_lead)"""
+        nombre = self.lead.get("nombre")
+        if not nombre or nombre == "Cliente":
+            nombre = self.lead.get("telefono", "Cliente")
+
+        return {
+            "nombre": nombre if nombre else "Cliente",
+            "email": self.lead.get("email", ""),
+            "telefono": self.lead.get("telefono", "")
+        }
+
+# ============================================================================
+# CARGA
+# ============================================================================
+
+def _pipeline_contexto(filtro, limite):
+    pipeline = [
+        {"$match": filtro},
+        {"$limit": 1}
+    ]
+    if limite <= 0:
+        return pipeline
+    
+    # mensajes_whatsapp.id_lead se guarda como string del _id del lead;
+    # solo se traen los buckets más recientes (índice id_lead + bucket)
+    pipeline += [
+        {"$addFields": {"_id_str": {"$toString": "$_id"}}},
+        {"$lookup": {
+            "from": "mensajes_whatsapp",
+            "localField": "_id_str",
+            "foreignField": "id_lead",
+            "pipeline": [
+                {"$sort": {"bucket": -1}},
+                {"$limit": buckets_necesarios(limite)},
+                {"$project": {"_id": 0, "bucket": 1, "mensajes": 1}}
+            ],
+            "as": "buckets"
+        }},
+        {"$lookup": {
+            "from": "conversaciones_whatsapp",
+            "localField": "_id_str",
+            "foreignField": "id_lead",
+            "pipeline": [{"$project": {"_id": 0, "estado_venta": 1, "resumen": 1}}],
+            "as": "cabecera"
+        }},
+        {"$project": {"_id_str": 0}}
+    ]
+    return pipeline
+
+async def cargar_contexto(telefono, limite=HISTORIAL_LIMITE):
+    """
+    Lead por teléfono + últimos `limite` mensajes en una sola agregación.
+
+    Returns:
+        ConversationContext, o None si el lead no existe
+    """
+    leads_col = get_async_collection("leads")
+    filtro = {"telefono_canonico": normalizar_telefono(telefono)}
+
+    resultado = await leads_col.aggregate(_pipeline_contexto(filtro, limite))
+
+    if not resultado:
+        logger.debug("[CONTEXTO] ℹ️  Sin lead para %s", telefono)
+        return None
+
+    lead = resultado[0]
+    mensajes = unir_buckets(lead.pop("buckets", []), limite)
+    cabecera = lead.pop("cabecera", [])
+    cabecera = cabecera[0] if cabecera else {}
+
+    logger.debug("[CONTEXTO] ✅ Lead %s con %s mensajes recientes", lead["_id"], len(mensajes))
+    return ConversationContext(
+        lead=lead,
+        mensajes=mensajes,
+        estado_venta=cabecera.get("estado_venta"),
+        resumen=cabecera.get("resumen")
+    )
@@ -0,0 +1,119 @@
+# ============================================================================
+# RUTA: backend/services/coordinador_leads.py
+# DESCRIPCIÓN: Procesamiento en serie por lead (+ agrupación de ráfagas)
+# USO: resultado = await coordinador_leads.atender(numero, texto, message_sid)
+# ============================================================================
+#
+# Tres mensajes seguidos del mismo cliente eran tres webhooks en paralelo:
+# cada uno leía el historial sin los otros y lanzaba su propia llamada a
+# Gemini. Aquí cada número tiene un candado asyncio: sus mensajes se
+# atienden de uno en uno y en orden de llegada. Los candados se eliminan en
+# cuanto nadie los usa (el mapa no crece con el número de clientes).
+#
+# Con RAFAGA_VENTANA_SEGUNDOS > 0 los mensajes que llegan dentro de la
+# ventana (o mientras el turno anterior sigue en Gemini) se agrupan en UNA
+# llamada. El primero del grupo recibe la respuesta; los demás devuelven
+# {"respuesta": None, "agrupado": True} y no envían nada.
+#
+# Alcance: un proceso. Con varios workers de uvicorn, el mismo cliente puede
+# caer en procesos distintos (la idempotencia y los $push atómicos siguen
+# protegiendo el historial).
+# ============================================================================
+
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from services.atencion_service import atender_mensaje
+from services.telefono_service import normalizar_telefono
+
+logger = logging.getLogger(__name__)
+
+RAFAGA_VENTANA_SEGUNDOS = float(os.getenv("RAFAGA_VENTANA_SEGUNDOS", "0"))
+
+class _Rafaga:
+    """Mensajes de un cliente aún no tomados por un turno"""
+
+    def __init__(self, texto):
+        self.textos = [texto]
+        self.agrupados = []  # futuros de los mensajes que se unieron
+
+class CoordinadorLeads:
+
+    def __init__(self, ventana=RAFAGA_VENTANA_SEGUNDOS):
+        self.ventana = ventana
+        self._candados = {}  # clave → [asyncio.Lock, usuarios]
+        self._rafagas = {}   # clave → _Rafaga abierta
+
+    @asynccontextmanager
+    async def turno(self, clave):
+        """Un solo mensaje de `clave` a la vez, en orden de llegada (Lock es FIFO)"""
+        entrada = self._candados.setdefault(clave, [asyncio.Lock(), 0])
+        entrada[1] += 1
+        try:
+            async with entrada[0]:
+                yield
+        finally:
+            entrada[1] -= 1
+            if entrada[1] == 0:
+                del self._candados[clave]
+
+    @property
+    def leads_activos(self):
+        return len(self._candados)
+
+    async def atender(self, numero, texto, message_sid=None):
+        """
+        Atiende el mensaje respetando el orden del cliente
+
+        message_sid identifica el mensaje (en una ráfaga, el del primero) para
+        que un reintento no duplique historial ni órdenes
+
+        Returns:
+            Resultado de atender_mensaje(), o {"success": True, "respuesta": None,
+            "agrupado": True} si el mensaje se respondió junto con otros
+        """
+        clave = normalizar_telefono(numero) or numero
+
+        if self.ventana <= 0:
+            async with self.turno(clave):
+                return await atender_mensaje(numero, texto, message_sid=message_sid)
+
+        rafaga = self._rafagas.get(clave)
+        if rafaga is not None:
+            rafaga.textos.append(texto)
+            futuro = asyncio.get_running_loop().create_future()
+            rafaga.agrupados.append(futuro)
+            logger.debug("[COORDINADOR] 🧺 %s: mensaje agrupado (%s en la ráfaga)", clave, len(rafaga.textos))
+            return await futuro
+
+        rafaga = _Rafaga(texto)
+        self._rafagas[clave] = rafaga
+        try:
+            await asyncio.sleep(self.ventana)
+            async with self.turno(clave):
+                # Desde aquí, los mensajes nuevos abren otra ráfaga
+                self._rafagas.pop(clave, None)
+                if len(rafaga.textos) > 1:
+                    logger.debug("[COORDINADOR] 🧺 %s: %s mensajes en una sola llamada", clave, len(rafaga.textos))
+                resultado = await atender_mensaje(
+                    numero,
+                    "\n".join(rafaga.textos),
+                    mensajes_cliente=rafaga.textos,
+                    message_sid=message_sid
+                )
+        except BaseException as e:
+            if self._rafagas.get(clave) is rafaga:
+                del self._rafagas[clave]
+            for futuro in rafaga.agrupados:
+                if not futuro.done():
+                    futuro.set_exception(e if isinstance(e, Exception) else RuntimeError("Ráfaga cancelada"))
+            raise
+
+        agrupado = {"success": resultado.get("success", False), "respuesta": None, "agrupado": True}
+        for futuro in rafaga.agrupados:
+            if not futuro.done():
+                futuro.set_result(agrupado)
+        return resultado
+
+coordinador_leads = CoordinadorLeads()
@@ -0,0 +1,213 @@
+# ============================================================================
+# RUTA: backend/services/historial_service.py
+# DESCRIPCIÓN: Historial de WhatsApp en buckets de tamaño fijo por lead
+# USO: Agregar mensajes y leer los últimos N sin cargar toda la conversación
+# ============================================================================
+#
+# Colecciones:
+#   conversaciones_whatsapp → cabecera por lead (numero_cliente, nombre_cliente,
+#                             total_mensajes, timestamp)
+#   mensajes_whatsapp       → {id_lead, bucket, mensajes: [...], cantidad}
+#                             índice único (id_lead, bucket)
+#
+# El mensaje número i (0-based) de un lead vive en el bucket i // BUCKET_SIZE.
+# El contador total_mensajes de la cabecera se incrementa de forma atómica,
+# así dos escritores concurrentes nunca compiten por la misma posición.
+#
+# agregar_mensajes(..., clave=MessageSid) es seguro ante reintentos: la
+# cabecera guarda las últimas HISTORIAL_CLAVES_RECIENTES claves y un
+# reintento del mismo mensaje no vuelve a agregarlo.
+# ============================================================================
+
+import os
+import logging
+from datetime import datetime
+from pymongo import ReturnDocument, UpdateOne
+from config.database import get_collection
+from config.indices import Indice, ConsultaIndexada, registrar_indices, registrar_consultas
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SIZE = int(os.getenv("HISTORIAL_BUCKET_SIZE", "50"))
+CLAVES_RECIENTES = int(os.getenv("HISTORIAL_CLAVES_RECIENTES", "50"))
+
+# ============================================================================
+# ÍNDICES
+# ============================================================================
+
+registrar_indices("conversaciones_whatsapp", Indice("id_lead"))
+registrar_indices("mensajes_whatsapp", Indice([("id_lead", 1), ("bucket", 1)], unique=True))
+
+# Las mismas consultas hacen los $lookup de contexto_service y
+# sales_flow_v3.cargar_estado_venta
+registrar_consultas(
+    "conversaciones_whatsapp",
+    ConsultaIndexada("cabecera del lead", {"id_lead": "lead"})
+)
+registrar_consultas(
+    "mensajes_whatsapp",
+    ConsultaIndexada("buckets más recientes", {"id_lead": "lead"}, orden=[("bucket", -1)]),
+    ConsultaIndexada("historial completo", {"id_lead": "lead"}, orden=[("bucket", 1)]),
+    ConsultaIndexada("rango de buckets", {"id_lead": "lead", "bucket": {"$gte": 0, "$lte": 1}})
+)
+
+# ============================================================================
+# ESCRITURA
+# ============================================================================
+
+def agregar_mensajes(id_lead, mensajes, numero_cliente=None, nombre_cliente=None, estado_venta=None, session=None, clave=None):
+    """
+    Agrega uno o más mensajes al historial del lead
+
+    Args:
+        id_lead: ID del lead (string)
+        mensajes: lista de {"emisor", "texto", "timestamp", ...}
+        numero_cliente / nombre_cliente: datos de cabecera (opcionales)
+        estado_venta: estado de venta ya avanzado con estos mensajes (opcional)
+        session: sesión de MongoDB (transacciones, opcional)
+        clave: MessageSid del turno (opcional); si ya se agregó, no se repite
+
+    Returns:
+        Total de mensajes del lead después de agregar
+    """
+    if not mensajes:
+        return 0
+
+    cabecera = {"timestamp": datetime.now()}
+    if numero_cliente is not None:
+        cabecera["numero_cliente"] = numero_cliente
+    if nombre_cliente is not None:
+        cabecera["nombre_cliente"] = nombre_cliente
+
+    actualizacion = {"$inc": {"total_mensajes": len(mensajes)}, "$set": cabecera}
+    if estado_venta is not None:
+        # Las señales solo se acumulan ($addToSet): un escritor concurrente no las pisa
+        cabecera["estado_venta.etapa"] = estado_venta["etapa"]
+        actualizacion["$addToSet"] = {"estado_venta.senales": {"$each": estado_venta["senales"]}}
+
+    conversaciones = get_collection("conversaciones_whatsapp")
+    conv = None
+    if clave:
+        actualizacion["$push"] = {"claves_recientes": {"$each": [clave], "$slice": -CLAVES_RECIENTES}}
+        conv = conversaciones.find_one_and_update(
+            {"id_lead": id_lead, "claves_recientes": {"$ne": clave}},
+            actualizacion,
+            projection={"total_mensajes": 1},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if conv is None:
+            repetido = conversaciones.find_one(
+                {"id_lead": id_lead, "claves_recientes": clave},
+                projection={"total_mensajes": 1},
+                session=session
+            )
+            if repetido is not None:
+                # Reintento de un turno ya guardado (p. ej. falló la orden)
+                logger.info("[HISTORIAL] ♻️  %s: mensajes ya guardados, no se repiten", clave)
+                return repetido["total_mensajes"]
+
+    if conv is None:
+        # Sin clave, o primera conversación del lead
+        conv = conversaciones.find_one_and_update(
+            {"id_lead": id_lead},
+            actualizacion,
+            projection={"total_mensajes": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+    total = conv["total_mensajes"]
+
+    # Repartir por bucket según la posición reservada
+    por_bucket = {}
+    for i, mensaje in enumerate(mensajes, start=total - len(mensajes)):
+        por_bucket.setdefault(i // BUCKET_SIZE, []).append(mensaje)
+
+    # Un solo round trip aunque los mensajes crucen el límite de un bucket
+    get_collection("mensajes_whatsapp").bulk_write([
+        UpdateOne(
+            {"id_lead": id_lead, "bucket": bucket},
+            {
+                "$push": {"mensajes": {"$each": lote}},
+                "$inc": {"cantidad": len(lote)},
+                "$set": {"ultimo": lote[-1].get("timestamp")}
+            },
+            upsert=True
+        )
+        for bucket, lote in por_bucket.items()
+    ], ordered=False, session=session)
+
+    return total
+
+def reescribir_historial(id_lead, mensajes):
+    """Reemplaza todo el historial del lead (migraciones y fusiones)"""
+    buckets = get_collection("mensajes_whatsapp")
+    buckets.delete_many({"id_lead": id_lead})
+
+    docs = []
+    for inicio in range(0, len(mensajes), BUCKET_SIZE):
+        lote = mensajes[inicio:inicio + BUCKET_SIZE]
+        docs.append({
+            "id_lead": id_lead,
+            "bucket": inicio // BUCKET_SIZE,
+            "mensajes": lote,
+            "cantidad": len(lote),
+            "ultimo": lote[-1].get("timestamp")
+        })
+    if docs:
+        buckets.insert_many(docs)
+
+    get_collection("conversaciones_whatsapp").update_one(
+        {"id_lead": id_lead},
+        {"$set": {"total_mensajes": len(mensajes)}, "$unset": {"mensajes": ""}},
+        upsert=True
+    )
+
+# ============================================================================
+# LECTURA
+# ============================================================================
+
+def buckets_necesarios(limite):
+    """Buckets a leer para garantizar `limite` mensajes (el último puede estar casi vacío)"""
+    return -(-limite // BUCKET_SIZE) + 1
+
+def unir_buckets(buckets, limite=None):
+    """Concatena buckets (en cualquier orden) y devuelve los últimos `limite` mensajes"""
+    mensajes = []
+    for bucket in sorted(buckets, key=lambda b: b["bucket"]):
+        mensajes.extend(bucket.get("mensajes", []))
+    return mensajes[-limite:] if limite else mensajes
+
+def obtener_ultimos_mensajes(id_lead, limite=10):
+    """Últimos N mensajes leyendo solo los buckets más recientes"""
+    if limite <= 0:
+        return []
+    buckets = get_collection("mensajes_whatsapp").find(
+        {"id_lead": id_lead},
+        {"mensajes": 1, "bucket": 1},
+        sort=[("bucket", -1)],
+        limit=buckets_necesarios(limite)
+    )
+    return unir_buckets(buckets, limite)
+
+def obtener_todos_los_mensajes(id_lead):
+    """Historial completo en orden (solo para procesos batch)"""
+    buckets = get_collection("mensajes_whatsapp").find(
+        {"id_lead": id_lead},
+        {"mensajes": 1, "bucket": 1},
+        sort=[("bucket", 1)]
+    )
+    return unir_buckets(buckets)
+
+def obtener_mensajes_rango(id_lead, inicio, fin):
+    """Mensajes [inicio, fin) del lead (posiciones 0-based), solo de sus buckets"""
+    if fin <= inicio:
+        return []
+    primero, ultimo = inicio // BUCKET_SIZE, (fin - 1) // BUCKET_SIZE
+    buckets = get_collection("mensajes_whatsapp").find(
+        {"id_lead": id_lead, "bucket": {"$gte": primero, "$lte": ultimo}},
+        {"mensajes": 1, "bucket": 1}
+    )
+    desplazamiento = inicio - primero * BUCKET_SIZE
+    return unir_buckets(buckets)[desplazamiento:desplazamiento + fin - inicio]
@@ -0,0 +1,223 @@
+# ============================================================================
+# RUTA: backend/services/idempotencia_service.py
+# DESCRIPCIÓN: Idempotencia de mensajes entrantes por MessageSid de Twilio
+# USO: resultado = await una_vez(message_sid, lambda: atender(...))
+# ============================================================================
+#
+# Twilio reintenta el webhook si tardamos más de 15s. Con el mismo MessageSid:
+#   1. LRU en memoria          → resultado ya calculado en este proceso
+#   2. Cálculo en curso aquí   → se espera al primero (no se recalcula)
+#   3. mensajes_procesados     → {_id: MessageSid, estado, resultado, creado}
+#                                con TTL; cubre reintentos que llegan a otro
+#                                worker o después de reiniciar
+# Si el primer cálculo falla, se borra la marca y el reintento recalcula.
+# Si falla guardar el resultado, se devuelve igual (queda en el LRU) y se
+# intenta borrar la marca.
+# Si la marca "procesando" tiene más de IDEMPOTENCIA_LEASE_SEGUNDOS (el
+# proceso murió), el siguiente intento la reclama.
+#
+# respuestas_entregadas guarda, por MessageSid, una respuesta que el
+# streaming ya envió al cliente aunque el mensaje falló después (no se pudo
+# guardar). El reintento la reutiliza: solo guarda, no vuelve a responder.
+# ============================================================================
+
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from config.database import get_async_collection
+from config.indices import Indice, registrar_indices
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCIA_TTL_HORAS = int(os.getenv("IDEMPOTENCIA_TTL_HORAS", "48"))
+IDEMPOTENCIA_LRU = int(os.getenv("IDEMPOTENCIA_LRU", "2000"))
+IDEMPOTENCIA_ESPERA_SEGUNDOS = float(os.getenv("IDEMPOTENCIA_ESPERA_SEGUNDOS", "30"))
+IDEMPOTENCIA_LEASE_SEGUNDOS = int(os.getenv("IDEMPOTENCIA_LEASE_SEGUNDOS", "120"))
+
+class DuplicadoEnCurso(Exception):
+    """Otro proceso sigue calculando este MessageSid"""
+
+# Consultas solo por _id (MessageSid)
+registrar_indices(
+    "mensajes_procesados",
+    Indice("creado", expireAfterSeconds=IDEMPOTENCIA_TTL_HORAS * 3600)
+)
+registrar_indices(
+    "respuestas_entregadas",
+    Indice("creado", expireAfterSeconds=IDEMPOTENCIA_TTL_HORAS * 3600)
+)
+
+class Idempotencia:
+
+    def __init__(self, capacidad=IDEMPOTENCIA_LRU):
+        self.capacidad = capacidad
+        self._lru = OrderedDict()  # MessageSid → resultado
+        self._en_curso = {}        # MessageSid → asyncio.Future
+
+    # ========================================================================
+    # LRU
+    # ========================================================================
+
+    def _recordar(self, clave, resultado):
+        self._lru[clave] = resultado
+        self._lru.move_to_end(clave)
+        while len(self._lru) > self.capacidad:
+            self._lru.popitem(last=False)
+
+    # ========================================================================
+    # MARCA DURABLE
+    # ========================================================================
+
+    async def _reclamar(self, clave):
+        """
+        Intenta quedarse con el cálculo de `clave`
+
+        Returns:
+            (True, None) si le toca calcular; (False, resultado) si ya estaba hecho
+        """
+        col = get_async_collection("mensajes_procesados")
+        ahora = datetime.now()
+        try:
+            await col.insert_one({"_id": clave, "estado": "procesando", "creado": ahora})
+            return True, None
+        except DuplicateKeyError:
+            pass
+
+        limite = ahora + timedelta(seconds=IDEMPOTENCIA_ESPERA_SEGUNDOS)
+        while True:
+            marca = await col.find_one({"_id": clave})
+            if marca is None:
+                # El primer intento falló y borró su marca: volver a reclamar
+                return await self._reclamar(clave)
+            if marca["estado"] == "completado":
+                return False, marca.get("resultado")
+
+            ahora = datetime.now()
+            if marca["creado"] < ahora - timedelta(seconds=IDEMPOTENCIA_LEASE_SEGUNDOS):
+                reclamada = await col.update_one(
+                    {"_id": clave, "estado": "procesando", "creado": marca["creado"]},
+                    {"$set": {"creado": ahora}}
+                )
+                if reclamada.modified_count:
+                    logger.warning("[IDEMPOTENCIA] ⚠️  %s: cálculo anterior abandonado, se reclama", clave)
+                    return True, None
+            if ahora >= limite:
+                raise DuplicadoEnCurso(clave)
+            await asyncio.sleep(0.5)
+
+    async def _completar(self, clave, resultado):
+        """Marca `clave` como completada; si no se puede, borra la marca"""
+        col = get_async_collection("mensajes_procesados")
+        try:
+            await col.update_one(
+                {"_id": clave},
+                {"$set": {"estado": "completado", "resultado": resultado}}
+            )
+            return
+        except Exception as e:
+            logger.error("[IDEMPOTENCIA] ❌ %s: no se pudo guardar el resultado: %s", clave, e)
+
+        # El resultado ya está calculado: se devuelve y queda en el LRU. Una
+        # marca "procesando" huérfana haría esperar (y fallar) a los
+        # reintentos de otros workers hasta que venza el lease
+        try:
+            await col.delete_one({"_id": clave, "estado": "procesando"})
+        except Exception as e:
+            logger.error("[IDEMPOTENCIA] ❌ %s: no se pudo borrar la marca: %s", clave, e)
+
+    # ========================================================================
+    # API
+    # ========================================================================
+
+    async def una_vez(self, clave, calcular):
+        """
+        Ejecuta `calcular()` (corrutina) una sola vez por clave
+
+        Args:
+            clave: MessageSid (None → sin deduplicación)
+            calcular: función sin argumentos que devuelve una corrutina;
+                      el resultado debe ser serializable en BSON
+        """
+        if not clave:
+            return await calcular()
+
+        if clave in self._lru:
+            self._lru.move_to_end(clave)
+            logger.info("[IDEMPOTENCIA] ♻️  %s: reintento, respuesta en memoria", clave)
+            return self._lru[clave]
+
+        if clave in self._en_curso:
+            logger.info("[IDEMPOTENCIA] ⏳ %s: duplicado en curso, esperando al primero", clave)
+            return await asyncio.shield(self._en_curso[clave])
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_curso[clave] = futuro
+        try:
+            calcula, resultado = await self._reclamar(clave)
+            if calcula:
+                try:
+                    resultado = await calcular()
+                except BaseException:
+                    await get_async_collection("mensajes_procesados").delete_one(
+                        {"_id": clave, "estado": "procesando"}
+                    )
+                    raise
+                await self._completar(clave, resultado)
+            else:
+                logger.info("[IDEMPOTENCIA] ♻️  %s: reintento, respuesta guardada", clave)
+
+            self._recordar(clave, resultado)
+            futuro.set_result(resultado)
+            return resultado
+
+        except asyncio.CancelledError:
+            futuro.cancel()
+            raise
+        except Exception as e:
+            futuro.set_exception(e)
+            # Puede no haber duplicados esperando: marcar la excepción como leída
+            futuro.exception()
+            raise
+        finally:
+            self._en_curso.pop(clave, None)
+
+idempotencia = Idempotencia()
+
+async def una_vez(clave, calcular):
+    return await idempotencia.una_vez(clave, calcular)
+
+# ============================================================================
+# RESPUESTAS YA ENTREGADAS (streaming)
+# ============================================================================
+
+async def guardar_respuesta_entregada(clave, respuesta):
+    """
+    Recuerda que la respuesta de `clave` ya salió (toda o en parte)
+
+    Args:
+        respuesta: {"respuesta", "pendiente", "origen"}
+
+    Returns:
+        True si quedó guardada
+    """
+    try:
+        await get_async_collection("respuestas_entregadas").update_one(
+            {"_id": clave},
+            {"$set": {**respuesta, "parcial": True, "creado": datetime.now()}},
+            upsert=True
+        )
+        return True
+    except Exception as e:
+        logger.error("[IDEMPOTENCIA] ❌ %s: no se pudo recordar la respuesta entregada: %s", clave, e)
+        return False
+
+async def respuesta_entregada(clave):
+    """Respuesta que un intento anterior de `clave` ya entregó, o None"""
+    if not clave:
+        return None
+    return await get_async_collection("respuestas_entregadas").find_one(
+        {"_id": clave}, {"_id": 0, "respuesta": 1, "pendiente": 1, "origen": 1}
+    )
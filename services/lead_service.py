@@ -7,10 +7,26 @@
 import logging
 from bson.objectid import ObjectId
 from datetime import datetime
+from pymongo.errors import DuplicateKeyError
 from config.database import get_collection
+from config.indices import Indice, ConsultaIndexada, registrar_indices, registrar_consultas
+from services.telefono_service import normalizar_telefono
+from services.historial_service import agregar_mensajes, obtener_ultimos_mensajes
 
 logger = logging.getLogger(__name__)
 
+# ============================================================================
+# ÍNDICES
+# ============================================================================
+
+# sparse: los leads sin teléfono no tienen clave y no deben chocar entre sí
+registrar_indices("leads", Indice("telefono_canonico", unique=True, sparse=True))
+registrar_consultas(
+    "leads",
+    # También el $match de contexto_service.cargar_contexto
+    ConsultaIndexada("lead por teléfono canónico", {"telefono_canonico": "+593999999999"})
+)
+
 # ===== LEADS =====
 
 def crear_lead(nombre: str = None, telefono: str = None, email: str = None, direccion: str = None) -> dict:
@@ -20,30 +36,24 @@ def crear_lead(nombre: str = None, telefono: str = None, email: str = None, dire
             return {"success": False, "error": "El teléfono es requerido"}
         
         # ════════════════════════════════════════════════════════════════
-        # NORMALIZAR TELÉFONO AL GUARDAR
+        # NORMALIZAR TELÉFONO AL GUARDAR (clave canónica E.164)
         # ════════════════════════════════════════════════════════════════
         
-        telefono_limpio = telefono.replace(" ", "").replace("-", "").replace("(", "").replace(")", "")
+        telefono_normalizado = normalizar_telefono(telefono)
         
-        # Si empieza con 0, convertir a +593
-        if telefono_limpio.startswith("0"):
-            telefono_normalizado = "+593" + telefono_limpio[1:]
-        # Si empieza con 593, agregar +
-        elif telefono_limpio.startswith("593"):
-            telefono_normalizado = "+" + telefono_limpio
-        # Si ya tiene +593, dejar como está
-        elif telefono_limpio.startswith("+593"):
-            telefono_normalizado = telefono_limpio
-        else:
-            telefono_normalizado = telefono_limpio
+        # Sin dígitos no hay clave: "" chocaría en el índice único con otro
+        # lead igual de inválido (y se devolvería ese lead ajeno)
+        if not telefono_normalizado:
+            return {"success": False, "error": "Teléfono inválido"}
         
-        logger.info(f"[LEAD] 📱 Teléfono normalizado: {telefono} → {telefono_normalizado}")
+        logger.debug("[LEAD] 📱 Teléfono normalizado: %s → %s", telefono, telefono_normalizado)
         
         leads = get_collection("leads")
         
         lead_data = {
             "nombre": nombre,
             "telefono": telefono_normalizado,  # ← GUARDAR NORMALIZADO
+            "telefono_canonico": telefono_normalizado,  # ← ÍNDICE ÚNICO
             "email": email,
             "direccion_entrega": direccion,
             "estado_compra": "lead",
@@ -51,8 +61,19 @@ def crear_lead(nombre: str = None, telefono: str = None, email: str = None, dire
             "timestamp": datetime.now()
         }
         
-        result = leads.insert_one(lead_data)
-        logger.info(f"✅ Lead creado: {result.inserted_id}")
+        try:
+            result = leads.insert_one(lead_data)
+        except DuplicateKeyError:
+            # Otro request creó el mismo lead en paralelo: devolver ese
+            existente = leads.find_one({"telefono_canonico": telefono_normalizado})
+            logger.info("ℹ️ Lead ya existía: %s", existente["_id"])
+            return {
+                "success": True,
+                "id": str(existente["_id"]),
+                "data": existente
+            }
+        
+        logger.info("✅ Lead creado: %s", result.inserted_id)
         
         return {
             "success": True,
@@ -60,57 +81,26 @@ def crear_lead(nombre: str = None, telefono: str = None, email: str = None, dire
             "data": lead_data
         }
     except Exception as e:
-        logger.error(f"❌ Error creando lead: {e}")
+        logger.error("❌ Error creando lead: %s", e)
         return {"success": False, "error": str(e)}
 
 def obtener_lead_por_telefono(telefono: str) -> dict:
-    """Obtiene un lead por teléfono - Busca en MÚLTIPLES FORMATOS"""
+    """Obtiene un lead por teléfono (cualquier formato, 1 consulta indexada)"""
     try:
-        logger.info(f"[LEAD] 🔍 Buscando: {telefono}")
+        telefono_canonico = normalizar_telefono(telefono)
+        logger.debug("[LEAD] 🔍 Buscando: %s", telefono_canonico)
         
         leads = get_collection("leads")
+        lead = leads.find_one({"telefono_canonico": telefono_canonico})
         
-        # BÚSQUEDA 1: Exacta
-        lead = leads.find_one({"telefono": telefono})
         if lead:
-            lead["_id"] = str(lead["_id"])
-            logger.info(f"[LEAD] ✅ Encontrado (exacta)")
+            logger.debug("[LEAD] ✅ Encontrado")
             return {"success": True, "data": lead}
         
-        # BÚSQUEDA 2: Convertir 0983200438 → +593983200438
-        if telefono.startswith("0"):
-            telefono_alt = "+593" + telefono[1:]
-            logger.info(f"[LEAD] ℹ️  Intentando: {telefono_alt}")
-            lead = leads.find_one({"telefono": telefono_alt})
-            if lead:
-                lead["_id"] = str(lead["_id"])
-                logger.info(f"[LEAD] ✅ Encontrado (con +593)")
-                return {"success": True, "data": lead}
-        
-        # BÚSQUEDA 3: Convertir +593983200438 → 0983200438
-        if telefono.startswith("+593"):
-            telefono_alt = "0" + telefono[4:]
-            logger.info(f"[LEAD] ℹ️  Intentando: {telefono_alt}")
-            lead = leads.find_one({"telefono": telefono_alt})
-            if lead:
-                lead["_id"] = str(lead["_id"])
-                logger.info(f"[LEAD] ✅ Encontrado (con 0)")
-                return {"success": True, "data": lead}
-        
-        # BÚSQUEDA 4: Sin el +
-        telefono_sin_plus = telefono.lstrip("+")
-        if telefono_sin_plus != telefono:
-            logger.info(f"[LEAD] ℹ️  Intentando: {telefono_sin_plus}")
-            lead = leads.find_one({"telefono": telefono_sin_plus})
-            if lead:
-                lead["_id"] = str(lead["_id"])
-                logger.info(f"[LEAD] ✅ Encontrado (sin +)")
-                return {"success": True, "data": lead}
-        
-        logger.warning(f"[LEAD] ❌ No encontrado")
+        logger.warning("[LEAD] ❌ No encontrado")
         return {"success": False, "mensaje": "Lead no encontrado"}
     except Exception as e:
-        logger.error(f"❌ Error obteniendo lead: {e}")
+        logger.error("❌ Error obteniendo lead: %s", e)
         return {"success": False, "error": str(e)}
 
 def actualizar_lead(lead_id: str, datos: dict) -> dict:
@@ -126,12 +116,12 @@ def actualizar_lead(lead_id: str, datos: dict) -> dict:
         )
         
         if result.modified_count > 0:
-            logger.info(f"✅ Lead actualizado: {lead_id}")
+            logger.info("✅ Lead actualizado: %s", lead_id)
             return {"success": True, "mensaje": "Lead actualizado"}
         
         return {"success": False, "mensaje": "Lead no encontrado"}
     except Exception as e:
-        logger.error(f"❌ Error actualizando lead: {e}")
+        logger.error("❌ Error actualizando lead: %s", e)
         return {"success": False, "error": str(e)}
 
 def actualizar_estado_compra(lead_id: str, nuevo_estado: str) -> dict:
@@ -145,12 +135,12 @@ def actualizar_estado_compra(lead_id: str, nuevo_estado: str) -> dict:
         )
         
         if result.modified_count > 0:
-            logger.info(f"✅ Estado de compra actualizado: {nuevo_estado}")
+            logger.info("✅ Estado de compra actualizado: %s", nuevo_estado)
             return {"success": True}
         
         return {"success": False}
     except Exception as e:
-        logger.error(f"❌ Error: {e}")
+        logger.error("❌ Error: %s", e)
         return {"success": False, "error": str(e)}
 
 def guardar_orden_de_compra(id_lead: str, productos: list, total: float, metodo_pago: str, direccion_entrega: str = None) -> dict:
@@ -169,14 +159,14 @@ def guardar_orden_de_compra(id_lead: str, productos: list, total: float, metodo_
         }
         
         result = ordenes.insert_one(orden_data)
-        logger.info(f"✅ Orden creada: {result.inserted_id}")
+        logger.info("✅ Orden creada: %s", result.inserted_id)
         
         return {
             "success": True,
             "id": str(result.inserted_id)
         }
     except Exception as e:
-        logger.error(f"❌ Error: {e}")
+        logger.error("❌ Error: %s", e)
         return {"success": False, "error": str(e)}
 
 # ===== CONVERSACIONES =====
@@ -184,8 +174,6 @@ def guardar_orden_de_compra(id_lead: str, productos: list, total: float, metodo_
 def guardar_mensaje(id_lead: str, numero_cliente: str, emisor: str, texto: str, message_sid: str = None) -> dict:
     """Guarda un mensaje en el historial"""
     try:
-        conversaciones = get_collection("conversaciones_whatsapp")
-        
         mensaje = {
             "emisor": emisor,
             "texto": texto,
@@ -193,32 +181,19 @@ def guardar_mensaje(id_lead: str, numero_cliente: str, emisor: str, texto: str,
             "message_sid": message_sid
         }
         
-        conversaciones.update_one(
-            {"id_lead": id_lead},
-            {
-                "$push": {"mensajes": mensaje},
-                "$set": {"numero_cliente": numero_cliente, "timestamp": datetime.now()}
-            },
-            upsert=True
-        )
+        agregar_mensajes(id_lead, [mensaje], numero_cliente=numero_cliente)
         
-        logger.info(f"✅ Mensaje guardado para lead: {id_lead}")
+        logger.debug("✅ Mensaje guardado para lead: %s", id_lead)
         return {"success": True, "mensaje": "Mensaje guardado"}
     except Exception as e:
-        logger.error(f"❌ Error guardando mensaje: {e}")
+        logger.error("❌ Error guardando mensaje: %s", e)
         return {"success": False, "error": str(e)}
 
 def obtener_historial(id_lead: str, limite: int = 20) -> dict:
     """Obtiene el historial de una conversación"""
     try:
-        conversaciones = get_collection("conversaciones_whatsapp")
-        result = conversaciones.find_one({"id_lead": id_lead})
-        
-        if result and "mensajes" in result:
-            mensajes = result["mensajes"][-limite:]
-            return {"success": True, "data": mensajes}
-        
-        return {"success": True, "data": []}
+        mensajes = obtener_ultimos_mensajes(id_lead, limite)
+        return {"success": True, "data": mensajes}
     except Exception as e:
-        logger.error(f"❌ Error obteniendo historial: {e}")
+        logger.error("❌ Error obteniendo historial: %s", e)
         return {"success": False, "error": str(e)}
\ No newline at end of file
@@ -6,32 +6,89 @@
 import logging
 from datetime import datetime
 from config.database import get_collection
+from config.indices import Indice, ConsultaIndexada, registrar_indices, registrar_consultas
+from services.secuencia_service import siguiente_codigo_entrega
 from bson import ObjectId
 
 logger = logging.getLogger(__name__)
 
+# ============================================================================
+# ÍNDICES
+# ============================================================================
+
+# codigo_entrega (único): secuencia_service
+registrar_indices("ordenes", Indice("id_lead"), Indice("estado"))
+registrar_consultas(
+    "ordenes",
+    ConsultaIndexada("órdenes de un lead (fusión de leads)", {"id_lead": "lead"}),
+    ConsultaIndexada("órdenes por estado", {"estado": "pendiente"})
+)
+
 # ============================================================================
 # FUNCIÓN 1: GENERAR CÓDIGO ÚNICO DE ENTREGA
 # ============================================================================
 
 def generar_codigo_entrega():
-    """Genera código único: FRES-2026-000001"""
-    try:
-        logger.info("[ORDEN_V3] 🔢 Generando código entrega...")
-        
-        ord_col = get_collection("ordenes")
-        total = ord_col.count_documents({})
-        numero = total + 1
-        
-        year = datetime.now().year
-        codigo = f"FRES-{year}-{numero:06d}"
-        
-        logger.info(f"[ORDEN_V3] ✅ Código: {codigo}")
-        return codigo
-    
-    except Exception as e:
-        logger.error(f"[ORDEN_V3] ❌ Error: {e}")
-        return "FRES-ERROR"
+    """
+    Genera código único: FRES-2026-000001
+
+    Si la secuencia falla, la excepción sube: un código fijo de respaldo
+    chocaría con el índice único de ordenes.codigo_entrega
+    """
+    logger.debug("[ORDEN_V3] 🔢 Generando código entrega...")
+
+    # Contador atómico por año (no count_documents: dos órdenes a la vez repetían código)
+    codigo = siguiente_codigo_entrega()
+
+    logger.debug("[ORDEN_V3] ✅ Código: %s", codigo)
+    return codigo
+
+# ============================================================================
+# DOCUMENTOS DE ORDEN Y PAGO (sin escribir en BD)
+# ============================================================================
+
+ESTADOS_ORDEN = {
+    "contraentrega": "pendiente_entrega",
+    "presencial": "pendiente_pago_local"
+}
+
+def construir_orden(id_lead, nombre_producto, cantidad, precio_unitario, metodo_pago, direccion=None):
+    """Documento de orden listo para insertar (con _id y código ya asignados)"""
+    total = precio_unitario * cantidad
+    return {
+        "_id": ObjectId(),
+        "id_lead": ObjectId(id_lead),
+        "numero_cliente": None,  # Se obtiene de lead después
+        "productos": [
+            {
+                "nombre": nombre_producto,
+                "precio": precio_unitario,
+                "cantidad": cantidad,
+                "subtotal": total
+            }
+        ],
+        "total": total,
+        "metodo_pago": metodo_pago,
+        "direccion_entrega": direccion,  # None en presencial (no aplica)
+        "codigo_entrega": generar_codigo_entrega(),
+        "estado": ESTADOS_ORDEN[metodo_pago],
+        "pagado": False,
+        "fecha_orden": datetime.now(),
+        "timestamp": datetime.now()
+    }
+
+def construir_pago_info(metodo_pago, total, direccion=None):
+    """Subdocumento pago_info del lead"""
+    pago_info = {
+        "tipo_pago": metodo_pago,
+        "total": total,
+        "estado": "pendiente_entrega" if metodo_pago == "contraentrega" else "pendiente_pago",
+        "pagado": False,
+        "timestamp_pedido": datetime.now()
+    }
+    if direccion:
+        pago_info["direccion_entrega"] = direccion
+    return pago_info
 
 # ============================================================================
 # FUNCIÓN 2: CREAR ORDEN CONTRAENTREGA
@@ -40,46 +97,23 @@ def generar_codigo_entrega():
 def crear_orden_contraentrega(id_lead, nombre_producto, cantidad, precio_unitario, direccion):
     """Crea orden para CONTRAENTREGA"""
     try:
-        logger.info("=" * 80)
-        logger.info("[ORDEN_V3] 📦 CREANDO ORDEN CONTRAENTREGA")
-        logger.info(f"[ORDEN_V3] Lead: {id_lead}")
-        logger.info(f"[ORDEN_V3] Producto: {nombre_producto} x{cantidad}")
-        logger.info(f"[ORDEN_V3] Precio: ${precio_unitario} c/u")
-        logger.info(f"[ORDEN_V3] Dirección: {direccion}")
+        logger.debug(
+            "[ORDEN_V3] 📦 Creando orden contraentrega: %s x%s a $%s c/u, lead %s, dirección %s",
+            nombre_producto, cantidad, precio_unitario, id_lead, direccion
+        )
         
-        total = precio_unitario * cantidad
-        codigo = generar_codigo_entrega()
+        orden_data = construir_orden(id_lead, nombre_producto, cantidad, precio_unitario, "contraentrega", direccion)
+        total = orden_data["total"]
+        codigo = orden_data["codigo_entrega"]
         
         ord_col = get_collection("ordenes")
         
-        orden_data = {
-            "id_lead": ObjectId(id_lead),
-            "numero_cliente": None,  # Se obtiene de lead después
-            "productos": [
-                {
-                    "nombre": nombre_producto,
-                    "precio": precio_unitario,
-                    "cantidad": cantidad,
-                    "subtotal": total
-                }
-            ],
-            "total": total,
-            "metodo_pago": "contraentrega",
-            "direccion_entrega": direccion,
-            "codigo_entrega": codigo,
-            "estado": "pendiente_entrega",
-            "pagado": False,
-            "fecha_orden": datetime.now(),
-            "timestamp": datetime.now()
-        }
-        
         result = ord_col.insert_one(orden_data)
         
-        logger.info(f"[ORDEN_V3] ✅ Orden creada: {result.inserted_id}")
-        logger.info(f"[ORDEN_V3] 💰 Total: ${total}")
-        logger.info(f"[ORDEN_V3] 📍 Entrega: {direccion}")
-        logger.info(f"[ORDEN_V3] 📋 Código: {codigo}")
-        logger.info("=" * 80)
+        logger.info(
+            "[ORDEN_V3] ✅ Orden contraentrega %s creada (total $%s)", codigo, total,
+            extra={"id_orden": result.inserted_id, "id_lead": id_lead, "codigo": codigo}
+        )
         
         return {
             "success": True,
@@ -91,7 +125,7 @@ def crear_orden_contraentrega(id_lead, nombre_producto, cantidad, precio_unitari
         }
     
     except Exception as e:
-        logger.error(f"[ORDEN_V3] ❌ Error: {e}", exc_info=True)
+        logger.error("[ORDEN_V3] ❌ Error: %s", e, exc_info=True)
         return {"success": False, "error": str(e)}
 
 # ============================================================================
@@ -101,45 +135,23 @@ def crear_orden_contraentrega(id_lead, nombre_producto, cantidad, precio_unitari
 def crear_orden_presencial(id_lead, nombre_producto, cantidad, precio_unitario):
     """Crea orden para PRESENCIAL"""
     try:
-        logger.info("=" * 80)
-        logger.info("[ORDEN_V3] 🏪 CREANDO ORDEN PRESENCIAL")
-        logger.info(f"[ORDEN_V3] Lead: {id_lead}")
-        logger.info(f"[ORDEN_V3] Producto: {nombre_producto} x{cantidad}")
-        logger.info(f"[ORDEN_V3] Precio: ${precio_unitario} c/u")
+        logger.debug(
+            "[ORDEN_V3] 🏪 Creando orden presencial: %s x%s a $%s c/u, lead %s",
+            nombre_producto, cantidad, precio_unitario, id_lead
+        )
         
-        total = precio_unitario * cantidad
-        codigo = generar_codigo_entrega()
+        orden_data = construir_orden(id_lead, nombre_producto, cantidad, precio_unitario, "presencial")
+        total = orden_data["total"]
+        codigo = orden_data["codigo_entrega"]
         
         ord_col = get_collection("ordenes")
         
-        orden_data = {
-            "id_lead": ObjectId(id_lead),
-            "numero_cliente": None,
-            "productos": [
-                {
-                    "nombre": nombre_producto,
-                    "precio": precio_unitario,
-                    "cantidad": cantidad,
-                    "subtotal": total
-                }
-            ],
-            "total": total,
-            "metodo_pago": "presencial",
-            "direccion_entrega": None,  # No aplica
-            "codigo_entrega": codigo,
-            "estado": "pendiente_pago_local",
-            "pagado": False,
-            "fecha_orden": datetime.now(),
-            "timestamp": datetime.now()
-        }
-        
         result = ord_col.insert_one(orden_data)
         
-        logger.info(f"[ORDEN_V3] ✅ Orden creada: {result.inserted_id}")
-        logger.info(f"[ORDEN_V3] 💰 Total: ${total}")
-        logger.info(f"[ORDEN_V3] 📋 Código: {codigo}")
-        logger.info(f"[ORDEN_V3] 📍 Local: Av. Maldonado e Islas Malvinas, Quito")
-        logger.info("=" * 80)
+        logger.info(
+            "[ORDEN_V3] ✅ Orden presencial %s creada (total $%s)", codigo, total,
+            extra={"id_orden": result.inserted_id, "id_lead": id_lead, "codigo": codigo}
+        )
         
         return {
             "success": True,
@@ -151,7 +163,7 @@ def crear_orden_presencial(id_lead, nombre_producto, cantidad, precio_unitario):
         }
     
     except Exception as e:
-        logger.error(f"[ORDEN_V3] ❌ Error: {e}", exc_info=True)
+        logger.error("[ORDEN_V3] ❌ Error: %s", e, exc_info=True)
         return {"success": False, "error": str(e)}
 
 # ============================================================================
@@ -161,31 +173,22 @@ def crear_orden_presencial(id_lead, nombre_producto, cantidad, precio_unitario):
 def guardar_metodo_pago_en_lead(id_lead, metodo_pago, total, direccion=None):
     """Guarda método de pago en documento de lead"""
     try:
-        logger.info(f"[ORDEN_V3] 💳 Guardando método pago en lead...")
+        logger.debug("[ORDEN_V3] 💳 Guardando método pago en lead...")
         
         leads_col = get_collection("leads")
         
-        pago_info = {
-            "tipo_pago": metodo_pago,
-            "total": total,
-            "estado": "pendiente_entrega" if metodo_pago == "contraentrega" else "pendiente_pago",
-            "pagado": False,
-            "timestamp_pedido": datetime.now()
-        }
-        
-        if direccion:
-            pago_info["direccion_entrega"] = direccion
+        pago_info = construir_pago_info(metodo_pago, total, direccion)
         
         leads_col.update_one(
             {"_id": ObjectId(id_lead)},
             {"$set": {"pago_info": pago_info}}
         )
         
-        logger.info(f"[ORDEN_V3] ✅ Método pago guardado en lead")
+        logger.debug("[ORDEN_V3] ✅ Método pago guardado en lead")
         return {"success": True}
     
     except Exception as e:
-        logger.error(f"[ORDEN_V3] ❌ Error: {e}")
+        logger.error("[ORDEN_V3] ❌ Error: %s", e)
         return {"success": False, "error": str(e)}
 
 # ============================================================================
@@ -195,7 +198,7 @@ def guardar_metodo_pago_en_lead(id_lead, metodo_pago, total, direccion=None):
 def confirmar_pago(id_orden):
     """Marca orden como pagada"""
     try:
-        logger.info(f"[ORDEN_V3] ✅ Confirmando pago de orden...")
+        logger.debug("[ORDEN_V3] ✅ Confirmando pago de orden...")
         
         ord_col = get_collection("ordenes")
         
@@ -210,11 +213,11 @@ def confirmar_pago(id_orden):
             }
         )
         
-        logger.info(f"[ORDEN_V3] ✅ Orden pagada: {id_orden}")
+        logger.info("[ORDEN_V3] ✅ Orden pagada: %s", id_orden)
         return {"success": True}
     
     except Exception as e:
-        logger.error(f"[ORDEN_V3] ❌ Error: {e}")
+        logger.error("[ORDEN_V3] ❌ Error: %s", e)
         return {"success": False, "error": str(e)}
 
 # ============================================================================
@@ -224,19 +227,19 @@ def confirmar_pago(id_orden):
 def obtener_orden(id_orden):
     """Obtiene orden de la BD"""
     try:
-        logger.info(f"[ORDEN_V3] 📋 Buscando orden...")
+        logger.debug("[ORDEN_V3] 📋 Buscando orden...")
         
         ord_col = get_collection("ordenes")
         orden = ord_col.find_one({"_id": ObjectId(id_orden)})
         
         if orden:
             orden["_id"] = str(orden["_id"])
-            logger.info(f"[ORDEN_V3] ✅ Orden encontrada")
+            logger.debug("[ORDEN_V3] ✅ Orden encontrada")
             return orden
         
-        logger.warning(f"[ORDEN_V3] ⚠️  Orden no encontrada")
+        logger.warning("[ORDEN_V3] ⚠️  Orden no encontrada")
         return None
     
     except Exception as e:
-        logger.error(f"[ORDEN_V3] ❌ Error: {e}")
+        logger.error("[ORDEN_V3] ❌ Error: %s", e)
         return None
\ No newline at end of file
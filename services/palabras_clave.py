@@ -0,0 +1,140 @@
+# ============================================================================
+# RUTA: backend/services/palabras_clave.py
+# DESCRIPCIÓN: Matcher de palabras clave compilado (una regex por tabla)
+# USO: Base de los detectores de producto, método de pago y dirección
+# ============================================================================
+#
+# Cada tabla de palabras clave se compila UNA vez en una sola alternación
+# (factorizada como trie), con límites de palabra y plegado de acentos
+# ("frigorífico" = "frigorifico"). Una pasada sobre el mensaje devuelve todas
+# las coincidencias con su posición.
+# ============================================================================
+
+import re
+import unicodedata
+from typing import NamedTuple
+
+# ============================================================================
+# PLEGADO DE ACENTOS
+# ============================================================================
+
+def _construir_tabla_plegado():
+    """Tabla 1:1 (misma longitud) para que las posiciones sigan siendo válidas"""
+    tabla = {}
+    for codigo in range(0xC0, 0x180):
+        caracter = chr(codigo)
+        base = unicodedata.normalize("NFD", caracter)[0]
+        if base != caracter and base.isalpha():
+            tabla[codigo] = base.lower()
+    return tabla
+
+_TABLA_PLEGADO = _construir_tabla_plegado()
+
+def plegar(texto: str) -> str:
+    """Minúsculas sin acentos, conservando la longitud del texto"""
+    if texto.isascii():
+        return texto.lower()
+    return texto.translate(_TABLA_PLEGADO).lower()
+
+# ============================================================================
+# TRIE → REGEX
+# ============================================================================
+
+def _construir_trie(palabras):
+    trie = {}
+    for palabra in palabras:
+        nodo = trie
+        for caracter in palabra:
+            nodo = nodo.setdefault(caracter, {})
+        nodo[""] = True
+    return trie
+
+def _patron_trie(nodo):
+    """Regex equivalente al trie; ante varias opciones prueba primero la más larga"""
+    ramas = [re.escape(c) + _patron_trie(hijo) for c, hijo in sorted(nodo.items()) if c]
+    if not ramas:
+        return ""
+    if len(ramas) == 1 and "" not in nodo:
+        return ramas[0]
+    return "(?:" + "|".join(ramas) + ")" + ("?" if "" in nodo else "")
+
+# ============================================================================
+# MATCHER
+# ============================================================================
+
+class Coincidencia(NamedTuple):
+    palabra: str      # palabra clave (plegada) que coincidió
+    grupo: str        # tabla de origen ("producto", "contraentrega", ...)
+    valor: object     # valor asociado en la tabla
+    inicio: int
+    fin: int
+
+class MatcherPalabras:
+    """
+    Matcher multi-patrón compilado.
+
+    Args:
+        tablas: {grupo: {palabra: valor}} o {grupo: [palabras]}
+                (en una lista, el valor es el propio grupo)
+        plurales: acepta "s"/"es" al final de cada palabra
+    """
+
+    def __init__(self, tablas, plurales=True):
+        self.entradas = {}
+        for grupo, palabras in tablas.items():
+            if not isinstance(palabras, dict):
+                palabras = {p: grupo for p in palabras}
+            for palabra, valor in palabras.items():
+                self.entradas.setdefault(plegar(palabra), []).append((grupo, valor))
+
+        sufijo = "(?:es|s)?" if plurales else ""
+        self.regex = re.compile(self._alternacion(self.entradas, sufijo))
+
+    @staticmethod
+    def _alternacion(palabras, sufijo):
+        """
+        Una alternación por tipo de extremo, cada una factorizada como trie
+        ("vitrina|vitrinas|visor" → "vi(?:trina(?:s)?|sor)"): el motor de
+        regex descarta cada posición con un solo carácter en lugar de probar
+        todas las palabras. Límites de palabra solo en los extremos
+        alfanuméricos ("av." no exige límite al final).
+        """
+        por_extremos = {}
+        for palabra in palabras:
+            extremos = (palabra[0].isalnum(), palabra[-1].isalnum())
+            por_extremos.setdefault(extremos, []).append(palabra)
+
+        alternativas = []
+        # Primero las palabras alfanuméricas en ambos extremos (la mayoría)
+        for (inicio, fin), grupo in sorted(por_extremos.items(), reverse=True):
+            patron = "(?:" + _patron_trie(_construir_trie(grupo)) + ")"
+            if inicio:
+                patron = r"\b" + patron
+            if fin:
+                patron += sufijo + r"\b"
+            alternativas.append(patron)
+        return "|".join(alternativas)
+
+    def _palabra(self, encontrado):
+        """Palabra clave de la tabla a partir del texto encontrado (quita el plural)"""
+        for corte in (0, 1, 2):
+            palabra = encontrado[:len(encontrado) - corte]
+            if palabra in self.entradas:
+                return palabra
+        return encontrado
+
+    def buscar(self, texto, grupos=None):
+        """Todas las coincidencias, en orden de aparición"""
+        coincidencias = []
+        for m in self.regex.finditer(plegar(texto)):
+            palabra = self._palabra(m.group(0))
+            for grupo, valor in self.entradas[palabra]:
+                if grupos is None or grupo in grupos:
+                    coincidencias.append(Coincidencia(palabra, grupo, valor, m.start(), m.end()))
+        return coincidencias
+
+def mas_especifica(coincidencias):
+    """La palabra clave más larga (más específica); a igual longitud, la primera"""
+    if not coincidencias:
+        return None
+    return min(coincidencias, key=lambda c: (-len(c.palabra), c.inicio))
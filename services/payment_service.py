@@ -7,6 +7,8 @@
 import logging
 from datetime import datetime
 from config.database import get_collection
+from services.palabras_clave import MatcherPalabras
+from services.secuencia_service import siguiente_codigo_entrega
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +20,23 @@ INFO_LOCAL = {
 
 DIAS_ENTREGA = 2  # 2 días hábiles laborales
 
+# ⭐ CONTRAENTREGA: pago al recibir
+PALABRAS_CONTRAENTREGA = [
+    "contraentrega", "contra entrega", "entregar", "a domicilio", 
+    "enviar a casa", "lo entregas", "me lo envíes", "me lo mandes"
+]
+
+# ⭐ PRESENCIAL: va al local
+PALABRAS_PRESENCIAL = [
+    "presencial", "local", "voy al local", "me acerco", "voy a ir", 
+    "paso por", "voy para allá", "en el local", "en tu local", "efectivo"
+]
+
+MATCHER_PAGO = MatcherPalabras({
+    "contraentrega": PALABRAS_CONTRAENTREGA,
+    "presencial": PALABRAS_PRESENCIAL
+})
+
 def detectar_opcion_pago(mensaje: str) -> dict:
     """
     Detecta SOLO 2 opciones de pago del cliente
@@ -28,8 +47,6 @@ def detectar_opcion_pago(mensaje: str) -> dict:
     Returns:
         dict con opción detectada
     """
-    mensaje_lower = mensaje.lower()
-    
     resultado = {
         "opcion_detectada": None,
         "es_contraentrega": False,
@@ -37,30 +54,20 @@ def detectar_opcion_pago(mensaje: str) -> dict:
         "confianza": False
     }
     
-    # ⭐ CONTRAENTREGA: pago al recibir
-    palabras_contraentrega = [
-        "contraentrega", "contra entrega", "entregar", "a domicilio", 
-        "enviar a casa", "lo entregas", "me lo envíes", "me lo mandes"
-    ]
+    grupos = {c.grupo for c in MATCHER_PAGO.buscar(mensaje)}
     
-    if any(p in mensaje_lower for p in palabras_contraentrega):
+    if "contraentrega" in grupos:
         resultado["opcion_detectada"] = "contraentrega"
         resultado["es_contraentrega"] = True
         resultado["confianza"] = True
-        logger.info(f"💳 Opción detectada: CONTRAENTREGA")
+        logger.debug("💳 Opción detectada: CONTRAENTREGA")
         return resultado
     
-    # ⭐ PRESENCIAL: va al local
-    palabras_presencial = [
-        "presencial", "local", "voy al local", "me acerco", "voy a ir", 
-        "paso por", "voy para allá", "en el local", "en tu local", "efectivo"
-    ]
-    
-    if any(p in mensaje_lower for p in palabras_presencial):
+    if "presencial" in grupos:
         resultado["opcion_detectada"] = "presencial"
         resultado["es_presencial"] = True
         resultado["confianza"] = True
-        logger.info(f"🏪 Opción detectada: PRESENCIAL")
+        logger.debug("🏪 Opción detectada: PRESENCIAL")
         return resultado
     
     return resultado
@@ -143,25 +150,15 @@ def generar_codigo_entrega(id_lead: str) -> str:
     
     Returns:
         Código con formato FRES-YYYY-XXXXXX
+
+    Raises:
+        Exception: si la secuencia falla (quien llama devuelve success False)
     """
-    try:
-        from datetime import datetime
-        from bson import ObjectId
-        
-        # Obtener número de orden (secuencial)
-        ordenes = get_collection("ordenes")
-        total_ordenes = ordenes.count_documents({})
-        numero_orden = total_ordenes + 1
-        
-        year = datetime.now().year
-        codigo = f"FRES-{year}-{numero_orden:06d}"
-        
-        logger.info(f"✅ Código generado: {codigo}")
-        return codigo
+    # Misma secuencia atómica que las órdenes
+    codigo = siguiente_codigo_entrega()
     
-    except Exception as e:
-        logger.error(f"❌ Error generando código: {e}")
-        return f"FRES-ERROR"
+    logger.debug("✅ Código generado: %s", codigo)
+    return codigo
 
 def guardar_estado_pago_contraentrega(id_lead: str, total: float, direccion_entrega: str) -> dict:
     """
@@ -196,7 +193,7 @@ def guardar_estado_pago_contraentrega(id_lead: str, total: float, direccion_entr
             {"$set": {"pago_info": pago_info}}
         )
         
-        logger.info(f"✅ Pago contraentrega guardado: {id_lead}")
+        logger.info("✅ Pago contraentrega guardado: %s", id_lead)
         return {
             "success": True,
             "tipo": "contraentrega",
@@ -205,7 +202,7 @@ def guardar_estado_pago_contraentrega(id_lead: str, total: float, direccion_entr
         }
     
     except Exception as e:
-        logger.error(f"❌ Error: {e}")
+        logger.error("❌ Error: %s", e)
         return {"success": False, "error": str(e)}
 
 def guardar_estado_pago_presencial(id_lead: str, total: float) -> dict:
@@ -239,7 +236,7 @@ def guardar_estado_pago_presencial(id_lead: str, total: float) -> dict:
             {"$set": {"pago_info": pago_info}}
         )
         
-        logger.info(f"✅ Pago presencial guardado: {id_lead}")
+        logger.info("✅ Pago presencial guardado: %s", id_lead)
         return {
             "success": True,
             "tipo": "presencial",
@@ -248,7 +245,7 @@ def guardar_estado_pago_presencial(id_lead: str, total: float) -> dict:
         }
     
     except Exception as e:
-        logger.error(f"❌ Error: {e}")
+        logger.error("❌ Error: %s", e)
         return {"success": False, "error": str(e)}
 
 def confirmar_pago(id_lead: str) -> dict:
@@ -270,9 +267,9 @@ def confirmar_pago(id_lead: str) -> dict:
             }
         )
         
-        logger.info(f"✅ Pago confirmado: {id_lead}")
+        logger.info("✅ Pago confirmado: %s", id_lead)
         return {"success": True}
     
     except Exception as e:
-        logger.error(f"❌ Error: {e}")
+        logger.error("❌ Error: %s", e)
         return {"success": False, "error": str(e)}
\ No newline at end of file
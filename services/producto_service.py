@@ -3,45 +3,44 @@
 # DESCRIPCIÓN: Servicio de Productos - Gestión del catálogo
 # USO: Buscar y obtener productos
 # ============================================================================
+#
+# Listado público (listar_productos): se sirve desde la caché del catálogo,
+# sin consultar MongoDB. Sin limite ni cursor devuelve el catálogo completo
+# (el contrato anterior); con ellos, paginación por cursor (_id del último
+# producto de la página anterior). Proyección de campos y JSON ya serializado
+# por versión del catálogo. El ETag sale de la versión + parámetros: si el catálogo no
+# cambió, la ruta responde 304 sin armar ni serializar nada.
+# ============================================================================
 
+import os
+import bisect
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
 from bson.objectid import ObjectId
 from config.database import get_collection
+from config.serializacion import a_json
+from services.catalogo_cache import catalogo_cache
+from config.indices import Indice, ConsultaIndexada, registrar_indices, registrar_consultas
 
 logger = logging.getLogger(__name__)
 
-def obtener_todos_productos() -> dict:
-    """Obtiene todos los productos"""
-    try:
-        productos = get_collection("productos")
-        resultado = list(productos.find())
-        
-        for p in resultado:
-            p["_id"] = str(p["_id"])
-        
-        return {"success": True, "total": len(resultado), "data": resultado}
-    except Exception as e:
-        logger.error(f"❌ Error obteniendo productos: {e}")
-        return {"success": False, "error": str(e)}
+# ============================================================================
+# ÍNDICES
+# ============================================================================
 
-def obtener_productos_por_categoria(categoria: str) -> dict:
-    """Obtiene productos de una categoría específica"""
-    try:
-        productos = get_collection("productos")
-        resultado = list(productos.find({"categoria": categoria, "activo": True}))
-        
-        for p in resultado:
-            p["_id"] = str(p["_id"])
-        
-        return {
-            "success": True,
-            "categoria": categoria,
-            "total": len(resultado),
-            "data": resultado
-        }
-    except Exception as e:
-        logger.error(f"❌ Error obteniendo productos por categoría: {e}")
-        return {"success": False, "error": str(e)}
+# Los listados salen de la caché del catálogo: en MongoDB solo quedan
+# el producto por _id y las categorías (distinct sobre el índice)
+registrar_indices(
+    "productos",
+    Indice([("categoria", 1), ("activo", 1)])
+)
+registrar_consultas(
+    "productos",
+    ConsultaIndexada("categorías", {}, distinct="categoria")
+)
 
 def obtener_producto_por_id(id_producto: str) -> dict:
     """Obtiene un producto específico"""
@@ -50,12 +49,11 @@ def obtener_producto_por_id(id_producto: str) -> dict:
         producto = productos.find_one({"_id": ObjectId(id_producto)})
         
         if producto:
-            producto["_id"] = str(producto["_id"])
             return {"success": True, "data": producto}
         
         return {"success": False, "mensaje": "Producto no encontrado"}
     except Exception as e:
-        logger.error(f"❌ Error obteniendo producto: {e}")
+        logger.error("❌ Error obteniendo producto: %s", e)
         return {"success": False, "error": str(e)}
 
 def obtener_categorias() -> dict:
@@ -66,22 +64,129 @@ def obtener_categorias() -> dict:
         
         return {"success": True, "data": categorias}
     except Exception as e:
-        logger.error(f"❌ Error obteniendo categorías: {e}")
+        logger.error("❌ Error obteniendo categorías: %s", e)
         return {"success": False, "error": str(e)}
 
-def obtener_producto_por_nombre(nombre: str) -> dict:
-    """Busca un producto por nombre"""
-    try:
-        productos = get_collection("productos")
-        producto = productos.find_one({
-            "nombre": {"$regex": nombre, "$options": "i"}
-        })
-        
-        if producto:
-            producto["_id"] = str(producto["_id"])
-            return {"success": True, "data": producto}
-        
-        return {"success": False, "mensaje": "Producto no encontrado"}
-    except Exception as e:
-        logger.error(f"❌ Error buscando producto: {e}")
-        return {"success": False, "error": str(e)}
\ No newline at end of file
+# ============================================================================
+# LISTADO PAGINADO (caché del catálogo + JSON por versión)
+# ============================================================================
+
+PRODUCTOS_LIMITE = int(os.getenv("PRODUCTOS_LIMITE", "20"))
+PRODUCTOS_LIMITE_MAX = 100
+PRODUCTOS_LISTADOS_CACHE = int(os.getenv("PRODUCTOS_LISTADOS_CACHE", "256"))
+CAMPOS_PUBLICOS = ("nombre", "categoria", "precio", "caracteristicas", "descripcion", "imagen")
+
+class Listado(NamedTuple):
+    """Parámetros normalizados de un listado + su ETag"""
+    version: str
+    categoria: str
+    cursor: str
+    limite: int
+    campos: tuple
+    etag: str
+
+_listados = None   # estado de la versión actual: se reemplaza entero, nunca a medias
+_lock_listados = threading.Lock()
+
+def _normalizar_campos(campos):
+    if not campos:
+        return CAMPOS_PUBLICOS
+    pedidos = tuple(c.strip() for c in campos.split(",") if c.strip() in CAMPOS_PUBLICOS)
+    return pedidos or CAMPOS_PUBLICOS
+
+def preparar_listado(cursor=None, limite=None, campos=None, categoria=None):
+    """
+    Normaliza los parámetros y calcula el ETag (sin armar el listado)
+
+    Args:
+        cursor: _id del último producto de la página anterior (None = primera)
+        limite: productos por página (1..PRODUCTOS_LIMITE_MAX). Sin limite ni
+            cursor: todos los productos; con cursor: PRODUCTOS_LIMITE
+        campos: "nombre,precio,..." (por defecto CAMPOS_PUBLICOS; _id siempre va)
+        categoria: solo productos de esa categoría
+    """
+    version = catalogo_cache.obtener()["version"]
+    if limite is None and cursor:
+        limite = PRODUCTOS_LIMITE
+    if limite is not None:
+        limite = min(max(1, limite), PRODUCTOS_LIMITE_MAX)
+    campos = _normalizar_campos(campos)
+    firma = f"{version}|{categoria or ''}|{cursor or ''}|{limite or 'todos'}|{','.join(campos)}"
+    etag = '"' + hashlib.sha1(firma.encode("utf-8")).hexdigest()[:20] + '"'
+    return Listado(version, categoria or None, cursor or None, limite, campos, etag)
+
+def _estado_version(snapshot):
+    """Productos ordenados por _id de la versión actual; al cambiar, se vacía la caché de JSON"""
+    global _listados
+    estado = _listados
+    if estado is None or estado["version"] != snapshot["version"]:
+        with _lock_listados:
+            estado = _listados
+            if estado is None or estado["version"] != snapshot["version"]:
+                ordenados = sorted(snapshot["productos"], key=lambda p: p["_id"])
+                estado = {
+                    "version": snapshot["version"],
+                    "ordenados": ordenados,
+                    "ids": [p["_id"] for p in ordenados],
+                    "cuerpos": OrderedDict()   # etag → JSON
+                }
+                _listados = estado
+    return estado
+
+def _armar_listado(estado, listado):
+    productos, ids = estado["ordenados"], estado["ids"]
+    inicio = bisect.bisect_right(ids, listado.cursor) if listado.cursor else 0
+
+    def incluido(producto):
+        return not listado.categoria or producto.get("categoria") == listado.categoria
+
+    total = sum(1 for producto in productos if incluido(producto))
+    pagina = []
+    for producto in productos[inicio:]:
+        if incluido(producto):
+            pagina.append(producto)
+            if listado.limite is not None and len(pagina) > listado.limite:
+                break
+
+    hay_mas = listado.limite is not None and len(pagina) > listado.limite
+    pagina = pagina[:listado.limite]
+    return {
+        "success": True,
+        "version": listado.version,
+        "categoria": listado.categoria,
+        "total": total,
+        "limite": listado.limite,
+        "siguiente": pagina[-1]["_id"] if hay_mas else None,
+        "data": [
+            {"_id": p["_id"], **{c: p[c] for c in listado.campos if c in p}}
+            for p in pagina
+        ]
+    }
+
+def listar_productos(listado):
+    """
+    JSON (bytes) del listado de productos activos, serializado una vez por
+    versión del catálogo y parámetros
+
+    Returns:
+        (etag, cuerpo): el ETag se recalcula si el catálogo cambió desde
+        preparar_listado
+    """
+    snapshot = catalogo_cache.obtener()
+    if snapshot["version"] != listado.version:
+        listado = preparar_listado(listado.cursor, listado.limite, ",".join(listado.campos), listado.categoria)
+    estado = _estado_version(snapshot)
+
+    cuerpos = estado["cuerpos"]
+    with _lock_listados:
+        cuerpo = cuerpos.get(listado.etag)
+        if cuerpo is not None:
+            cuerpos.move_to_end(listado.etag)
+            return listado.etag, cuerpo
+
+    cuerpo = a_json(_armar_listado(estado, listado))
+    with _lock_listados:
+        cuerpos[listado.etag] = cuerpo
+        while len(cuerpos) > PRODUCTOS_LISTADOS_CACHE:
+            cuerpos.popitem(last=False)
+    return listado.etag, cuerpo
@@ -0,0 +1,235 @@
+# ============================================================================
+# RUTA: backend/services/prompt_service.py
+# DESCRIPCIÓN: Armado del prompt de Kliofer (prefijo estable + turno)
+# USO: prompt = armar_prompt(mensaje, mensajes, datos)
+#      get_gemini_response_async(prompt.turno, sistema=prompt.sistema)
+# ============================================================================
+#
+# El prompt se divide en:
+#   sistema → INFO_FRESST + catálogo + instrucciones. Solo cambia cuando cambia
+#             el catálogo; va como system_instruction / contexto cacheado de
+#             Gemini cuando la librería lo soporta (ver gemini_config).
+#   turno   → resumen de la conversación + historial + datos del cliente +
+#             mensaje nuevo.
+#
+# Presupuesto: PROMPT_TOKENS_MAX tokens de entrada en total. El historial se
+# recorta (los mensajes más antiguos primero) hasta que todo entra. El
+# resumen (resumen_service) cubre lo que ya salió del historial reciente y
+# tiene tamaño acotado, así que el turno no crece con la conversación.
+# Los tokens se ESTIMAN localmente (gemini_config.estimar_tokens)
+# para no pagar un round trip a count_tokens en cada mensaje.
+# ============================================================================
+
+import os
+import logging
+import threading
+from dataclasses import dataclass, field
+from config.gemini_config import estimar_tokens
+from services.catalogo_cache import obtener_texto_catalogo, obtener_version_catalogo
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TOKENS_MAX = int(os.getenv("PROMPT_TOKENS_MAX", "4000"))
+HISTORIAL_CARACTERES_MENSAJE = int(os.getenv("HISTORIAL_CARACTERES_MENSAJE", "300"))
+
+# ============================================================================
+# INFORMACIÓN DE FRESST (Del sitio web)
+# ============================================================================
+
+INFO_FRESST = """
+🏢 FRESST - Líderes en Equipamiento Profesional
+
+📝 SOBRE FRESST:
+Somos Fresst, líderes en equipamiento profesional para negocios gastronómicos y comerciales.
+Con años de experiencia, nos especializamos en refrigeración, cocción, mobiliario y equipos especiales.
+
+📍 UBICACIÓN: Av. Maldonado e Islas Malvinas, junto a Ecovía Nueva Aurora, Quito
+⏰ HORARIO: Martes a Domingo, 9:00 AM - 6:00 PM
+🚚 ENTREGA: 2-3 días hábiles en toda la ciudad
+✅ GARANTÍA: 1.5-2 años en todos los productos
+
+💬 ATENCIÓN: Respuesta inmediata por WhatsApp en tiempo real
+
+🎯 ¿POR QUÉ ELEGIRNOS?
+✓ Respuesta Inmediata: Atención personalizada 24/7
+✓ Calidad Garantizada: Marcas profesionales de confianza
+✓ Entrega Rápida: Instalación incluida
+"""
+
+INSTRUCCIONES_KLIOFER = """
+═══════════════════════════════════════════════════════════════════════════
+
+🤖 INSTRUCCIONES PARA KLIOFER:
+
+1. IDENTIDAD: Eres KLIOFER, asistente experto de FRESST
+2. TONO: Profesional, amable, directo, eficiente
+3. MÁXIMO: 3-4 líneas por respuesta
+4. CONTEXTO: Siempre recuerda qué preguntó antes
+5. PRODUCTO: Si pregunta por algo → Sugiere 2-3 opciones del catálogo
+6. CONSULTAS: Si pide precio, características → Dale datos exactos
+7. COMPRA: Si quiere comprar → Ofrece SOLO 2 métodos:
+   ✓ Contraentrega (entrega a domicilio, pagan al recibir)
+   ✓ Presencial (compran en local, pagan allá)
+8. CONTRAENTREGA: Si elige → Pide dirección de entrega
+9. PRESENCIAL: Si elige → Da dirección del local:
+   📍 Av. Maldonado e Islas Malvinas, Quito
+   ⏰ Martes-Domingo, 9AM-6PM
+10. CONFIRMACIÓN: Si da dirección → Genera código y confirma todo
+11. NOMBRE: Usa siempre el nombre del cliente
+12. NUNCA repitas saludos
+13. NUNCA olvides lo que preguntó
+
+═══════════════════════════════════════════════════════════════════════════
+"""
+
+# ============================================================================
+# TOKENS
+# ============================================================================
+
+@dataclass
+class PromptGemini:
+    sistema: str                                 # prefijo estable
+    turno: str                                   # contenido de este mensaje
+    tokens: dict = field(default_factory=dict)   # sección → tokens estimados
+    version: str = None                          # versión del catálogo del prefijo
+    mensajes_recortados: int = 0
+
+    @property
+    def total_tokens(self):
+        return sum(self.tokens.values())
+
+    @property
+    def texto(self):
+        """Prompt completo en un solo texto (modelos sin system_instruction)"""
+        return f"{self.sistema}\n{self.turno}"
+
+# ============================================================================
+# PREFIJO ESTABLE (uno por versión del catálogo)
+# ============================================================================
+
+_prefijo = None  # (version, texto, tokens): se reemplaza entero, nunca a medias
+_lock_prefijo = threading.Lock()
+
+def _armar_prefijo(catalogo):
+    texto = f"{INFO_FRESST}\n{catalogo}\n{INSTRUCCIONES_KLIOFER}"
+    tokens = {
+        "info": estimar_tokens(INFO_FRESST),
+        "catalogo": estimar_tokens(catalogo),
+        "instrucciones": estimar_tokens(INSTRUCCIONES_KLIOFER)
+    }
+    return texto, tokens
+
+def prefijo_sistema():
+    """(texto, tokens por sección, versión); se rearma solo si cambió el catálogo"""
+    try:
+        version = obtener_version_catalogo()
+    except Exception as e:
+        # Sin catálogo: prefijo de emergencia, sin guardarlo
+        logger.error("[PROMPT] ❌ Error catálogo: %s", e)
+        return (*_armar_prefijo("\n📦 CATÁLOGO: [Error obteniendo catálogo]"), None)
+    
+    global _prefijo
+    prefijo = _prefijo
+    if prefijo is None or prefijo[0] != version:
+        with _lock_prefijo:
+            prefijo = _prefijo
+            if prefijo is None or prefijo[0] != version:
+                prefijo = (version, *_armar_prefijo(obtener_texto_catalogo()))
+                _prefijo = prefijo
+    version, texto, tokens = prefijo
+    return texto, tokens, version
+
+# ============================================================================
+# TURNO
+# ============================================================================
+
+def _linea_historial(msg):
+    emisor = "👤 Cliente" if msg.get("emisor") == "cliente" else "🤖 Kliofer"
+    return f"{emisor}: {msg.get('texto', '')[:HISTORIAL_CARACTERES_MENSAJE]}\n"
+
+def formatear_historial(mensajes):
+    """Texto del historial para el prompt"""
+    if not mensajes:
+        return ""
+    return "\n💬 HISTORIAL DEL CHAT:\n" + "".join(_linea_historial(m) for m in mensajes)
+
+def recortar_historial(mensajes, tokens_disponibles):
+    """Los mensajes más recientes que caben en el presupuesto"""
+    cabecera = estimar_tokens("\n💬 HISTORIAL DEL CHAT:\n")
+    usados = cabecera
+    conservados = 0
+    for msg in reversed(mensajes):
+        costo = estimar_tokens(_linea_historial(msg))
+        if usados + costo > tokens_disponibles:
+            break
+        usados += costo
+        conservados += 1
+    return mensajes[len(mensajes) - conservados:] if conservados else []
+
+def formatear_resumen(resumen):
+    """Sección del resumen de la conversación (mensajes anteriores al historial)"""
+    if not resumen:
+        return ""
+    return f"\n🧾 RESUMEN DE LA CONVERSACIÓN (mensajes anteriores):\n{resumen}\n"
+
+def armar_prompt(mensaje_usuario, mensajes, datos, tokens_max=PROMPT_TOKENS_MAX, resumen=None):
+    """
+    Prompt de Kliofer dentro del presupuesto de tokens
+
+    Args:
+        mensaje_usuario: mensaje nuevo del cliente
+        mensajes: historial reciente (más antiguo primero)
+        datos: {"nombre", "email", "telefono"}
+        tokens_max: presupuesto total de entrada
+        resumen: texto del resumen de los mensajes anteriores (opcional)
+    """
+    sistema, tokens_sistema, version = prefijo_sistema()
+
+    cliente = f"""
+👤 CONTEXTO DEL CLIENTE:
+Nombre: {datos['nombre']}
+Email: {datos['email']}
+Teléfono: {datos['telefono']}
+"""
+    nuevo = f"""
+📨 NUEVO MENSAJE:
+{datos['nombre']}: {mensaje_usuario}
+
+🤖 RESPUESTA DE KLIOFER (breve, natural, experto):
+"""
+
+    seccion_resumen = formatear_resumen(resumen)
+
+    fijo = (
+        sum(tokens_sistema.values()) + estimar_tokens(seccion_resumen)
+        + estimar_tokens(cliente) + estimar_tokens(nuevo)
+    )
+    historial_usado = recortar_historial(mensajes, max(0, tokens_max - fijo))
+    historial = formatear_historial(historial_usado)
+
+    prompt = PromptGemini(
+        sistema=sistema,
+        turno=f"{seccion_resumen}{historial}{cliente}{nuevo}",
+        tokens={
+            **tokens_sistema,
+            "resumen": estimar_tokens(seccion_resumen),
+            "historial": estimar_tokens(historial),
+            "cliente": estimar_tokens(cliente),
+            "mensaje": estimar_tokens(nuevo)
+        },
+        version=version,
+        mensajes_recortados=len(mensajes) - len(historial_usado)
+    )
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "[PROMPT] 🧮 ~%s tokens (%s); prefijo estable ~%s%s",
+            prompt.total_tokens,
+            " | ".join(f"{seccion} {n}" for seccion, n in prompt.tokens.items()),
+            sum(tokens_sistema.values()),
+            f"; {prompt.mensajes_recortados} mensajes fuera de presupuesto" if prompt.mensajes_recortados else ""
+        )
+    if fijo > tokens_max:
+        logger.warning("[PROMPT] ⚠️  El prefijo + mensaje (~%s) ya supera el presupuesto (%s)", fijo, tokens_max)
+
+    return prompt
@@ -0,0 +1,193 @@
+# ============================================================================
+# RUTA: backend/services/respuesta_rapida.py
+# DESCRIPCIÓN: Respuestas directas (sin Gemini) para preguntas simples
+# USO: respuesta = responder_rapido(mensaje, datos, conversacion_nueva)
+#      None → seguir con caché / Gemini
+# ============================================================================
+#
+# Precio de un producto, horario, ubicación y tiempo de entrega tienen una
+# respuesta exacta en el catálogo y en INFO_LOCAL: se arman con plantillas en
+# microsegundos. Solo se responde si la intención es clara:
+#   - mensaje corto (RESPUESTA_RAPIDA_MAX_PALABRAS)
+#   - exactamente una intención (precio, horario, ubicacion, entrega)
+#   - precio: 1 a 3 productos reconocidos, todos con precio en el catálogo
+#   - sin señales de compra (quiero, presencial, dirección...) ni datos
+#     personales: eso sigue el flujo de venta con Gemini
+#
+# Cada respuesta registra su origen (rapida / cache / gemini) para medir qué
+# parte del tráfico no necesita al LLM (obtener_metricas_respuestas()).
+# ============================================================================
+
+import os
+import logging
+import threading
+from collections import Counter
+from services.cache_respuestas import contiene_datos_personales
+from services.catalogo_cache import obtener_precio, obtener_productos_activos
+from services.palabras_clave import MatcherPalabras
+from services.payment_service import INFO_LOCAL, DIAS_ENTREGA
+from services.sales_flow_v3 import MATCHER_VENTAS, analizar_mensaje, detectar_senales
+
+logger = logging.getLogger(__name__)
+
+RESPUESTA_RAPIDA = os.getenv("RESPUESTA_RAPIDA", "true").lower() == "true"
+RESPUESTA_RAPIDA_MAX_PALABRAS = int(os.getenv("RESPUESTA_RAPIDA_MAX_PALABRAS", "12"))
+
+MATCHER_INTENCIONES = MatcherPalabras({
+    "precio": [
+        "cuanto cuesta", "cuanto vale", "cuanto sale", "cuanto esta",
+        "precio", "costo", "valor"
+    ],
+    "horario": [
+        "horario", "a que hora", "que hora", "abren", "abierto", "cierran", "atienden"
+    ],
+    "ubicacion": [
+        "donde", "ubicacion", "ubicados", "ubicado", "como llego", "queda el local"
+    ],
+    "entrega": [
+        "entrega", "envio", "envian", "tarda", "demora", "cuantos dias", "llega"
+    ]
+})
+
+# Señales que siguen el flujo de venta (Gemini + órdenes)
+SENALES_FLUJO = {"intencion", "presencial", "direccion"}
+
+# ============================================================================
+# PLANTILLAS
+# ============================================================================
+
+def _saludo(datos, conversacion_nueva):
+    nombre = (datos.get("nombre") or "").strip()
+    # Sin nombre real, el prompt usa el teléfono: aquí mejor no nombrar
+    if not nombre or nombre == "Cliente" or nombre[0] in "+0123456789":
+        nombre = ""
+    else:
+        nombre = nombre.split()[0]
+
+    if conversacion_nueva:
+        return f"¡Hola {nombre}! Soy Kliofer de FRESST 👋\n" if nombre else "¡Hola! Soy Kliofer de FRESST 👋\n"
+    return f"Claro, {nombre} 👍\n" if nombre else "¡Claro! 👍\n"
+
+def _linea_producto(nombre):
+    producto = next((p for p in obtener_productos_activos() if p.get("nombre") == nombre), {})
+    linea = f"{nombre}: ${obtener_precio(nombre)}"
+    if producto.get("caracteristicas"):
+        linea += f" ({producto['caracteristicas']})"
+    return linea
+
+def _plantilla_precio(productos):
+    if len(productos) == 1:
+        precios = f"💰 {_linea_producto(productos[0])}\n"
+    else:
+        precios = "💰 Precios:\n" + "".join(f"• {_linea_producto(nombre)}\n" for nombre in productos)
+    return precios + "¿Te interesa? Puedes pagar contraentrega (al recibir) o comprar en nuestro local."
+
+def _plantilla_horario():
+    return (
+        f"⏰ Atendemos {INFO_LOCAL['horario']}.\n"
+        f"📍 {INFO_LOCAL['direccion']}, {INFO_LOCAL['ciudad']}.\n"
+        "¿Te ayudo con algún equipo?"
+    )
+
+def _plantilla_ubicacion():
+    return (
+        f"📍 Estamos en {INFO_LOCAL['direccion']}, {INFO_LOCAL['ciudad']}.\n"
+        f"⏰ {INFO_LOCAL['horario']}.\n"
+        "¿Qué equipo te gustaría ver?"
+    )
+
+def _plantilla_entrega():
+    return (
+        f"🚚 Entregamos a domicilio en {DIAS_ENTREGA} días hábiles en {INFO_LOCAL['ciudad']}, con instalación incluida.\n"
+        "💵 Pagas al recibir (contraentrega).\n"
+        "¿Qué equipo te interesa?"
+    )
+
+# ============================================================================
+# RESPONDEDOR
+# ============================================================================
+
+def _productos_con_precio(mensaje):
+    productos = list(dict.fromkeys(
+        c.valor for c in MATCHER_VENTAS.buscar(mensaje, ("producto",))
+    ))
+    if not 1 <= len(productos) <= 3:
+        return None
+    if any(obtener_precio(p) is None for p in productos):
+        return None
+    return productos
+
+def responder_rapido(mensaje, datos, conversacion_nueva=False):
+    """
+    Respuesta armada desde el catálogo / INFO_LOCAL, o None si no hay una
+    intención simple con confianza alta
+
+    Args:
+        datos: {"nombre", "email", "telefono"} del cliente
+        conversacion_nueva: True si el lead no tiene historial (saluda)
+    """
+    if not RESPUESTA_RAPIDA or len(mensaje.split()) > RESPUESTA_RAPIDA_MAX_PALABRAS:
+        return None
+
+    intenciones = {c.grupo for c in MATCHER_INTENCIONES.buscar(mensaje)}
+    if len(intenciones) != 1:
+        return None
+    intencion = intenciones.pop()
+
+    if detectar_senales(mensaje) & SENALES_FLUJO or contiene_datos_personales(mensaje):
+        return None
+    analisis = analizar_mensaje(mensaje)
+    if analisis["direccion"] or analisis["metodo_pago"] == "presencial":
+        return None
+    # "entrega" también es palabra de contraentrega: solo esa intención la admite
+    if analisis["metodo_pago"] and intencion != "entrega":
+        return None
+
+    try:
+        if intencion == "precio":
+            productos = _productos_con_precio(mensaje)
+            if productos is None:
+                return None
+            cuerpo = _plantilla_precio(productos)
+        elif intencion == "horario":
+            cuerpo = _plantilla_horario()
+        elif intencion == "ubicacion":
+            cuerpo = _plantilla_ubicacion()
+        else:
+            cuerpo = _plantilla_entrega()
+    except Exception as e:
+        # Sin catálogo: que responda Gemini
+        logger.warning("[RAPIDA] ⚠️  No se pudo armar la respuesta (%s): %s", intencion, e)
+        return None
+
+    with _lock:
+        _metricas["intencion_" + intencion] += 1
+    logger.debug("[RAPIDA] ⚡ Respuesta directa (%s)", intencion)
+    return _saludo(datos, conversacion_nueva) + cuerpo
+
+# ============================================================================
+# MÉTRICAS DE ORIGEN
+# ============================================================================
+
+ORIGENES = ("rapida", "cache", "gemini")
+
+_metricas = Counter()
+_lock = threading.Lock()
+
+def registrar_origen(origen):
+    """Quién respondió el mensaje: rapida, cache o gemini"""
+    with _lock:
+        _metricas["origen_" + origen] += 1
+
+def obtener_metricas_respuestas():
+    with _lock:
+        metricas = dict(_metricas)
+    por_origen = {o: metricas.get("origen_" + o, 0) for o in ORIGENES}
+    total = sum(por_origen.values())
+    return {
+        "por_origen": por_origen,
+        "por_intencion": {
+            clave[len("intencion_"):]: n for clave, n in metricas.items() if clave.startswith("intencion_")
+        },
+        "tasa_sin_llm": round((total - por_origen["gemini"]) / total, 3) if total else 0.0
+    }
@@ -0,0 +1,154 @@
+# ============================================================================
+# RUTA: backend/services/resumen_service.py
+# DESCRIPCIÓN: Resumen acumulado de conversaciones largas (por lead)
+# USO: resumidor.revisar(id_lead, total_mensajes, contexto.resumen)
+#      → compacta en segundo plano si hace falta
+# ============================================================================
+#
+# El prompt solo lleva los últimos HISTORIAL_LIMITE mensajes: en una
+# negociación larga se perdían el producto elegido, la cantidad o la
+# dirección. Los mensajes que van quedando fuera se resumen con Gemini y el
+# resumen va en el prompt junto al historial reciente: el tamaño del prompt
+# queda acotado aunque la conversación tenga cientos de mensajes.
+#
+# Cabecera (conversaciones_whatsapp):
+#   resumen: {texto, hasta, actualizado}
+#   hasta = cuántos mensajes (desde el primero) cubre el resumen
+#
+# Cuando total_mensajes - hasta llega a HISTORIAL_LIMITE (el historial
+# reciente está por dejar mensajes fuera), se resumen los mensajes
+# [hasta, total - RESUMEN_CONSERVAR) junto con el resumen anterior
+# (incremental: nunca se relee toda la conversación).
+#
+# Corre en segundo plano después de responder, una tarea por lead a la vez.
+# Se guarda con update_one condicionado a "resumen.hasta": si otro proceso
+# ya lo avanzó, esta versión se descarta. Si Gemini falla no se guarda nada
+# y se reintenta en el próximo mensaje.
+# ============================================================================
+
+import os
+import asyncio
+import logging
+from datetime import datetime
+from config.database import get_collection, get_async_collection, ejecutar_en_pool
+from config.indices import ConsultaIndexada, registrar_consultas
+from config.gemini_config import get_gemini_response_async, es_respuesta_de_respaldo
+from services.contexto_service import HISTORIAL_LIMITE
+from services.historial_service import obtener_mensajes_rango
+
+logger = logging.getLogger(__name__)
+
+RESUMEN_ACTIVO = os.getenv("RESUMEN_ACTIVO", "true").lower() == "true"
+# Mensajes recientes que se dejan sin resumir (siguen en el historial)
+RESUMEN_CONSERVAR = int(os.getenv("RESUMEN_CONSERVAR", "4"))
+RESUMEN_PALABRAS_MAX = int(os.getenv("RESUMEN_PALABRAS_MAX", "120"))
+RESUMEN_CARACTERES_MAX = int(os.getenv("RESUMEN_CARACTERES_MAX", "1200"))
+RESUMEN_CARACTERES_MENSAJE = 500
+
+# Índice: conversaciones_whatsapp.id_lead (historial_service)
+registrar_consultas(
+    "conversaciones_whatsapp",
+    ConsultaIndexada("guardar resumen si no avanzó", {"id_lead": "lead", "resumen.hasta": 10})
+)
+
+PROMPT_RESUMEN = """Eres el asistente interno de FRESST. Actualiza el resumen de una conversación de WhatsApp entre un cliente y Kliofer (vendedor) con los mensajes nuevos.
+
+Conserva SIEMPRE (si aparecen): nombre del cliente, tipo de negocio, productos que le interesan o eligió, cantidades, precios mencionados, método de pago, dirección de entrega, códigos de pedido y lo que quedó pendiente.
+Descarta saludos y charla. Máximo {palabras} palabras, en viñetas cortas. Responde solo con el resumen.
+
+RESUMEN ACTUAL:
+{resumen}
+
+MENSAJES NUEVOS:
+{mensajes}
+RESUMEN ACTUALIZADO:"""
+
+def _linea(msg):
+    emisor = "Cliente" if msg.get("emisor") == "cliente" else "Kliofer"
+    return f"{emisor}: {msg.get('texto', '')[:RESUMEN_CARACTERES_MENSAJE]}\n"
+
+def armar_prompt_resumen(resumen_anterior, mensajes):
+    return PROMPT_RESUMEN.format(
+        palabras=RESUMEN_PALABRAS_MAX,
+        resumen=resumen_anterior or "(vacío)",
+        mensajes="".join(_linea(m) for m in mensajes)
+    )
+
+def necesita_resumen(total_mensajes, hasta=0):
+    """True si el historial reciente ya no alcanza a cubrir lo no resumido"""
+    return total_mensajes - hasta >= HISTORIAL_LIMITE
+
+def obtener_resumen(id_lead):
+    """Resumen guardado del lead ({texto, hasta, actualizado}) o None"""
+    conv = get_collection("conversaciones_whatsapp").find_one({"id_lead": id_lead}, {"resumen": 1})
+    return conv.get("resumen") if conv else None
+
+# ============================================================================
+# RESUMIDOR
+# ============================================================================
+
+class ResumidorConversaciones:
+    """Tareas asyncio de compactación, como máximo una por lead"""
+
+    def __init__(self):
+        self._tareas = {}   # id_lead → Task
+
+    def revisar(self, id_lead, total_mensajes, resumen=None):
+        """Programa la compactación del lead si hace falta (no bloquea)"""
+        if not RESUMEN_ACTIVO or id_lead in self._tareas:
+            return
+        if not necesita_resumen(total_mensajes, (resumen or {}).get("hasta", 0)):
+            return
+        tarea = asyncio.create_task(self._resumir(id_lead))
+        self._tareas[id_lead] = tarea
+        tarea.add_done_callback(lambda _: self._tareas.pop(id_lead, None))
+
+    async def _resumir(self, id_lead):
+        try:
+            # Cabecera fresca: el contexto del request puede estar atrasado
+            conv = await get_async_collection("conversaciones_whatsapp").find_one(
+                {"id_lead": id_lead},
+                {"resumen": 1, "total_mensajes": 1}
+            )
+            if not conv:
+                return
+            anterior = conv.get("resumen") or {}
+            hasta = anterior.get("hasta", 0)
+            total = conv.get("total_mensajes", 0)
+            fin = total - RESUMEN_CONSERVAR
+            if not necesita_resumen(total, hasta) or fin <= hasta:
+                return
+
+            mensajes = await ejecutar_en_pool(obtener_mensajes_rango, id_lead, hasta, fin)
+            if not mensajes:
+                return
+
+            texto = await get_gemini_response_async(armar_prompt_resumen(anterior.get("texto"), mensajes))
+            if not texto or es_respuesta_de_respaldo(texto):
+                logger.warning("[RESUMEN] ⚠️  Gemini no disponible, resumen de %s pendiente", id_lead)
+                return
+            texto = texto.strip()[:RESUMEN_CARACTERES_MAX]
+
+            # Solo si nadie lo avanzó mientras tanto (sin resumen: hasta ausente)
+            resultado = await get_async_collection("conversaciones_whatsapp").update_one(
+                {"id_lead": id_lead, "resumen.hasta": hasta if hasta else None},
+                {"$set": {"resumen": {"texto": texto, "hasta": fin, "actualizado": datetime.now()}}}
+            )
+            if resultado.modified_count:
+                logger.debug("[RESUMEN] 🧾 Lead %s: resumen hasta el mensaje %s (%s nuevos, %s chars)", id_lead, fin, len(mensajes), len(texto))
+            else:
+                logger.debug("[RESUMEN] ℹ️  Lead %s: resumen ya actualizado por otro proceso", id_lead)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("[RESUMEN] ❌ Error resumiendo %s: %s", id_lead, e, exc_info=True)
+
+    async def detener(self):
+        tareas = list(self._tareas.values())
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        self._tareas.clear()
+
+resumidor = ResumidorConversaciones()
@@ -7,7 +7,6 @@
 import logging
 import re
 from datetime import datetime
-from services.producto_service import obtener_todos_productos
 from config.database import get_collection
 
 logger = logging.getLogger(__name__)
@@ -50,7 +49,7 @@ def extraer_datos_del_mensaje(mensaje: str) -> dict:
                 datos["apellido"] = partes[1].capitalize()
             elif match.lastindex >= 2:
                 datos["apellido"] = match.group(2).capitalize()
-            logger.info(f"📝 Nombre: {datos['nombre']} {datos['apellido'] or ''}")
+            logger.info("📝 Nombre: %s %s", datos['nombre'], datos['apellido'] or '')
             break
     
     # ⭐ EXTRAER EMAIL
@@ -58,7 +57,7 @@ def extraer_datos_del_mensaje(mensaje: str) -> dict:
     match_email = re.search(patron_email, mensaje)
     if match_email:
         datos["email"] = match_email.group(0)
-        logger.info(f"📧 Email: {datos['email']}")
+        logger.info("📧 Email: %s", datos['email'])
     
     # ⭐ EXTRAER DIRECCIÓN
     if any(p in mensaje_lower for p in ["dirección", "calle", "avenida", "av.", "av ", "jr."]):
@@ -73,13 +72,13 @@ def extraer_datos_del_mensaje(mensaje: str) -> dict:
                     break
         
         if datos["direccion"]:
-            logger.info(f"📍 Dirección: {datos['direccion']}")
+            logger.info("📍 Dirección: %s", datos['direccion'])
     
     # ⭐ DETECTAR CONFIRMACIÓN
     palabras = ["si por favor", "si", "quiero", "compro", "dale", "adelante"]
     if any(p in mensaje_lower for p in palabras):
         datos["confirmacion_compra"] = True
-        logger.info(f"✅ Confirmación detectada")
+        logger.info("✅ Confirmación detectada")
     
     return datos
 
@@ -6,6 +6,10 @@
 import logging
 import re
 from config.database import get_collection
+from services.catalogo_cache import obtener_precio
+from services.buscador_productos import producto_mencionado
+from services.historial_service import obtener_todos_los_mensajes
+from services.palabras_clave import MatcherPalabras, mas_especifica
 from bson import ObjectId
 
 logger = logging.getLogger(__name__)
@@ -33,22 +37,87 @@ PRODUCTOS_MAP = {
     "bombonera": "Bomboneras"
 }
 
+# ============================================================================
+# PALABRAS CLAVE (MATCHER COMPILADO)
+# ============================================================================
+
+PALABRAS_CONTRAENTREGA = [
+    "contraentrega", "contra entrega", "entrega", "domicilio",
+    "casa", "enviar", "delivery", "me lo entregas"
+]
+
+PALABRAS_PRESENCIAL = [
+    "presencial", "local", "voy", "paso", "efectivo",
+    "en el local", "ir al local", "voy allá"
+]
+
+PALABRAS_DIRECCION = [
+    "avenida", "av.", "calle", "dirección", "número",
+    "quito", "barrio", "zona", "sector"
+]
+
+# Un solo matcher para todas las tablas: una pasada por mensaje
+MATCHER_VENTAS = MatcherPalabras({
+    "producto": PRODUCTOS_MAP,
+    "contraentrega": PALABRAS_CONTRAENTREGA,
+    "presencial": PALABRAS_PRESENCIAL,
+    "direccion": PALABRAS_DIRECCION
+})
+
+def analizar_mensaje(mensaje):
+    """
+    Producto, método de pago y dirección en una sola pasada sobre el mensaje
+    
+    Si ninguna palabra clave nombra un producto, se busca el nombre exacto
+    de un producto del catálogo (productos nuevos sin palabra clave). Sin
+    coincidencia aproximada: de aquí salen órdenes
+    """
+    coincidencias = MATCHER_VENTAS.buscar(mensaje)
+    return {
+        "producto": _producto(coincidencias) or _producto_catalogo(mensaje),
+        "metodo_pago": _metodo_pago(coincidencias),
+        "direccion": _direccion(mensaje, coincidencias)
+    }
+
+def _producto(coincidencias):
+    # La palabra más específica gana ("vitrina" antes que "frio")
+    mejor = mas_especifica([c for c in coincidencias if c.grupo == "producto"])
+    return mejor.valor if mejor else None
+
+def _producto_catalogo(mensaje):
+    producto = producto_mencionado(mensaje)
+    if producto:
+        logger.info("[SALES_V3] 🔎 Producto por nombre del catálogo (sin palabra clave): %s", producto)
+    return producto
+
+def _metodo_pago(coincidencias):
+    grupos = {c.grupo for c in coincidencias}
+    if "contraentrega" in grupos:
+        return "contraentrega"
+    if "presencial" in grupos:
+        return "presencial"
+    return None
+
+def _direccion(mensaje, coincidencias):
+    if any(c.grupo == "direccion" for c in coincidencias):
+        return mensaje.strip()
+    return None
+
 # ============================================================================
 # FUNCIÓN 1: DETECTAR PRODUCTO
 # ============================================================================
 
 def detectar_producto(mensaje):
     """Detecta si menciona un producto"""
-    logger.info(f"[SALES_V3] 🔍 Detectando producto...")
+    logger.debug("[SALES_V3] 🔍 Detectando producto...")
     
-    mensaje_lower = mensaje.lower()
+    producto = _producto(MATCHER_VENTAS.buscar(mensaje, ("producto",))) or _producto_catalogo(mensaje)
     
-    for palabra, producto in PRODUCTOS_MAP.items():
-        if palabra in mensaje_lower:
-            logger.info(f"[SALES_V3] ✅ Producto: {producto}")
-            return producto
+    if producto:
+        logger.debug("[SALES_V3] ✅ Producto: %s", producto)
+        return producto
     
-    logger.info("[SALES_V3] ❌ No detectado")
+    logger.debug("[SALES_V3] ❌ No detectado")
     return None
 
 # ============================================================================
@@ -57,16 +126,16 @@ def detectar_producto(mensaje):
 
 def detectar_cantidad(mensaje):
     """Detecta cantidad mencionada"""
-    logger.info("[SALES_V3] 🔍 Detectando cantidad...")
+    logger.debug("[SALES_V3] 🔍 Detectando cantidad...")
     
     numeros = re.findall(r'\d+', mensaje)
     
     if numeros:
         cantidad = int(numeros[0])
-        logger.info(f"[SALES_V3] ✅ Cantidad: {cantidad}")
+        logger.debug("[SALES_V3] ✅ Cantidad: %s", cantidad)
         return cantidad
     
-    logger.info("[SALES_V3] ℹ️  Default: 1")
+    logger.debug("[SALES_V3] ℹ️  Default: 1")
     return 1
 
 # ============================================================================
@@ -75,27 +144,15 @@ def detectar_cantidad(mensaje):
 
 def detectar_metodo_pago(mensaje):
     """Detecta contraentrega o presencial"""
-    logger.info("[SALES_V3] 🔍 Detectando método pago...")
-    
-    msg_lower = mensaje.lower()
+    logger.debug("[SALES_V3] 🔍 Detectando método pago...")
     
-    # CONTRAENTREGA
-    if any(p in msg_lower for p in [
-        "contraentrega", "contra entrega", "entrega", "domicilio",
-        "casa", "enviar", "delivery", "me lo entregas"
-    ]):
-        logger.info("[SALES_V3] ✅ Método: CONTRAENTREGA")
-        return "contraentrega"
+    metodo = _metodo_pago(MATCHER_VENTAS.buscar(mensaje, ("contraentrega", "presencial")))
     
-    # PRESENCIAL
-    if any(p in msg_lower for p in [
-        "presencial", "local", "voy", "paso", "efectivo",
-        "en el local", "ir al local", "voy allá"
-    ]):
-        logger.info("[SALES_V3] ✅ Método: PRESENCIAL")
-        return "presencial"
+    if metodo:
+        logger.debug("[SALES_V3] ✅ Método: %s", metodo.upper())
+        return metodo
     
-    logger.info("[SALES_V3] ❌ No detectado")
+    logger.debug("[SALES_V3] ❌ No detectado")
     return None
 
 # ============================================================================
@@ -104,65 +161,118 @@ def detectar_metodo_pago(mensaje):
 
 def detectar_direccion(mensaje):
     """Detecta si menciona dirección"""
-    logger.info("[SALES_V3] 🔍 Detectando dirección...")
+    logger.debug("[SALES_V3] 🔍 Detectando dirección...")
     
-    msg_lower = mensaje.lower()
+    direccion = _direccion(mensaje, MATCHER_VENTAS.buscar(mensaje, ("direccion",)))
     
-    # Si menciona palabras de dirección
-    if any(p in msg_lower for p in [
-        "avenida", "av.", "calle", "dirección", "número",
-        "quito", "barrio", "zona", "sector"
-    ]):
-        logger.info(f"[SALES_V3] ✅ Dirección: {mensaje[:60]}...")
-        return mensaje.strip()
+    if direccion:
+        logger.debug("[SALES_V3] ✅ Dirección: %s...", mensaje[:60])
+        return direccion
     
-    logger.info("[SALES_V3] ❌ No detectada")
+    logger.debug("[SALES_V3] ❌ No detectada")
     return None
 
 # ============================================================================
-# FUNCIÓN 5: OBTENER ETAPA DE VENTA
+# FUNCIÓN 5: ETAPA DE VENTA (MÁQUINA DE ESTADOS INCREMENTAL)
 # ============================================================================
+#
+# La etapa depende solo de qué señales aparecieron ALGUNA VEZ en el historial
+# (mensajes del cliente y de Kliofer). En vez de re-escanear todo el historial
+# en cada mensaje, se guarda el conjunto de señales en la cabecera de la
+# conversación (estado_venta) y cada mensaje nuevo lo avanza en O(1).
 
-def obtener_etapa(id_lead):
+SENALES_ETAPA = {
+    "contraentrega": ["contraentrega"],
+    "presencial": ["presencial"],
+    "direccion": ["av."],
+    "intencion": ["quiero", "compro", "dame", "necesito", "interesa"]
+}
+
+ESTADO_VENTA_INICIAL = {"etapa": "consulta", "senales": []}
+
+def detectar_senales(texto):
+    """Señales de etapa presentes en un texto"""
+    texto_lower = texto.lower()
+    return {
+        senal for senal, palabras in SENALES_ETAPA.items()
+        if any(p in texto_lower for p in palabras)
+    }
+
+def etapa_desde_senales(senales):
     """
-    Detecta en qué etapa del flujo está:
+    Etapa del flujo según las señales acumuladas:
     - consulta: preguntando, sin intención clara
-    - producto_seleccionado: eligió qué comprar
     - esperando_pago: debe elegir método
     - esperando_direccion: debe dar dirección (contraentrega)
     - venta_completada: pedido confirmado
     """
+    if "contraentrega" in senales and "direccion" in senales:
+        return "venta_completada"
+    if "contraentrega" in senales or "presencial" in senales:
+        return "esperando_direccion"
+    if "intencion" in senales:
+        return "esperando_pago"
+    return "consulta"
+
+def avanzar_etapa(estado_venta, texto):
+    """
+    Transición O(1): estado actual + un mensaje nuevo → estado nuevo
+
+    Args:
+        estado_venta: {"etapa", "senales"} (None = conversación nueva)
+        texto: mensaje nuevo (cliente o Kliofer)
+    """
+    senales = set((estado_venta or ESTADO_VENTA_INICIAL)["senales"])
+    senales |= detectar_senales(texto)
+    return {"etapa": etapa_desde_senales(senales), "senales": sorted(senales)}
+
+def reconstruir_estado_venta(mensajes):
+    """Aplica avanzar_etapa sobre todo un historial (arranque y replay)"""
+    estado = ESTADO_VENTA_INICIAL
+    for m in mensajes:
+        estado = avanzar_etapa(estado, m.get("texto", ""))
+    return estado
+
+def cargar_estado_venta(id_lead):
+    """Estado de una conversación anterior a la máquina de estados (lee todo una vez)"""
+    return reconstruir_estado_venta(obtener_todos_los_mensajes(id_lead))
+
+def detectar_etapa_historial(mensajes):
+    """Detector original: escanea el historial completo (usado para verificar)"""
+    if not mensajes:
+        return "consulta"
+    
+    historial_texto = " ".join([m.get("texto", "").lower() for m in mensajes])
+    
+    if "contraentrega" in historial_texto and "av." in historial_texto:
+        return "venta_completada"
+    elif "contraentrega" in historial_texto or "presencial" in historial_texto:
+        return "esperando_direccion"
+    elif any(p in historial_texto for p in ["quiero", "compro", "dame", "necesito", "interesa"]):
+        return "esperando_pago"
+    return "consulta"
+
+def obtener_etapa(id_lead):
+    """Etapa persistida en la cabecera de la conversación"""
     try:
-        logger.info("[SALES_V3] 📊 Detectando etapa...")
-        
-        conv_col = get_collection("conversaciones_whatsapp")
-        resultado = conv_col.find_one({"id_lead": id_lead})
+        logger.debug("[SALES_V3] 📊 Detectando etapa...")
         
-        if not resultado or "mensajes" not in resultado:
-            logger.info("[SALES_V3] → Etapa: CONSULTA (sin historial)")
-            return "consulta"
+        conv = get_collection("conversaciones_whatsapp").find_one(
+            {"id_lead": id_lead},
+            {"estado_venta": 1}
+        )
         
-        mensajes = resultado["mensajes"]
-        historial_texto = " ".join([m.get("texto", "").lower() for m in mensajes])
+        if conv and conv.get("estado_venta"):
+            etapa = conv["estado_venta"]["etapa"]
+        else:
+            # Conversación sin estado (anterior a la máquina de estados)
+            etapa = detectar_etapa_historial(obtener_todos_los_mensajes(id_lead))
         
-        # Lógica de etapas
-        if "contraentrega" in historial_texto and "av." in historial_texto:
-            logger.info("[SALES_V3] → Etapa: VENTA COMPLETADA")
-            return "venta_completada"
-        
-        elif "contraentrega" in historial_texto or "presencial" in historial_texto:
-            logger.info("[SALES_V3] → Etapa: ESPERANDO DIRECCIÓN")
-            return "esperando_direccion"
-        
-        elif any(p in historial_texto for p in ["quiero", "compro", "dame", "necesito", "interesa"]):
-            logger.info("[SALES_V3] → Etapa: ESPERANDO PAGO")
-            return "esperando_pago"
-        
-        logger.info("[SALES_V3] → Etapa: CONSULTA")
-        return "consulta"
+        logger.debug("[SALES_V3] → Etapa: %s", etapa.upper())
+        return etapa
     
     except Exception as e:
-        logger.error(f"[SALES_V3] ❌ Error: {e}")
+        logger.error("[SALES_V3] ❌ Error: %s", e)
         return "consulta"
 
 # ============================================================================
@@ -170,23 +280,19 @@ def obtener_etapa(id_lead):
 # ============================================================================
 
 def obtener_precio_producto(nombre_producto):
-    """Busca el precio del producto en BD"""
+    """Busca el precio del producto en la caché del catálogo"""
     try:
-        logger.info(f"[SALES_V3] 💰 Buscando precio de {nombre_producto}...")
-        
-        prod_col = get_collection("productos")
-        producto = prod_col.find_one({"nombre": nombre_producto})
+        precio = obtener_precio(nombre_producto)
         
-        if producto:
-            precio = producto.get("precio")
-            logger.info(f"[SALES_V3] ✅ Precio: ${precio}")
+        if precio:
+            logger.debug("[SALES_V3] ✅ Precio de %s: $%s", nombre_producto, precio)
             return precio
         
-        logger.warning(f"[SALES_V3] ⚠️  Producto no encontrado")
+        logger.warning("[SALES_V3] ⚠️  Producto no encontrado: %s", nombre_producto)
         return None
     
     except Exception as e:
-        logger.error(f"[SALES_V3] ❌ Error: {e}")
+        logger.error("[SALES_V3] ❌ Error: %s", e)
         return None
 
 # ============================================================================
@@ -196,10 +302,9 @@ def obtener_precio_producto(nombre_producto):
 def resumir_venta(id_lead):
     """Resumen de la venta en progreso"""
     try:
-        logger.info("[SALES_V3] 📋 Resumiendo contexto de venta...")
+        logger.debug("[SALES_V3] 📋 Resumiendo contexto de venta...")
         
-        conv_col = get_collection("conversaciones_whatsapp")
-        resultado = conv_col.find_one({"id_lead": id_lead})
+        mensajes = obtener_todos_los_mensajes(id_lead)
         
         resumen = {
             "producto": None,
@@ -211,8 +316,7 @@ def resumir_venta(id_lead):
             "etapa": obtener_etapa(id_lead)
         }
         
-        if resultado and "mensajes" in resultado:
-            mensajes = resultado["mensajes"]
+        if mensajes:
             historial_texto = " ".join([m.get("texto", "") for m in mensajes])
             
             # Detectar datos
@@ -235,9 +339,9 @@ def resumir_venta(id_lead):
             if direccion:
                 resumen["direccion"] = direccion
         
-        logger.info(f"[SALES_V3] ✅ Resumen: {resumen['etapa']}")
+        logger.debug("[SALES_V3] ✅ Resumen: %s", resumen["etapa"])
         return resumen
     
     except Exception as e:
-        logger.error(f"[SALES_V3] ❌ Error: {e}")
+        logger.error("[SALES_V3] ❌ Error: %s", e)
         return None
\ No newline at end of file
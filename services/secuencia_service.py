@@ -0,0 +1,132 @@
+# ============================================================================
+# RUTA: backend/services/secuencia_service.py
+# DESCRIPCIÓN: Secuencias atómicas (colección contadores) para códigos de orden
+# USO: siguiente_codigo_entrega() → "FRES-2026-000123"
+# ============================================================================
+#
+# Colección:
+#   contadores → {_id: "ordenes-2026", valor: N}
+#
+# Cada año tiene su propio contador, así la numeración vuelve a 1 en enero.
+# Cada proceso reserva BLOQUES de números con un solo find_one_and_update($inc)
+# y los reparte en memoria: un round trip cada SECUENCIA_BLOQUE órdenes.
+# Si el proceso se reinicia, los números no usados del bloque se pierden
+# (quedan huecos, nunca duplicados).
+# El índice único sobre ordenes.codigo_entrega es la garantía final.
+# ============================================================================
+
+import os
+import re
+import logging
+import threading
+from datetime import datetime
+from pymongo import ReturnDocument
+from config.database import get_collection
+from config.indices import Indice, ConsultaIndexada, registrar_indices, registrar_consultas, aplicar_indices
+
+logger = logging.getLogger(__name__)
+
+SECUENCIA_BLOQUE = int(os.getenv("SECUENCIA_BLOQUE", "10"))
+PREFIJO_CODIGO = "FRES"
+
+class Secuencia:
+    """
+    Secuencia anual con reserva de bloques por proceso
+
+    Args:
+        nombre: prefijo del contador ("ordenes" → _id "ordenes-2026")
+        bloque: números reservados por round trip
+        inicializar: función (year) → último número ya usado, para arrancar el
+                     contador de un año sin pisar datos anteriores (opcional)
+    """
+
+    def __init__(self, nombre, bloque=SECUENCIA_BLOQUE, inicializar=None):
+        self.nombre = nombre
+        self.bloque = max(1, bloque)
+        self.inicializar = inicializar
+        self._lock = threading.Lock()
+        self._year = None
+        self._siguiente = 1
+        self._limite = 0
+
+    def _id_contador(self, year):
+        return f"{self.nombre}-{year}"
+
+    def _asegurar_contador(self, year):
+        """El contador del año nunca queda por debajo del último número usado"""
+        if not self.inicializar:
+            return
+        ultimo = self.inicializar(year)
+        if ultimo:
+            # $max es idempotente: varios procesos pueden hacerlo a la vez
+            get_collection("contadores").update_one(
+                {"_id": self._id_contador(year)},
+                {"$max": {"valor": ultimo}},
+                upsert=True
+            )
+
+    def _reservar_bloque(self, year):
+        contador = get_collection("contadores").find_one_and_update(
+            {"_id": self._id_contador(year)},
+            {"$inc": {"valor": self.bloque}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._limite = contador["valor"]
+        self._siguiente = self._limite - self.bloque + 1
+        logger.info("[SECUENCIA] 🔢 %s: bloque %s-%s", self._id_contador(year), self._siguiente, self._limite)
+
+    def siguiente(self):
+        """Devuelve (year, numero) únicos entre todos los procesos"""
+        with self._lock:
+            year = datetime.now().year
+            if year != self._year:
+                self._asegurar_contador(year)
+                self._year = year
+                self._limite = 0
+            if self._siguiente > self._limite:
+                self._reservar_bloque(year)
+            numero = self._siguiente
+            self._siguiente += 1
+            return year, numero
+
+# ============================================================================
+# CÓDIGOS DE ENTREGA
+# ============================================================================
+
+def _filtro_codigos_del_year(year):
+    return {"codigo_entrega": {"$regex": f"^{re.escape(PREFIJO_CODIGO)}-{year}-\\d+$"}}
+
+def _ultimo_codigo_usado(year):
+    """Mayor número FRES-{year}-NNNNNN ya presente en órdenes (usa el índice único)"""
+    orden = get_collection("ordenes").find_one(
+        _filtro_codigos_del_year(year),
+        {"codigo_entrega": 1},
+        sort=[("codigo_entrega", -1)]
+    )
+    if not orden:
+        return 0
+    return int(orden["codigo_entrega"].rsplit("-", 1)[1])
+
+secuencia_ordenes = Secuencia("ordenes", inicializar=_ultimo_codigo_usado)
+
+def formatear_codigo(year, numero):
+    return f"{PREFIJO_CODIGO}-{year}-{numero:06d}"
+
+def siguiente_codigo_entrega():
+    """Código único de entrega: FRES-2026-000001"""
+    return formatear_codigo(*secuencia_ordenes.siguiente())
+
+INDICES = registrar_indices("ordenes", Indice("codigo_entrega", unique=True, sparse=True))
+registrar_consultas(
+    "ordenes",
+    ConsultaIndexada(
+        "último código del año",
+        _filtro_codigos_del_year(datetime.now().year),
+        orden=[("codigo_entrega", -1)]
+    )
+)
+
+def asegurar_indices():
+    """Índice único sobre codigo_entrega (falla si ya hay duplicados)"""
+    aplicar_indices(INDICES, estricto=True)
@@ -0,0 +1,52 @@
+# ============================================================================
+# RUTA: backend/services/telefono_service.py
+# DESCRIPCIÓN: Normalización de teléfonos a una clave canónica E.164
+# USO: Única fuente de verdad para guardar y buscar leads por teléfono
+# ============================================================================
+
+import re
+
+CODIGO_PAIS = "593"  # Ecuador
+
+def normalizar_telefono(telefono: str) -> str:
+    """
+    Convierte cualquier formato de entrada a E.164 (+593XXXXXXXXX)
+
+    Ejemplos:
+        "whatsapp:+593983200438" → "+593983200438"
+        "0983200438"             → "+593983200438"
+        "593 98 320 0438"        → "+593983200438"
+        "983200438"              → "+593983200438"
+        "+1 (415) 523-8886"      → "+14155238886"
+
+    Returns:
+        Teléfono canónico, o "" si no hay dígitos
+    """
+    if not telefono:
+        return ""
+
+    telefono = telefono.strip().replace("whatsapp:", "")
+    internacional = telefono.startswith("+") or telefono.startswith("00")
+    digitos = re.sub(r"\D", "", telefono)
+
+    if not digitos:
+        return ""
+
+    if internacional:
+        if telefono.startswith("00"):
+            digitos = digitos[2:]
+        return "+" + digitos if digitos else ""
+
+    # Formato nacional: 0 + 9 dígitos (0983200438)
+    if digitos.startswith("0"):
+        return "+" + CODIGO_PAIS + digitos[1:]
+
+    # Código de país sin + (593983200438)
+    if digitos.startswith(CODIGO_PAIS) and len(digitos) >= 11:
+        return "+" + digitos
+
+    # Celular sin prefijo (983200438)
+    if len(digitos) == 9:
+        return "+" + CODIGO_PAIS + digitos
+
+    return "+" + digitos
@@ -0,0 +1,132 @@
+# ============================================================================
+# RUTA: backend/services/unidad_trabajo.py
+# DESCRIPCIÓN: Unidad de trabajo por request (escrituras agrupadas)
+# USO: Acumular mensajes, cambios de lead y órdenes de un webhook y
+#      escribirlos juntos al final con confirmar()
+# ============================================================================
+#
+# Round trips al confirmar:
+#   historial → 1 find_one_and_update (cabecera) + 1 bulk_write (buckets)
+#   pedido    → 1 insert_many (órdenes) + 1 bulk_write (leads)
+#
+# Con MONGO_TRANSACCIONES=true el pedido (órdenes + pago_info de los leads)
+# se escribe en una transacción: o se guardan ambos o ninguno. Requiere un
+# replica set (Atlas lo es). El historial queda fuera: solo agrega mensajes.
+#
+# Si confirmar() falla, el mensaje se vuelve a atender (reintento de Twilio o
+# de la cola). Con clave (MessageSid) ese reintento no duplica nada de lo
+# que ya quedó escrito: el historial omite el turno ya guardado y cada
+# orden lleva clave_mensaje (índice único), así que una orden ya insertada
+# no se vuelve a insertar.
+# ============================================================================
+
+import os
+import logging
+from bson import ObjectId
+from pymongo import UpdateOne
+from config.database import get_collection, get_client
+from config.indices import Indice, registrar_indices
+from services.historial_service import agregar_mensajes
+
+logger = logging.getLogger(__name__)
+
+MONGO_TRANSACCIONES = os.getenv("MONGO_TRANSACCIONES", "false").lower() == "true"
+
+registrar_indices("ordenes", Indice("clave_mensaje", unique=True, sparse=True))
+
+class UnidadDeTrabajo:
+    """Escrituras pendientes de un request; nada toca la BD hasta confirmar()"""
+
+    def __init__(self, transaccion=MONGO_TRANSACCIONES, clave=None):
+        self.transaccion = transaccion
+        self.clave = clave        # MessageSid: hace el reintento idempotente
+        self.conversaciones = {}  # id_lead → {"mensajes": [...], **cabecera}
+        self.leads = {}           # id_lead → {campo: valor} para $set
+        self.ordenes = []
+
+    # ========================================================================
+    # REGISTRO
+    # ========================================================================
+
+    def agregar_mensajes(self, id_lead, mensajes, numero_cliente=None, nombre_cliente=None, estado_venta=None):
+        conversacion = self.conversaciones.setdefault(id_lead, {"mensajes": []})
+        conversacion["mensajes"].extend(mensajes)
+        if numero_cliente is not None:
+            conversacion["numero_cliente"] = numero_cliente
+        if nombre_cliente is not None:
+            conversacion["nombre_cliente"] = nombre_cliente
+        if estado_venta is not None:
+            conversacion["estado_venta"] = estado_venta
+
+    def actualizar_lead(self, id_lead, campos):
+        self.leads.setdefault(id_lead, {}).update(campos)
+
+    def insertar_orden(self, orden):
+        if self.clave:
+            orden["clave_mensaje"] = f"{self.clave}:{len(self.ordenes)}"
+        self.ordenes.append(orden)
+
+    @property
+    def vacia(self):
+        return not (self.conversaciones or self.leads or self.ordenes)
+
+    # ========================================================================
+    # CONFIRMAR
+    # ========================================================================
+
+    def _ordenes_pendientes(self, session=None):
+        """Órdenes que un intento anterior del mismo mensaje no llegó a insertar"""
+        if not self.clave or not self.ordenes:
+            return self.ordenes
+        claves = [orden["clave_mensaje"] for orden in self.ordenes]
+        escritas = {
+            orden["clave_mensaje"]
+            for orden in get_collection("ordenes").find(
+                {"clave_mensaje": {"$in": claves}}, {"clave_mensaje": 1}, session=session
+            )
+        }
+        if escritas:
+            logger.info("[UOW] ♻️  %s: %s órdenes ya insertadas, no se repiten", self.clave, len(escritas))
+        return [orden for orden in self.ordenes if orden["clave_mensaje"] not in escritas]
+
+    def _escribir_pedido(self, session=None):
+        ordenes = self._ordenes_pendientes(session)
+        if ordenes:
+            get_collection("ordenes").insert_many(ordenes, ordered=True, session=session)
+        if self.leads:
+            get_collection("leads").bulk_write([
+                UpdateOne({"_id": ObjectId(id_lead)}, {"$set": campos})
+                for id_lead, campos in self.leads.items()
+            ], ordered=False, session=session)
+
+    def confirmar(self):
+        """
+        Escribe todo lo acumulado
+
+        Returns:
+            {"success", "total_mensajes": {id_lead: N}, "ordenes": N}
+        """
+        totales = {}
+        try:
+            for id_lead, conversacion in self.conversaciones.items():
+                conversacion = dict(conversacion)
+                totales[id_lead] = agregar_mensajes(id_lead, conversacion.pop("mensajes"), clave=self.clave, **conversacion)
+
+            if self.ordenes or self.leads:
+                if self.transaccion:
+                    with get_client().start_session() as session:
+                        session.with_transaction(self._escribir_pedido)
+                else:
+                    self._escribir_pedido()
+
+            logger.debug(
+                "[UOW] ✅ Confirmado: %s mensajes, %s leads, %s órdenes%s",
+                sum(len(c["mensajes"]) for c in self.conversaciones.values()),
+                len(self.leads), len(self.ordenes),
+                " (transacción)" if self.transaccion and (self.ordenes or self.leads) else ""
+            )
+            return {"success": True, "total_mensajes": totales, "ordenes": len(self.ordenes)}
+
+        except Exception as e:
+            logger.error("[UOW] ❌ Error confirmando: %s", e, exc_info=True)
+            return {"success": False, "error": str(e), "total_mensajes": totales}
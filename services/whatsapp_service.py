@@ -19,7 +19,7 @@ try:
     twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
     logger.info("✅ Cliente Twilio inicializado")
 except Exception as e:
-    logger.error(f"❌ Error inicializando Twilio: {e}")
+    logger.error("❌ Error inicializando Twilio: %s", e)
     twilio_client = None
 
 def send_whatsapp_message(numero_cliente: str, mensaje: str) -> dict:
@@ -49,7 +49,7 @@ def send_whatsapp_message(numero_cliente: str, mensaje: str) -> dict:
             to=to_whatsapp
         )
         
-        logger.info(f"✅ Mensaje enviado a {numero_cliente}. SID: {msg.sid}")
+        logger.debug("✅ Mensaje enviado a %s. SID: %s", numero_cliente, msg.sid)
         
         return {
             "success": True,
@@ -60,7 +60,7 @@ def send_whatsapp_message(numero_cliente: str, mensaje: str) -> dict:
         }
     
     except Exception as e:
-        logger.error(f"❌ Error enviando mensaje: {e}")
+        logger.error("❌ Error enviando mensaje: %s", e)
         return {
             "success": False,
             "error": str(e),
@@ -87,5 +87,5 @@ def verificar_webhook_signature(request_data: dict, signature: str) -> bool:
             signature=signature
         )
     except Exception as e:
-        logger.warning(f"⚠️ No se pudo validar firma: {e}")
+        logger.warning("⚠️ No se pudo validar firma: %s", e)
         return True  # En desarrollo, permitir todo
\ No newline at end of file